@@ -0,0 +1,157 @@
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PATH = re.compile(r'^/v1/(?P<site_id>[^/]+)/(?P<path>[^/?]+)')
+
+class FakeJirafeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self._read_body()
+        if self.path.startswith('/oauth2/access_token'):
+            return self._token()
+        self._send(404, {})
+
+    def do_GET(self):
+        if self.path.startswith('/accounts/profile'):
+            if not self._authorized():
+                return self._send(403, {})
+            return self._send(200, self.server.profile)
+        self._api()
+
+    def do_PUT(self):
+        self._api()
+
+    def log_message(self, *args):
+        pass
+
+    def _api(self):
+        body = self._read_body()
+        match = API_PATH.match(self.path)
+        if match is None:
+            return self._send(404, {})
+        self.server.count('requests')
+        self.server.wait()
+        if not self._authorized():
+            return self._send(403, {})
+
+        status = self.server.inject()
+        if status == 400:
+            return self._send(400, {'errors': {'id': 'This field is required.'}})
+        if status >= 500:
+            return self._send(status, {'error': 'injected'})
+
+        if match.group('path') == 'batch' and body:
+            items = json.loads(body)
+            return self._send(200, dict((path, [{'success': True} for _ in entries])
+                                        for path, entries in items.items()))
+        self._send(200, {'success': True})
+
+    def _token(self):
+        self.server.count('tokens')
+        self.server.wait(self.server.token_latency)
+        token = self.server.issue_token()
+        self._send(200, {
+            'access_token': token,
+            'refresh_token': uuid.uuid4().hex,
+            'expires_in': self.server.expires_in,
+        })
+
+    def _authorized(self):
+        header = self.headers.get('Authorization', '')
+        return header.startswith('Bearer ') and self.server.is_valid(header[7:])
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return body
+
+    def _send(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeJirafeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, token_latency=0.0,
+                 error_rates=None, expires_in=3600, sites=10):
+        ThreadingHTTPServer.__init__(self, (host, port), FakeJirafeHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.error_rates = error_rates or {}
+        self.expires_in = expires_in
+        self.profile = {'sites': [{'id': str(i), 'name': 'Site %d' % i} for i in range(sites)]}
+        self.tokens = set()
+        self.counts = {'requests': 0, 'tokens': 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d/' % self.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def wait(self, latency=None):
+        latency = self.latency if latency is None else latency
+        if latency:
+            time.sleep(latency)
+
+    def inject(self):
+        roll = random.random()
+        for status, rate in sorted(self.error_rates.items()):
+            if status == 403:
+                continue
+            if roll < rate:
+                return status
+            roll -= rate
+        return 200
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self.tokens.add(token)
+        return token
+
+    def is_valid(self, token):
+        if 403 in self.error_rates and random.random() < self.error_rates[403]:
+            return False
+        return token in self.tokens
+
+    def revoke_tokens(self):
+        with self._lock:
+            self.tokens.clear()
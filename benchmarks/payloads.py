@@ -0,0 +1,60 @@
+import random
+
+def make_product(i, attributes=20):
+    return {
+        'id': str(i),
+        'create_date': '2013-06-17T22:08:30.000Z',
+        'change_date': '2013-06-17T22:08:30.000Z',
+        'is_order_item': True,
+        'is_product': True,
+        'is_sku': False,
+        'name': 'Product %d' % i,
+        'code': 'SKU-%08d' % i,
+        'catalog': {'id': 'main', 'name': 'Main Catalog'},
+        'categories': [{'id': str(c), 'name': 'Category %d' % c} for c in range(i % 5 + 1)],
+        'url': 'http://example.com/products/%d' % i,
+        'images': [{'url': 'http://example.com/images/%d-%d.jpg' % (i, n)} for n in range(3)],
+        'attributes': [{'id': 'attr%d' % n, 'name': 'Attribute %d' % n, 'value': 'value %d' % (i * n)}
+                       for n in range(attributes)],
+    }
+
+
+def make_order(i, items=25):
+    order_items = []
+    for n in range(items):
+        price = round(random.uniform(1, 200), 2)
+        order_items.append({
+            'id': '%d-%d' % (i, n),
+            'create_date': '2013-06-17T22:08:30.000Z',
+            'change_date': '2013-06-17T22:08:30.000Z',
+            'order_item_number': str(n),
+            'quantity': n % 3 + 1,
+            'price': price,
+            'discount_price': 0,
+            'product': make_product(n, attributes=5),
+        })
+    return {
+        'id': str(i),
+        'order_number': 'ORD-%08d' % i,
+        'cart_id': 'cart-%d' % i,
+        'status': 'placed',
+        'order_date': '2013-06-17T22:08:30.000Z',
+        'create_date': '2013-06-17T22:08:30.000Z',
+        'change_date': '2013-06-17T22:08:30.000Z',
+        'subtotal': sum(item['price'] * item['quantity'] for item in order_items),
+        'total': sum(item['price'] * item['quantity'] for item in order_items) + 10,
+        'total_tax': 0,
+        'total_shipping': 10,
+        'total_payment_cost': 0,
+        'total_discounts': 0,
+        'currency': 'USD',
+        'customer': {
+            'id': 'customer-%d' % i,
+            'create_date': '2013-06-17T22:08:30.000Z',
+            'change_date': '2013-06-17T22:08:30.000Z',
+            'email': 'customer%d@example.com' % i,
+            'first_name': 'First',
+            'last_name': 'Last',
+        },
+        'items': order_items,
+    }
@@ -0,0 +1,69 @@
+import argparse
+import json
+import sys
+import timeit
+
+from jirafe import JirafeClient, Transport, UsernameSession
+
+from .payloads import make_product
+
+class Response(object):
+    status_code = 200
+    headers = {}
+    text = ''
+
+
+class NullTransport(Transport):
+    # Answers every call at once, so only the client's own per-call work is timed.
+    response = Response()
+
+    def get(self, url, **kwargs):
+        return self.response
+
+    def put(self, url, **kwargs):
+        return self.response
+
+    def post(self, url, **kwargs):
+        return self.response
+
+
+def measure(func, number, repeat):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e9
+
+
+def run(number, repeat):
+    transport = NullTransport()
+    client = JirafeClient(transport=transport)
+    session = UsernameSession('1', 'user', 'pass', 'client', 'secret', transport=transport)
+    session.access_token = 'token'
+    endpoint = client.prepare(session, 'product')
+
+    payloads = {
+        'small': {'id': '1', 'name': 'Product 1'},
+        'encoded': client.dumps(make_product(1)),
+    }
+    results = []
+    for name, data in sorted(payloads.items()):
+        change = measure(lambda: client.product_change(session, data), number, repeat)
+        prepared = measure(lambda: endpoint.send(data), number, repeat)
+        results.append({
+            'payload': name,
+            'product_change_ns': round(change),
+            'prepared_ns': round(prepared),
+            'saved_ns': round(change - prepared),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-call client overhead of product_change and a prepared endpoint')
+    parser.add_argument('--number', type=int, default=20000, help='calls per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs; the fastest is reported')
+    args = parser.parse_args(argv)
+    json.dump(run(args.number, args.repeat), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from jirafe import (AsyncJirafeClient, ConnectionPool, JirafeClient, JirafeProducer,
+                    UsernameSession)
+from jirafe.client import dumps
+
+from .fake_server import FakeJirafeServer
+from .payloads import make_order, make_product
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(name, operations, seconds, latencies, **extra):
+    result = {
+        'name': name,
+        'operations': operations,
+        'seconds': seconds,
+        'throughput': operations / seconds if seconds else None,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+    }
+    result.update(extra)
+    return result
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def make_session(server, requests=None):
+    kwargs = {
+        'token_url': server.url + 'oauth2/access_token',
+        'profile_url': server.url + 'accounts/profile',
+    }
+    if requests is not None:
+        kwargs['requests'] = requests
+    return UsernameSession('1', 'user', 'pass', 'client', 'secret', **kwargs)
+
+
+def bench_sync(server, count, pooled):
+    pool = ConnectionPool() if pooled else None
+    client = JirafeClient(server.url, requests=pool) if pooled else JirafeClient(server.url)
+    session = make_session(server, pool)
+    products = [make_product(i) for i in range(count)]
+    session.update_token()
+
+    started = time.perf_counter()
+    latencies = [timed(client.product_change, session, product) for product in products]
+    seconds = time.perf_counter() - started
+    client.close()
+    return summarize('sync_pooled' if pooled else 'sync', count, seconds, latencies)
+
+
+def bench_threads(server, count, threads):
+    pool = ConnectionPool(pool_maxsize=threads)
+    client = JirafeClient(server.url, requests=pool)
+    session = make_session(server, pool)
+    orders = [make_order(i) for i in range(count)]
+    session.update_token()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        latencies = list(executor.map(lambda order: timed(client.order_change, session, order), orders))
+    seconds = time.perf_counter() - started
+    client.close()
+    return summarize('sync_threads', count, seconds, latencies, threads=threads)
+
+
+def bench_batch(server, count, batch_size):
+    pool = ConnectionPool()
+    client = JirafeClient(server.url, requests=pool, batch_size=batch_size)
+    session = make_session(server, pool)
+    products = [make_product(i) for i in range(count)]
+    session.update_token()
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(0, count, batch_size):
+        latencies.append(timed(client.product_changes, session, products[i:i + batch_size]))
+    seconds = time.perf_counter() - started
+    client.close()
+    return summarize('batch', count, seconds, latencies, batch_size=batch_size)
+
+
+def bench_async(server, count, limit):
+    session = make_session(server)
+    orders = [make_order(i) for i in range(count)]
+    session.update_token()
+
+    async def run():
+        async with AsyncJirafeClient(server.url, limit_per_site=limit) as client:
+            async def send(order):
+                started = time.perf_counter()
+                await client.order_change(session, order)
+                return time.perf_counter() - started
+
+            started = time.perf_counter()
+            latencies = await asyncio.gather(*[send(order) for order in orders])
+            return time.perf_counter() - started, latencies
+
+    seconds, latencies = asyncio.run(run())
+    return summarize('async', count, seconds, latencies, limit_per_site=limit)
+
+
+def bench_producer(server, count):
+    pool = ConnectionPool()
+    client = JirafeClient(server.url, requests=pool)
+    session = make_session(server, pool)
+    orders = [make_order(i) for i in range(count)]
+    session.update_token()
+    latencies = []
+
+    started = time.perf_counter()
+    with JirafeProducer(client, linger=0.05, workers=4) as producer:
+        for order in orders:
+            latencies.append(timed(producer.order_change, session, order))
+    seconds = time.perf_counter() - started
+    client.close()
+    return summarize('producer', count, seconds, latencies)
+
+
+def bench_token_storm(server, threads):
+    pool = ConnectionPool(pool_maxsize=threads)
+    client = JirafeClient(server.url, requests=pool)
+    session = make_session(server, pool)
+    session.update_token()
+    server.revoke_tokens()
+    before = server.counts['tokens']
+    barrier = threading.Barrier(threads)
+
+    def send(i):
+        barrier.wait()
+        return timed(client.cart_change, session, {'id': str(i)})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        latencies = list(executor.map(send, range(threads)))
+    seconds = time.perf_counter() - started
+    client.close()
+    return summarize('token_storm', threads, seconds, latencies,
+                     token_requests=server.counts['tokens'] - before)
+
+
+def bench_serialization(count):
+    results = []
+    order = make_order(0, items=50)
+    encoders = [('json', dumps)]
+    try:
+        import orjson
+        encoders.append(('orjson', orjson.dumps))
+    except ImportError:
+        pass
+
+    for name, encode in encoders:
+        latencies = [timed(encode, order) for _ in range(count)]
+        results.append(summarize('serialize_%s' % name, count, sum(latencies), latencies,
+                                 payload_bytes=len(encode(order))))
+    return results
+
+
+def run(args):
+    error_rates = {}
+    for spec in args.inject:
+        status, rate = spec.split('=')
+        error_rates[int(status)] = float(rate)
+
+    results = []
+    with FakeJirafeServer(latency=args.latency, error_rates=error_rates) as server:
+        results.append(bench_sync(server, args.count, pooled=False))
+        results.append(bench_sync(server, args.count, pooled=True))
+        results.append(bench_threads(server, args.count, args.threads))
+        results.append(bench_batch(server, args.count * 10, args.batch_size))
+        results.append(bench_async(server, args.count, args.threads))
+        results.append(bench_producer(server, args.count))
+        results.append(bench_token_storm(server, args.threads))
+    results.extend(bench_serialization(args.count))
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'count': args.count,
+            'threads': args.threads,
+            'batch_size': args.batch_size,
+            'latency': args.latency,
+            'inject': error_rates,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    previous = dict((r['name'], r) for r in baseline['results'])
+    regressions = []
+    for result in report['results']:
+        old = previous.get(result['name'])
+        if old is None:
+            continue
+        if old['throughput'] and result['throughput'] < old['throughput'] * (1 - tolerance):
+            regressions.append('%s throughput %.1f -> %.1f' % (result['name'], old['throughput'], result['throughput']))
+        if old['p99_ms'] and result['p99_ms'] > old['p99_ms'] * (1 + tolerance):
+            regressions.append('%s p99 %.2fms -> %.2fms' % (result['name'], old['p99_ms'], result['p99_ms']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Jirafe client against a local API stand-in')
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each API response')
+    parser.add_argument('--inject', action='append', default=[], metavar='STATUS=RATE',
+                        help='fraction of API requests answered with STATUS, e.g. 503=0.01 or 403=0.05')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            sys.stderr.write('REGRESSION %s\n' % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
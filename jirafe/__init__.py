@@ -2,3 +2,20 @@ from .client import JirafeClient
 from .session import JirafeSession
 from .session import UsernameSession
 from .session import Oauth2Session
+from .pool import ConnectionPool
+from .aio import AsyncJirafeClient
+from .producer import JirafeProducer, BufferFull
+from .store import TokenStore, MemoryTokenStore, SQLiteTokenStore
+from .cache import ProfileCache
+from .dedup import ChangeIndex, MemoryChangeIndex, SQLiteChangeIndex
+from .coalesce import Coalescer
+from .retry import RetryPolicy, RetryBudget, CircuitBreaker
+from .limits import TokenBucket, RateLimiter, AdaptiveConcurrency
+from .metrics import MetricsRegistry
+from .outbox import Outbox, OutboxError, OutboxSender
+from .sites import SessionPool, FairDispatcher
+from .priority import Priorities, LaneQueue, AsyncPrioritySemaphore
+from .validation import Validator, Validators
+from .transport import Transport, RequestsTransport, HTTP2Transport
+from .prepared import PreparedEndpoint
+from .tracing import Tracer, Span, SpanContext
@@ -0,0 +1,289 @@
+import asyncio
+import contextvars
+import json
+import time
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .client import FailedResponse, JirafeClient
+from .priority import AsyncPrioritySemaphore
+from .timeouts import LocalTimeout, call_deadline, deadline_scope
+
+TIMEOUT_ERRORS = (asyncio.TimeoutError, requests.exceptions.Timeout)
+if aiohttp is not None:
+    CONNECTION_ERRORS = (aiohttp.ClientError,)
+else:
+    CONNECTION_ERRORS = ()
+
+class AsyncResponse(object):
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncJirafeClient(JirafeClient):
+    def __init__(self,
+                 api_url='https://api.jirafe.com/', http_session=None, version='v1',
+                 limit_per_site=10, priorities=None, **kwargs):
+        # AdaptiveConcurrency blocks its thread while waiting for a slot, which
+        # would stall the event loop; limit_per_site bounds concurrency here.
+        if kwargs.get('concurrency') is not None:
+            raise TypeError('AsyncJirafeClient does not support concurrency=; use limit_per_site')
+        super(AsyncJirafeClient, self).__init__(api_url, None, version, **kwargs)
+        self.http_session = http_session
+        self.limit_per_site = limit_per_site
+        self.priorities = priorities
+        self.semaphores = {}
+
+    async def close(self):
+        if self.http_session is not None:
+            await self.http_session.close()
+            self.http_session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _put(self, session, path, data={}, retry=0):
+        if self.validators is not None:
+            errors = self.validators.validate(path, data)
+            if errors:
+                return self._invalid(path, errors)
+        if self.coalescer is not None:
+            key = self.coalescer.get_key(session.site_id, path, data)
+            if key is not None:
+                # The deadline starts here, so the coalescing window counts too.
+                with deadline_scope(self.deadline):
+                    return await self.coalescer.submit_async(key, data, lambda data: self._put_change(session, path, data, retry))
+        return await self._put_change(session, path, data, retry)
+
+    async def _put_change(self, session, path, data={}, retry=0):
+        if self.change_index is None:
+            return await self._make_request(self.PUT, session, path, data, retry)
+        results, pending, changed = self._filter_changes(session, path, [data])
+        sent = [await self._make_request(self.PUT, session, path, item, retry) for item in changed]
+        return self._record_changes(results, pending, sent)[0]
+
+    async def _get(self, session, path, data={}, retry=0):
+        return await self._make_request(self.GET, session, path, data, retry)
+
+    async def _put_batch(self, session, path, items):
+        # One deadline covers every chunk of the call, not each chunk alone.
+        with deadline_scope(self.deadline):
+            if self.validators is None:
+                return await self._put_valid_batch(session, path, items)
+            results, valid = self._validate(path, items)
+            return self._merge_results(results, await self._put_valid_batch(session, path, valid))
+
+    async def _put_valid_batch(self, session, path, items):
+        if self.change_index is None:
+            return await self._send_chunks(session, path, items)
+        results, pending, changed = self._filter_changes(session, path, items)
+        return self._record_changes(results, pending, await self._send_chunks(session, path, changed))
+
+    async def _send_chunks(self, session, path, items):
+        chunks = list(self._chunk(path, items))
+        results = await asyncio.gather(*[self._send_batch(session, path, chunk) for chunk in chunks])
+        return [result for chunk_results in results for result in chunk_results]
+
+    async def _send_batch(self, session, path, chunk):
+        data = self._batch_data(path, chunk)
+        response = await self._request(self.PUT, session, self.BATCH_PATH, data)
+        return self._batch_results(path, chunk, response)
+
+    async def _make_request(self, method, session, path, data={}, retry=0):
+        if method not in (self.GET, self.PUT):
+            return self._invalid_method(method)
+        return self._result(await self._request(method, session, path, data, retry))
+
+    async def _request(self, method, session, path, data={}, retry=0):
+        if self.tracer is not None:
+            return await self._traced_request(method, session, path, data, retry)
+        return await self._timed_request(method, session, path, data, retry)
+
+    async def _traced_request(self, method, session, path, data={}, retry=0):
+        with self.tracer.start_span('jirafe.request', site_id=session.site_id, path=path,
+                                    method=method, retries=0) as span:
+            response = await self._timed_request(method, session, path, data, retry)
+            status, error_type = self._status(response)
+            span.set_attribute('status', status)
+            span.set_attribute('error_type', error_type)
+            return response
+
+    async def _timed_request(self, method, session, path, data={}, retry=0):
+        if self.metrics is None:
+            return await self._do_request(method, session, path, data, retry)
+
+        started = time.time()
+        response = None
+        try:
+            response = await self._do_request(method, session, path, data, retry)
+        finally:
+            self._record(path, response, time.time() - started)
+        return response
+
+    async def _do_request(self, method, session, path, data={}, retry=0):
+        url = self._get_url(session, path)
+        if self.tracer is None:
+            data, extra_headers = self._prepare(method, data)
+        else:
+            data, extra_headers = self._traced_prepare(method, data)
+        if self.metrics is not None:
+            self.metrics.observe('jirafe.request.size', len(data), endpoint=path)
+
+        if self.deadline is None:
+            return await self._attempt(method, session, path, url, data, extra_headers, retry)
+        deadline = call_deadline.get()
+        remaining = self.deadline if deadline is None else deadline - time.time()
+        if remaining <= 0:
+            return FailedResponse('timeout', 'deadline exceeded')
+        try:
+            return await asyncio.wait_for(self._attempt(method, session, path, url, data, extra_headers, retry), remaining)
+        except asyncio.TimeoutError:
+            return FailedResponse('timeout', 'deadline exceeded')
+
+    async def _attempt(self, method, session, path, url, data, extra_headers, retry):
+        policy = self.retry_policy
+        breaker = self.circuit_breaker
+        if policy is not None:
+            policy.record_request()
+
+        attempt = 0
+        # Set while an authorization retry continues a call the breaker already
+        # let through: asking again would refuse a half-open probe its own retry.
+        admitted = False
+        while True:
+            if breaker is not None and not admitted and not breaker.allow(session.site_id):
+                return FailedResponse('circuit_open', 'circuit open for site %s' % session.site_id)
+            admitted = False
+
+            try:
+                if self.rate_limiter is not None:
+                    delay = self.rate_limiter.reserve(session.site_id, path)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                async with self._get_slot(session.site_id, path):
+                    response, token = await self._send(method, session, url, data, extra_headers)
+            except LocalTimeout as e:
+                if breaker is not None:
+                    breaker.record_abort(session.site_id)
+                return FailedResponse('timeout', str(e))
+            except TIMEOUT_ERRORS + CONNECTION_ERRORS as e:
+                if breaker is not None:
+                    breaker.record_failure(session.site_id)
+                error_type = 'timeout' if isinstance(e, TIMEOUT_ERRORS) else 'connection'
+                if policy is None:
+                    if error_type == 'timeout':
+                        return FailedResponse(error_type, str(e))
+                    raise
+                if not policy.should_retry(attempt):
+                    return FailedResponse(error_type, str(e))
+                self._record_retry(path, error_type)
+                await asyncio.sleep(policy.get_delay(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Includes cancellation by the deadline's wait_for.
+                if breaker is not None:
+                    breaker.record_abort(session.site_id)
+                raise
+
+            status = response.status_code
+            if status == 403 and retry < 1:
+                session.invalidate(token)
+                self._record_retry(path, 'authorization')
+                retry += 1
+                admitted = breaker is not None
+                continue
+            if breaker is not None:
+                if status >= 500:
+                    breaker.record_failure(session.site_id)
+                else:
+                    breaker.record_success(session.site_id)
+            if policy is not None and policy.should_retry(attempt, status):
+                self._record_retry(path, status)
+                await asyncio.sleep(policy.get_delay(attempt, response.headers.get('Retry-After')))
+                attempt += 1
+                continue
+            return response
+
+    async def _send(self, method, session, url, data, extra_headers):
+        if self.tracer is not None:
+            return await self._traced_send(method, session, url, data, extra_headers)
+        headers, token = await self._get_header(session)
+        if extra_headers:
+            headers = dict(headers, **extra_headers)
+        return await self._transmit(method, url, data, headers), token
+
+    async def _traced_send(self, method, session, url, data, extra_headers):
+        span = self.tracer.current()
+        with span.timing('token'):
+            headers, token = await self._get_header(session)
+        if extra_headers:
+            headers = dict(headers, **extra_headers)
+        with span.timing('network'):
+            return await self._transmit(method, url, data, self.tracer.inject(headers, span)), token
+
+    async def _transmit(self, method, url, data, headers):
+        if method == self.GET:
+            options = {
+                "params": data,
+                "headers": headers
+            }
+        else:
+            options = {
+                "data": data,
+                "headers": headers
+            }
+        request = getattr(self._get_http_session(), method)
+        async with request(url, **options) as r:
+            return AsyncResponse(r.status, await r.text(), r.headers)
+
+    async def _get_header(self, session):
+        # Tokens are only fetched in the executor, and the header is built from
+        # the token it returned: get_header() could block the loop on a token
+        # POST if the fetch failed or another task invalidated the token.
+        token = session.access_token
+        if token is None or not session.has_valid_token():
+            loop = asyncio.get_running_loop()
+            # Copy the context so a token fetch span nests under the request span.
+            token = await loop.run_in_executor(None, contextvars.copy_context().run, session.update_token)
+        else:
+            session.maybe_refresh_ahead()
+        return session.format_header(token), token
+
+    def _client_timeout(self):
+        connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+        return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+    def _get_semaphore(self, site_id):
+        if site_id not in self.semaphores:
+            if self.priorities is None:
+                self.semaphores[site_id] = asyncio.Semaphore(self.limit_per_site)
+            else:
+                self.semaphores[site_id] = AsyncPrioritySemaphore(self.limit_per_site, self.priorities)
+        return self.semaphores[site_id]
+
+    def _get_slot(self, site_id, path):
+        semaphore = self._get_semaphore(site_id)
+        if self.priorities is None:
+            return semaphore
+        return semaphore.slot(path)
+
+    def _get_http_session(self):
+        if self.http_session is None:
+            if aiohttp is None:
+                raise ImportError('aiohttp is required for AsyncJirafeClient')
+            self.http_session = aiohttp.ClientSession(timeout=self._client_timeout())
+        return self.http_session
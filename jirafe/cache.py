@@ -0,0 +1,52 @@
+import threading
+import time
+
+class ProfileCache(object):
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry['fetched_at'] >= self.ttl:
+            self.invalidate(key)
+            return None
+        return entry['profile']
+
+    def set(self, key, profile):
+        with self._lock:
+            self.entries[key] = {
+                'profile': profile,
+                'fetched_at': time.time(),
+                'sites': None,
+            }
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def get_site_index(self, key, profile):
+        entry = self.entries.get(key)
+        if entry is None or entry['profile'] is not profile:
+            return self._build_site_index(profile)
+        if entry['sites'] is None:
+            entry['sites'] = self._build_site_index(profile)
+        return entry['sites']
+
+    def _build_site_index(self, profile):
+        return dict((str(s['id']), s) for s in profile.get('sites', []))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._lock = threading.Lock()
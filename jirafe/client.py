@@ -1,15 +1,64 @@
+import gzip
 import json
 import requests
+import threading
+import time
+
+from .prepared import PreparedEndpoint
+from .timeouts import DEFAULT_TIMEOUT, LocalTimeout, call_deadline, deadline_scope, remaining_timeout
+from .transport import RequestsTransport
+
+_encoder = json.JSONEncoder(separators=(',',':'))
+
+def dumps(data):
+    return _encoder.encode(data)
+
+class FailedResponse(object):
+    status_code = None
+    def __init__(self, error_type, message):
+        self.error_type = error_type
+        self.message = message
+        self.text = message
 
 class JirafeClient(object):
     url_mask = '{url}{version}/{site_id}/{path}'
     GET = 'get'
     PUT = 'put'
+    BATCH_PATH = 'batch'
     def __init__(self,
-                 api_url='https://api.jirafe.com/', requests=requests, version='v1'):
+                 api_url='https://api.jirafe.com/', requests=requests, version='v1',
+                 batch_size=100, batch_max_bytes=1024 * 1024, dumps=dumps,
+                 compress_threshold=None, compress_level=6, change_index=None,
+                 coalescer=None, retry_policy=None, circuit_breaker=None,
+                 rate_limiter=None, concurrency=None, metrics=None, validators=None,
+                 timeout=DEFAULT_TIMEOUT, deadline=None, transport=None, tracer=None):
         self.api_url = api_url if api_url.endswith('/') else api_url + '/'
         self.requests = requests
+        self.transport = transport if transport is not None else RequestsTransport(requests)
         self.version = version
+        self.batch_size = batch_size
+        self.batch_max_bytes = batch_max_bytes
+        self.dumps = dumps
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.compression_stats = {
+            'compressed': 0,
+            'uncompressed': 0,
+            'raw_bytes': 0,
+            'compressed_bytes': 0,
+        }
+        self._stats_lock = threading.Lock()
+        self.change_index = change_index
+        self.coalescer = coalescer
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.metrics = metrics
+        self.validators = validators
+        self.timeout = timeout
+        self.deadline = deadline
+        self.tracer = tracer
 
     def category_change(self, session, data):
         return self._put(session, 'category', data)
@@ -29,10 +78,45 @@ class JirafeClient(object):
     def employee_change(self, session, data):
         return self._put(session, 'employee', data)
 
+    def category_changes(self, session, items):
+        return self._put_batch(session, 'category', items)
+
+    def cart_changes(self, session, items):
+        return self._put_batch(session, 'cart', items)
+
+    def order_changes(self, session, items):
+        return self._put_batch(session, 'order', items)
+
+    def product_changes(self, session, items):
+        return self._put_batch(session, 'product', items)
+
+    def customer_changes(self, session, items):
+        return self._put_batch(session, 'customer', items)
+
+    def employee_changes(self, session, items):
+        return self._put_batch(session, 'employee', items)
+
     def site_check(self, session):
         return self._get(session, 'site_check')
 
+    def prepare(self, session, path):
+        return PreparedEndpoint(self, session, path)
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def _get_url(self, session, path):
+        if isinstance(session, PreparedEndpoint):
+            return session.get_url(path)
+        return self._format_url(session, path)
+
+    def _format_url(self, session, path):
         url_data = {
             'url': self.api_url,
             'version': self.version,
@@ -42,35 +126,396 @@ class JirafeClient(object):
         return self.url_mask.format(**url_data)
 
     def _put(self, session, path, data={}, retry=0):
-        return self._make_request(self.PUT, session, path, data, retry)
+        if self.validators is not None:
+            errors = self.validators.validate(path, data)
+            if errors:
+                return self._invalid(path, errors)
+        if self.coalescer is not None:
+            key = self.coalescer.get_key(session.site_id, path, data)
+            if key is not None:
+                # The deadline starts here, so the coalescing window counts too.
+                with deadline_scope(self.deadline):
+                    return self.coalescer.submit(key, data, lambda data: self._put_change(session, path, data, retry))
+        return self._put_change(session, path, data, retry)
+
+    def _put_change(self, session, path, data={}, retry=0):
+        if self.change_index is None:
+            return self._make_request(self.PUT, session, path, data, retry)
+        results, pending, changed = self._filter_changes(session, path, [data])
+        sent = [self._make_request(self.PUT, session, path, item, retry) for item in changed]
+        return self._record_changes(results, pending, sent)[0]
 
     def _get(self, session, path, data={}, retry=0):
         return self._make_request(self.GET, session, path, data, retry)
 
+    def _put_batch(self, session, path, items):
+        # One deadline covers every chunk of the call, not each chunk alone.
+        with deadline_scope(self.deadline):
+            if self.validators is None:
+                return self._put_valid_batch(session, path, items)
+            results, valid = self._validate(path, items)
+            return self._merge_results(results, self._put_valid_batch(session, path, valid))
+
+    def _put_valid_batch(self, session, path, items):
+        if self.change_index is None:
+            return self._send_chunks(session, path, items)
+        results, pending, changed = self._filter_changes(session, path, items)
+        return self._record_changes(results, pending, self._send_chunks(session, path, changed))
+
+    def _validate(self, path, items):
+        results = []
+        valid = []
+        for item in items:
+            errors = self.validators.validate(path, item)
+            if errors:
+                results.append(self._invalid(path, errors))
+            else:
+                results.append(None)
+                valid.append(item)
+        return results, valid
+
+    def _merge_results(self, results, sent):
+        sent = iter(sent)
+        return [next(sent) if result is None else result for result in results]
+
+    def _invalid(self, path, errors):
+        if self.metrics is not None:
+            self.metrics.increment('jirafe.validation.rejected', endpoint=path)
+        return {
+            'success': False,
+            'error_type': 'validation',
+            'errors': errors
+        }
+
+    def _filter_changes(self, session, path, items):
+        results = []
+        pending = []
+        changed = []
+        for item in items:
+            key, digest = self.change_index.check(session.site_id, path, item)
+            if key is not None and digest is None:
+                results.append({
+                    'success': True,
+                    'skipped': True
+                })
+            else:
+                pending.append((len(results), key, digest))
+                results.append(None)
+                changed.append(item)
+        return results, pending, changed
+
+    def _record_changes(self, results, pending, sent):
+        for (i, key, digest), result in zip(pending, sent):
+            results[i] = result
+            if digest is not None and result['success']:
+                self.change_index.set(key, digest)
+        return results
+
+    def _send_chunks(self, session, path, items):
+        results = []
+        for chunk in self._chunk(path, items):
+            results.extend(self._send_batch(session, path, chunk))
+        return results
+
+    def _chunk(self, path, items):
+        # Sizes are UTF-8 bytes of the final body: the {"<path>":[...]}
+        # envelope plus the items and the commas between them.
+        envelope = self._byte_size(path) + 7
+        chunk = []
+        size = envelope
+        for item in items:
+            item = self._encode(item)
+            item_size = self._byte_size(item)
+            if chunk and (len(chunk) >= self.batch_size or
+                          size + 1 + item_size > self.batch_max_bytes):
+                yield chunk
+                chunk = []
+                size = envelope
+            if chunk:
+                size += 1
+            chunk.append(item)
+            size += item_size
+        if chunk:
+            yield chunk
+
+    def _byte_size(self, data):
+        if isinstance(data, bytes) or data.isascii():
+            return len(data)
+        return len(data.encode('utf-8'))
+
+    def _send_batch(self, session, path, chunk):
+        data = self._batch_data(path, chunk)
+        response = self._request(self.PUT, session, self.BATCH_PATH, data)
+        return self._batch_results(path, chunk, response)
+
+    def _batch_data(self, path, chunk):
+        if any(isinstance(item, bytes) for item in chunk):
+            chunk = [item if isinstance(item, bytes) else item.encode('utf-8') for item in chunk]
+            return b'{"' + path.encode('utf-8') + b'":[' + b','.join(chunk) + b']}'
+        return '{"%s":[%s]}' % (path, ','.join(chunk))
+
+    def _batch_results(self, path, chunk, response):
+        if response.status_code != 200:
+            result = self._result(response)
+            return [result for _ in chunk]
+
+        entries = response.json().get(path, [])
+        results = []
+        for i in range(len(chunk)):
+            if i >= len(entries):
+                results.append({
+                    'success': False,
+                    'error_type': 'unknown',
+                    'raw': response.text
+                })
+            elif entries[i].get('success'):
+                results.append({
+                    'success': True
+                })
+            else:
+                results.append({
+                    'success': False,
+                    'error_type': 'validation',
+                    'errors': entries[i].get('errors', {})
+                })
+        return results
+
     def _make_request(self, method, session, path, data={}, retry=0):
-        if type(data) is not str:
-            data = json.dumps(data, separators=(',',':'))
+        if method not in (self.GET, self.PUT):
+            return self._invalid_method(method)
+        return self._result(self._request(method, session, path, data, retry))
 
-        if method == self.GET:
-            options = {
-                "params": data,
-                "headers": session.get_header()
-            }
-            response = self.requests.get(self._get_url(session, path), **options)
-        elif method == self.PUT:
-            options = {
-                "data": data,
-                "headers": session.get_header()
-            }
-            response = self.requests.put(self._get_url(session, path), **options)
+    def _invalid_method(self, method):
+        return {
+            'success': False,
+            'error_type': 'invalid_method',
+            'message': '%s is not a supported method' % method
+        }
+
+    def _request(self, method, session, path, data={}, retry=0):
+        if self.tracer is not None:
+            return self._traced_request(method, session, path, data, retry)
+        return self._timed_request(method, session, path, data, retry)
+
+    def _traced_request(self, method, session, path, data={}, retry=0):
+        with self.tracer.start_span('jirafe.request', site_id=session.site_id, path=path,
+                                    method=method, retries=0) as span:
+            response = self._timed_request(method, session, path, data, retry)
+            status, error_type = self._status(response)
+            span.set_attribute('status', status)
+            span.set_attribute('error_type', error_type)
+            return response
+
+    def _timed_request(self, method, session, path, data={}, retry=0):
+        if self.metrics is None:
+            return self._do_request(method, session, path, data, retry)
+
+        started = time.time()
+        response = None
+        try:
+            response = self._do_request(method, session, path, data, retry)
+        finally:
+            self._record(path, response, time.time() - started)
+        return response
+
+    def _record(self, path, response, latency):
+        status, error_type = self._status(response)
+        self.metrics.increment('jirafe.requests', endpoint=path, status=status, error_type=error_type)
+        self.metrics.observe('jirafe.request.latency', latency, endpoint=path, status=status)
+
+    def _status(self, response):
+        if response is None:
+            status, error_type = None, 'exception'
+        elif isinstance(response, FailedResponse):
+            status, error_type = None, response.error_type
         else:
+            status = response.status_code
+            error_type = {200: None, 400: 'validation', 403: 'authorization'}.get(status, 'unknown')
+        return status, error_type
+
+    def _do_request(self, method, session, path, data={}, retry=0):
+        url = self._get_url(session, path)
+        if self.tracer is None:
+            data, extra_headers = self._prepare(method, data)
+        else:
+            data, extra_headers = self._traced_prepare(method, data)
+        if self.metrics is not None:
+            self.metrics.observe('jirafe.request.size', len(data), endpoint=path)
+
+        if self.deadline is None:
+            return self._attempt(method, session, path, url, data, extra_headers, retry, None)
+        # The session sees the deadline too, so a token fetch made for this
+        # call is cut short along with the request itself.
+        deadline = call_deadline.get()
+        if deadline is None:
+            deadline = time.time() + self.deadline
+        session.set_deadline(deadline)
+        try:
+            return self._attempt(method, session, path, url, data, extra_headers, retry, deadline)
+        finally:
+            session.set_deadline(None)
+
+    def _attempt(self, method, session, path, url, data, extra_headers, retry, deadline):
+        policy = self.retry_policy
+        breaker = self.circuit_breaker
+        concurrency = self.concurrency
+        if policy is not None:
+            policy.record_request()
+
+        attempt = 0
+        # Set while an authorization retry continues a call the breaker already
+        # let through: asking again would refuse a half-open probe its own retry.
+        admitted = False
+        while True:
+            if breaker is not None and not admitted and not breaker.allow(session.site_id):
+                return FailedResponse('circuit_open', 'circuit open for site %s' % session.site_id)
+            admitted = False
+            # Waits are bounded by the deadline, and the request timeout is
+            # taken after them so it only gets what is left.
+            if self.rate_limiter is not None and not self.rate_limiter.acquire(session.site_id, path, deadline):
+                return self._expired(session, 'deadline exceeded waiting for rate limiter')
+            if concurrency is not None:
+                if not concurrency.acquire(session.site_id, deadline):
+                    return self._expired(session, 'deadline exceeded waiting for concurrency slot')
+                started = time.time()
+
+            response = error = None
+            try:
+                timeout = remaining_timeout(self.timeout, deadline)
+                response = self._send(method, session, url, data, extra_headers, timeout)
+            except requests.exceptions.RequestException as e:
+                error = e
+            except BaseException:
+                if breaker is not None:
+                    breaker.record_abort(session.site_id)
+                raise
+            finally:
+                # Released before any backoff, so the slot is not held while
+                # sleeping and the latency is the request's own.
+                if concurrency is not None:
+                    if isinstance(error, LocalTimeout):
+                        concurrency.cancel(session.site_id)
+                    else:
+                        healthy = response is not None and response.status_code < 500 and response.status_code != 429
+                        concurrency.release(session.site_id, time.time() - started, healthy)
+
+            if isinstance(error, LocalTimeout):
+                # Ran out locally, before sending or while waiting for a token
+                # or the token store lock: nothing was learned about the API.
+                return self._expired(session, str(error))
+            if error is not None:
+                if breaker is not None:
+                    breaker.record_failure(session.site_id)
+                error_type = 'timeout' if isinstance(error, requests.exceptions.Timeout) else 'connection'
+                if policy is None:
+                    if error_type == 'timeout':
+                        return FailedResponse(error_type, str(error))
+                    raise error
+                if not policy.should_retry(attempt) or not self._backoff(policy.get_delay(attempt), deadline):
+                    return FailedResponse(error_type, str(error))
+                self._record_retry(path, error_type)
+                attempt += 1
+                continue
+
+            status = response.status_code
+            if status == 403 and retry < 1:
+                session.invalidate()
+                self._record_retry(path, 'authorization')
+                retry += 1
+                admitted = breaker is not None
+                continue
+            if breaker is not None:
+                if status >= 500:
+                    breaker.record_failure(session.site_id)
+                else:
+                    breaker.record_success(session.site_id)
+            if policy is not None and policy.should_retry(attempt, status):
+                if not self._backoff(policy.get_delay(attempt, response.headers.get('Retry-After')), deadline):
+                    return response
+                self._record_retry(path, status)
+                attempt += 1
+                continue
+            return response
+
+    def _expired(self, session, message):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_abort(session.site_id)
+        return FailedResponse('timeout', message)
+
+    def _backoff(self, delay, deadline):
+        if deadline is not None and time.time() + delay >= deadline:
+            return False
+        time.sleep(delay)
+        return True
+
+    def _record_retry(self, path, reason):
+        if self.metrics is not None:
+            self.metrics.increment('jirafe.request.retries', endpoint=path, reason=reason)
+        if self.tracer is not None:
+            self.tracer.current().increment('retries')
+
+    def _send(self, method, session, url, data, extra_headers, timeout=None):
+        if self.tracer is not None:
+            return self._traced_send(method, session, url, data, extra_headers, timeout)
+        headers = session.get_header()
+        if extra_headers:
+            headers = dict(headers, **extra_headers)
+        return self._transmit(method, url, data, headers, timeout)
+
+    def _traced_send(self, method, session, url, data, extra_headers, timeout=None):
+        # Runs inside the span opened by _traced_request, so a token fetch
+        # made here is recorded as its child.
+        span = self.tracer.current()
+        with span.timing('token'):
+            headers = session.get_header()
+        if extra_headers:
+            headers = dict(headers, **extra_headers)
+        with span.timing('network'):
+            return self._transmit(method, url, data, self.tracer.inject(headers, span), timeout)
+
+    def _transmit(self, method, url, data, headers, timeout=None):
+        if method == self.GET:
+            return self.transport.get(url, params=data, headers=headers, timeout=timeout)
+        return self.transport.put(url, data=data, headers=headers, timeout=timeout)
+
+    def _prepare(self, method, data):
+        data = self._encode(data)
+        if method != self.PUT or self.compress_threshold is None:
+            return data, None
+
+        if len(data) < self.compress_threshold:
+            with self._stats_lock:
+                self.compression_stats['uncompressed'] += 1
+            return data, None
+
+        raw = data if isinstance(data, bytes) else data.encode('utf-8')
+        compressed = gzip.compress(raw, self.compress_level)
+        with self._stats_lock:
+            self.compression_stats['compressed'] += 1
+            self.compression_stats['raw_bytes'] += len(raw)
+            self.compression_stats['compressed_bytes'] += len(compressed)
+        return compressed, {'Content-Encoding': 'gzip'}
+
+    def _traced_prepare(self, method, data):
+        span = self.tracer.current()
+        with span.timing('serialization'):
+            data, extra_headers = self._prepare(method, data)
+        span.set_attribute('payload_size', len(data))
+        return data, extra_headers
+
+    def _encode(self, data):
+        if isinstance(data, (str, bytes)):
+            return data
+        return self.dumps(data)
+
+    def _result(self, response):
+        if isinstance(response, FailedResponse):
             return {
                 'success': False,
-                'error_type': 'invalid_method',
-                'message': '%s is not a supported method' % method
+                'error_type': response.error_type,
+                'message': response.message
             }
-
-        if response.status_code == 200:
+        elif response.status_code == 200:
             return {
                 'success': True
             }
@@ -82,14 +527,10 @@ class JirafeClient(object):
                 'errors': data['errors'] if 'errors' in data else {}
             }
         elif response.status_code == 403:
-            if retry < 1:
-                session.invalidate()
-                return self._make_request(method, session, path, data, 1)
-            else:
-                return {
-                    'success': False,
-                    'error_type': 'authorization'
-                }
+            return {
+                'success': False,
+                'error_type': 'authorization'
+            }
         else:
             return {
                 'success': False,
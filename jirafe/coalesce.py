@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+
+from .dedup import entity_key
+
+class Coalescer(object):
+    def __init__(self, window=0.1, id_fields=None):
+        self.window = window
+        self.id_fields = id_fields or {}
+        self.coalesced = 0
+        self.pending = {}
+        self._lock = threading.Lock()
+
+    def get_key(self, site_id, path, data):
+        return entity_key(site_id, path, data, self.id_fields)
+
+    def submit(self, key, data, send):
+        entry, seq = self._join(key, data, threading.Event)
+        if seq > 0:
+            entry['done'].wait()
+            return self._result(entry, seq)
+
+        time.sleep(self.window)
+        data = self._leave(key, entry)
+        try:
+            entry['result'] = send(data)
+        except Exception as e:
+            entry['error'] = e
+        finally:
+            entry['done'].set()
+        return self._result(entry, seq)
+
+    async def submit_async(self, key, data, send):
+        entry, seq = self._join(key, data, asyncio.Event)
+        if seq > 0:
+            await entry['done'].wait()
+            return self._result(entry, seq)
+
+        await asyncio.sleep(self.window)
+        data = self._leave(key, entry)
+        try:
+            entry['result'] = await send(data)
+        except Exception as e:
+            entry['error'] = e
+        finally:
+            entry['done'].set()
+        return self._result(entry, seq)
+
+    def _join(self, key, data, event):
+        with self._lock:
+            entry = self.pending.get(key)
+            if entry is None:
+                entry = self.pending[key] = {
+                    'data': data,
+                    'seq': 0,
+                    'done': event(),
+                    'result': None,
+                    'error': None,
+                }
+            else:
+                entry['data'] = data
+                entry['seq'] += 1
+                self.coalesced += 1
+            return entry, entry['seq']
+
+    def _leave(self, key, entry):
+        with self._lock:
+            del self.pending[key]
+            return entry['data']
+
+    def _result(self, entry, seq):
+        if entry['error'] is not None:
+            raise entry['error']
+        if seq == entry['seq']:
+            return entry['result']
+        result = dict(entry['result'])
+        result['coalesced'] = True
+        return result
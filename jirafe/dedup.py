@@ -0,0 +1,144 @@
+import collections
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+def entity_key(site_id, path, data, id_fields):
+    if not isinstance(data, dict):
+        return None
+    entity_id = data.get(id_fields.get(path, 'id'))
+    if entity_id is None:
+        return None
+    return '%s:%s:%s' % (site_id, path, entity_id)
+
+
+class ChangeIndex(object):
+    def __init__(self, id_fields=None, ignore_fields=('change_date',)):
+        self.id_fields = id_fields or {}
+        self.ignore_fields = frozenset(ignore_fields)
+        self.skipped = 0
+        self._skip_lock = threading.Lock()
+
+    def get_key(self, site_id, path, data):
+        return entity_key(site_id, path, data, self.id_fields)
+
+    def get_digest(self, data):
+        if self.ignore_fields:
+            data = dict((k, v) for k, v in data.items() if k not in self.ignore_fields)
+        normalized = json.dumps(data, sort_keys=True, separators=(',',':'), default=str)
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+    def check(self, site_id, path, data):
+        key = self.get_key(site_id, path, data)
+        if key is None:
+            return None, None
+        digest = self.get_digest(data)
+        if self.get(key) == digest:
+            with self._skip_lock:
+                self.skipped += 1
+            return key, None
+        return key, digest
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, digest):
+        raise NotImplementedError
+
+
+class MemoryChangeIndex(ChangeIndex):
+    def __init__(self, max_entries=100000, **kwargs):
+        super(MemoryChangeIndex, self).__init__(**kwargs)
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            digest = self.entries.get(key)
+            if digest is not None:
+                self.entries.move_to_end(key)
+            return digest
+
+    def set(self, key, digest):
+        with self._lock:
+            self.entries[key] = digest
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class SQLiteChangeIndex(ChangeIndex):
+    def __init__(self, path, max_entries=1000000, evict_every=1000, **kwargs):
+        super(SQLiteChangeIndex, self).__init__(**kwargs)
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._sets = 0
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS changes (key TEXT PRIMARY KEY, digest TEXT, used REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS changes_used ON changes (used)')
+
+    def get(self, key):
+        row = self._connection().execute('SELECT digest FROM changes WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        # Hits are recorded in memory and written in one batch, at the latest
+        # before eviction, so eviction goes by last use rather than last send.
+        with self._lock:
+            self._touched[key] = time.time()
+            flush = len(self._touched) >= self.evict_every
+        if flush:
+            self.flush()
+        return row[0]
+
+    def set(self, key, digest):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO changes (key, digest, used) VALUES (?, ?, ?)',
+                     (key, digest, time.time()))
+        with self._lock:
+            self._sets += 1
+            evict = self._sets % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def flush(self):
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany('UPDATE changes SET used = MAX(used, ?) WHERE key = ?',
+                             [(used, key) for key, used in touched.items()])
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def evict(self):
+        self.flush()
+        conn = self._connection()
+        count = conn.execute('SELECT COUNT(*) FROM changes').fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                'DELETE FROM changes WHERE key IN (SELECT key FROM changes ORDER BY used LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM changes').fetchone()[0]
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
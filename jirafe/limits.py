@@ -0,0 +1,145 @@
+import threading
+import time
+
+class TokenBucket(object):
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self.tokens = self.burst
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    def refund(self, tokens=1):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + tokens)
+
+
+class RateLimiter(object):
+    def __init__(self, rate=None, burst=None, site_rates=None, path_rates=None):
+        self.rate = rate
+        self.burst = burst
+        self.site_rates = site_rates or {}
+        self.path_rates = path_rates or {}
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, site_id, path):
+        delay = 0.0
+        site_bucket = self._bucket(site_id, None, self.site_rates.get(site_id, (self.rate, self.burst)))
+        if site_bucket is not None:
+            delay = site_bucket.reserve()
+        path_bucket = self._bucket(site_id, path, self.path_rates.get(path, (None, None)))
+        if path_bucket is not None:
+            delay = max(delay, path_bucket.reserve())
+        return delay
+
+    def acquire(self, site_id, path, deadline=None):
+        # Returns False, without using up the reservation, when the wait would
+        # run past the deadline.
+        delay = self.reserve(site_id, path)
+        if delay > 0:
+            if deadline is not None and time.time() + delay >= deadline:
+                for bucket in (self.buckets.get((site_id, None)), self.buckets.get((site_id, path))):
+                    if bucket is not None:
+                        bucket.refund()
+                return False
+            time.sleep(delay)
+        return True
+
+    def _bucket(self, site_id, path, config):
+        rate, burst = config
+        if rate is None:
+            return None
+        key = (site_id, path)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+
+class AdaptiveConcurrency(object):
+    def __init__(self, initial=4, min_limit=1, max_limit=64,
+                 backoff_ratio=0.9, latency_tolerance=2.0, target_latency=None,
+                 baseline_drift=1.01):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.target_latency = target_latency
+        self.baseline_drift = baseline_drift
+        self.sites = {}
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+    def get_limit(self, site_id):
+        with self._lock:
+            return self._site(site_id)['limit']
+
+    def acquire(self, site_id, deadline=None):
+        with self._lock:
+            site = self._site(site_id)
+            while site['in_flight'] >= int(site['limit']):
+                if deadline is None:
+                    self._available.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._available.wait(remaining)
+            site['in_flight'] += 1
+            return True
+
+    def cancel(self, site_id):
+        # Frees a slot without a latency sample, for calls that never reached
+        # the API.
+        with self._lock:
+            self._site(site_id)['in_flight'] -= 1
+            self._available.notify_all()
+
+    def release(self, site_id, latency, success=True):
+        with self._lock:
+            site = self._site(site_id)
+            site['in_flight'] -= 1
+
+            if site['min_latency'] is None:
+                site['min_latency'] = latency
+            else:
+                site['min_latency'] = min(latency, site['min_latency'] * self.baseline_drift)
+            target = self.target_latency
+            if target is None:
+                target = site['min_latency'] * self.latency_tolerance
+
+            if not success or latency > target:
+                site['limit'] = max(self.min_limit, site['limit'] * self.backoff_ratio)
+            elif site['in_flight'] + 1 >= int(site['limit']):
+                site['limit'] = min(self.max_limit, site['limit'] + 1.0 / site['limit'])
+            self._available.notify_all()
+
+    def _site(self, site_id):
+        site = self.sites.get(site_id)
+        if site is None:
+            site = self.sites[site_id] = {
+                'limit': float(self.initial),
+                'in_flight': 0,
+                'min_latency': None,
+            }
+        return site
@@ -0,0 +1,89 @@
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        return {
+            'buckets': dict(zip(self.buckets + (float('inf'),), self.counts)),
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+class MetricsRegistry(object):
+    def __init__(self, buckets=None):
+        self.buckets = {
+            'jirafe.request.size': SIZE_BUCKETS,
+        }
+        self.buckets.update(buckets or {})
+        self.counters = {}
+        self.histograms = {}
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def increment(self, name, value=1, **tags):
+        key = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        for hook in self.hooks:
+            hook('counter', name, value, tags)
+
+    def observe(self, name, value, **tags):
+        key = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+        for hook in self.hooks:
+            hook('histogram', name, value, tags)
+
+    def get_counter(self, name, **tags):
+        return self.counters.get((name, tuple(sorted(tags.items()))), 0)
+
+    def get_histogram(self, name, **tags):
+        with self._lock:
+            histogram = self.histograms.get((name, tuple(sorted(tags.items()))))
+            return histogram.snapshot() if histogram is not None else None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [
+                    {'name': name, 'tags': dict(tags), 'value': value}
+                    for (name, tags), value in self.counters.items()
+                ],
+                'histograms': [
+                    dict(histogram.snapshot(), name=name, tags=dict(tags))
+                    for (name, tags), histogram in self.histograms.items()
+                ],
+            }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._lock = threading.Lock()
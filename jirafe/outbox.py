@@ -0,0 +1,285 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from .client import dumps
+
+logger = logging.getLogger(__name__)
+
+class OutboxError(Exception):
+    pass
+
+
+class Outbox(object):
+    def __init__(self, path, fsync=False, wait=True, commit_interval=0.01, dumps=dumps, priorities=None,
+                 max_pending=10000):
+        self.path = path
+        self.fsync = fsync
+        self.wait = wait
+        self.max_pending = max_pending
+        self.commit_interval = commit_interval
+        self.dumps = dumps
+        self.priorities = priorities
+        self.closed = False
+        self._local = threading.local()
+        self._pending = []
+        self._committed = threading.Condition()
+        self._wakeup = threading.Condition(threading.Lock())
+        self._batch = 0
+        self._committed_batch = 0
+        self._error = None
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, site_id TEXT, path TEXT, data TEXT, '
+            'attempts INTEGER DEFAULT 0, next_attempt REAL DEFAULT 0, acked INTEGER DEFAULT 0, '
+            'priority INTEGER DEFAULT 0, created_at REAL DEFAULT 0)'
+        )
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(entries)')]
+        if 'priority' not in columns:
+            conn.execute('ALTER TABLE entries ADD COLUMN priority INTEGER DEFAULT 0')
+            conn.execute('ALTER TABLE entries ADD COLUMN created_at REAL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS entries_pending ON entries (acked, next_attempt, id)')
+
+        self._writer = threading.Thread(target=self._write, name='jirafe-outbox-writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def append(self, site_id, path, data, wait=None):
+        if self.closed:
+            raise RuntimeError('outbox is closed')
+        if not isinstance(data, (str, bytes)):
+            data = self.dumps(data)
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+
+        priority = 0 if self.priorities is None else self.priorities.get(path)
+        # Without wait the entry exists only in memory until the writer
+        # commits it, so refuse new entries while commits are failing.
+        with self._wakeup:
+            self._check_error()
+            if len(self._pending) >= self.max_pending:
+                raise OutboxError('%d outbox entries are waiting to be written' % len(self._pending))
+            self._pending.append((str(site_id), path, data, priority, time.time()))
+            batch = self._batch
+            self._wakeup.notify()
+        if wait or (wait is None and self.wait):
+            self._wait_for(batch)
+
+    def flush(self):
+        with self._wakeup:
+            batch = self._batch if self._pending else self._batch - 1
+            self._wakeup.notify()
+        self._wait_for(batch)
+
+    def fetch(self, limit=100):
+        now = time.time()
+        if self.priorities is None:
+            return self._connection().execute(
+                'SELECT id, site_id, path, data, attempts FROM entries '
+                'WHERE acked = 0 AND next_attempt <= ? ORDER BY id LIMIT ?',
+                (now, limit)
+            ).fetchall()
+        # Entries older than max_wait are taken first, oldest first, so that
+        # low priority entries are delayed but never starved.
+        cutoff = now - self.priorities.max_wait
+        return self._connection().execute(
+            'SELECT id, site_id, path, data, attempts FROM entries '
+            'WHERE acked = 0 AND next_attempt <= ? '
+            'ORDER BY created_at > ?, CASE WHEN created_at > ? THEN priority ELSE 0 END, id LIMIT ?',
+            (now, cutoff, cutoff, limit)
+        ).fetchall()
+
+    def ack(self, ids):
+        self._execute_many('UPDATE entries SET acked = 1 WHERE id = ?', [(i,) for i in ids])
+
+    def nack(self, ids, delay):
+        next_attempt = time.time() + delay
+        self._execute_many(
+            'UPDATE entries SET attempts = attempts + 1, next_attempt = ? WHERE id = ?',
+            [(next_attempt, i) for i in ids]
+        )
+
+    def compact(self):
+        conn = self._connection()
+        removed = conn.execute('DELETE FROM entries WHERE acked = 1').rowcount
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return removed
+
+    def count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM entries WHERE acked = 0').fetchone()[0]
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        with self._wakeup:
+            self._wakeup.notify()
+        self._writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _wait_for(self, batch):
+        with self._committed:
+            while self._committed_batch <= batch:
+                self._check_error()
+                self._committed.wait()
+
+    def _check_error(self):
+        # The failed entries stay queued and the writer keeps retrying them,
+        # so they may still be written after the caller has seen this error.
+        error = self._error
+        if error is not None:
+            raise OutboxError('failed to write outbox entries: %r' % error) from error
+
+    def _execute_many(self, sql, params):
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(sql, params)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _write(self):
+        while True:
+            with self._wakeup:
+                while not self._pending and not self.closed:
+                    self._wakeup.wait()
+                if not self._pending and self.closed:
+                    return
+            time.sleep(self.commit_interval)
+            with self._wakeup:
+                pending = self._pending
+                self._pending = []
+                batch = self._batch
+                self._batch += 1
+
+            try:
+                self._execute_many('INSERT INTO entries (site_id, path, data, priority, created_at) VALUES (?, ?, ?, ?, ?)', pending)
+            except Exception as e:
+                logger.exception('Failed to write %d outbox entries, retrying', len(pending))
+                with self._wakeup:
+                    self._pending = pending + self._pending
+                with self._committed:
+                    self._error = e
+                    self._committed.notify_all()
+                time.sleep(1)
+                continue
+
+            with self._committed:
+                self._error = None
+                self._committed_batch = batch + 1
+                self._committed.notify_all()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.isolation_level = None
+            conn.execute('PRAGMA synchronous=%s' % ('FULL' if self.fsync else 'NORMAL'))
+        return conn
+
+
+class OutboxSender(object):
+    def __init__(self, outbox, client, get_session,
+                 batch_size=100, poll_interval=0.5, backoff=1, max_backoff=300,
+                 compact_interval=60, callback=None):
+        self.outbox = outbox
+        self.client = client
+        self.get_session = get_session
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.compact_interval = compact_interval
+        self.callback = callback
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='jirafe-outbox-sender')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def drain(self, timeout=None):
+        self.outbox.flush()
+        deadline = None if timeout is None else time.time() + timeout
+        while self.outbox.count():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            if self._thread is None:
+                self.send_once()
+            else:
+                time.sleep(0.01)
+        return True
+
+    def send_once(self):
+        rows = self.outbox.fetch(self.batch_size)
+        groups = {}
+        for row in rows:
+            groups.setdefault((row[1], row[2]), []).append(row)
+
+        for (site_id, path), entries in groups.items():
+            try:
+                session = self.get_session(site_id)
+                results = self.client._put_batch(session, path, [entry[3] for entry in entries])
+            except Exception as e:
+                logger.exception('Failed to send %d %s changes from outbox', len(entries), path)
+                results = [{
+                    'success': False,
+                    'error_type': 'exception',
+                    'message': str(e)
+                } for _ in entries]
+            self._settle(site_id, path, entries, results)
+        return len(rows)
+
+    def _settle(self, site_id, path, entries, results):
+        acked = []
+        retries = {}
+        for entry, result in zip(entries, results):
+            if result['success'] or result.get('error_type') == 'validation':
+                acked.append(entry[0])
+                if self.callback is not None:
+                    try:
+                        self.callback(site_id, path, entry[3], result)
+                    except Exception:
+                        logger.exception('Outbox callback failed')
+            else:
+                delay = min(self.max_backoff, self.backoff * (2 ** entry[4]))
+                retries.setdefault(delay, []).append(entry[0])
+        if acked:
+            self.outbox.ack(acked)
+        for delay, ids in retries.items():
+            self.outbox.nack(ids, delay)
+
+    def _run(self):
+        compacted = time.time()
+        while not self._stopped.is_set():
+            try:
+                sent = self.send_once()
+                if time.time() - compacted >= self.compact_interval:
+                    self.outbox.compact()
+                    compacted = time.time()
+            except Exception:
+                logger.exception('Outbox sender failed')
+                sent = 0
+            if not sent:
+                self._stopped.wait(self.poll_interval)
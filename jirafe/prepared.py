@@ -0,0 +1,58 @@
+class PreparedEndpoint(object):
+    # Bound to one (client, session, path). The client treats it as the
+    # session, so every client feature still applies, but the URLs are
+    # formatted once and the auth header is rebuilt only when the token changes.
+    def __init__(self, client, session, path):
+        self.client = client
+        self.session = session
+        self.path = path
+        self.site_id = session.site_id
+        self.urls = {
+            path: client._format_url(session, path),
+            client.BATCH_PATH: client._format_url(session, client.BATCH_PATH),
+        }
+        self._header = (None, None)
+
+    def send(self, data):
+        return self.client._put(self, self.path, data)
+
+    def send_batch(self, items):
+        return self.client._put_batch(self, self.path, items)
+
+    def get_url(self, path):
+        url = self.urls.get(path)
+        if url is None:
+            url = self.urls[path] = self.client._format_url(self.session, path)
+        return url
+
+    @property
+    def access_token(self):
+        return self.session.access_token
+
+    def get_header(self):
+        return self.format_header(self.session.get_token())
+
+    def format_header(self, token):
+        cached, header = self._header
+        if token is not cached:
+            header = self.session.format_header(token)
+            self._header = (token, header)
+        return header
+
+    def get_issued_token(self):
+        return self.session.get_issued_token()
+
+    def has_valid_token(self):
+        return self.session.has_valid_token()
+
+    def update_token(self):
+        return self.session.update_token()
+
+    def maybe_refresh_ahead(self):
+        self.session.maybe_refresh_ahead()
+
+    def invalidate(self, token=None):
+        self.session.invalidate(token)
+
+    def set_deadline(self, deadline):
+        self.session.set_deadline(deadline)
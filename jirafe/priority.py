@@ -0,0 +1,163 @@
+import asyncio
+import collections
+import queue
+import time
+
+class Priorities(object):
+    DEFAULTS = {
+        'order': 0,
+        'cart': 1,
+        'customer': 2,
+        'employee': 3,
+        'product': 4,
+        'category': 4,
+    }
+
+    def __init__(self, priorities=None, default=None, max_wait=10):
+        self.priorities = dict(self.DEFAULTS)
+        self.priorities.update(priorities or {})
+        self.default = max(self.priorities.values()) if default is None else default
+        self.max_wait = max_wait
+
+    def get(self, path):
+        return self.priorities.get(path, self.default)
+
+    def lanes(self, key):
+        return Lanes(self, key)
+
+
+# FIFO lanes served in strict priority order, with the `append`/`popleft`/len
+# subset of a deque. An item that has waited `max_wait` seconds goes ahead of
+# everything newer, so low priority lanes are delayed but never starved.
+class Lanes(object):
+    AGED = float('-inf')
+
+    def __init__(self, priorities, key):
+        self.priorities = priorities
+        self.key = key
+        self.lanes = {}
+        self.order = []
+        self.size = 0
+
+    def append(self, item):
+        priority = self.priorities.get(self.key(item))
+        lane = self.lanes.get(priority)
+        if lane is None:
+            lane = self.lanes[priority] = collections.deque()
+            self.order = sorted(self.lanes)
+        lane.append((time.time(), item))
+        self.size += 1
+
+    def popleft(self):
+        lane = self._next_lane()
+        if lane is None:
+            raise IndexError('pop from empty lanes')
+        self.size -= 1
+        return lane.popleft()[1]
+
+    def pop_lowest(self):
+        for priority in reversed(self.order):
+            lane = self.lanes[priority]
+            if lane:
+                self.size -= 1
+                return lane.popleft()[1]
+        raise IndexError('pop from empty lanes')
+
+    def peek(self):
+        lane = self._next_lane()
+        if lane is None:
+            return None
+        if self._aged(lane, time.time() - self.priorities.max_wait):
+            return self.AGED
+        return self.priorities.get(self.key(lane[0][1]))
+
+    def __len__(self):
+        return self.size
+
+    def _next_lane(self):
+        cutoff = time.time() - self.priorities.max_wait
+        first = None
+        oldest = None
+        for priority in self.order:
+            lane = self.lanes[priority]
+            if not lane:
+                continue
+            if first is None:
+                first = lane
+            if self._aged(lane, cutoff) and (oldest is None or lane[0][0] < oldest[0][0]):
+                oldest = lane
+        return oldest or first
+
+    def _aged(self, lane, cutoff):
+        return lane[0][0] <= cutoff
+
+
+class LaneQueue(queue.Queue):
+    def __init__(self, maxsize=0, priorities=None, key=lambda item: item[1]):
+        self.priorities = priorities or Priorities()
+        self.key = key
+        queue.Queue.__init__(self, maxsize)
+
+    def drop_nowait(self):
+        with self.not_empty:
+            if not self._qsize():
+                raise queue.Empty
+            item = self.lanes.pop_lowest()
+            self.not_full.notify()
+            return item
+
+    def _init(self, maxsize):
+        self.lanes = self.priorities.lanes(self.key)
+
+    def _qsize(self):
+        return len(self.lanes)
+
+    def _put(self, item):
+        self.lanes.append(item)
+
+    def _get(self):
+        return self.lanes.popleft()
+
+
+class AsyncPrioritySemaphore(object):
+    def __init__(self, value, priorities):
+        self.value = value
+        self.waiters = priorities.lanes(lambda waiter: waiter[0])
+
+    async def acquire(self, path):
+        # Released slots are handed straight to a waiter, so a free slot
+        # means nobody live is waiting and it can be taken immediately.
+        if self.value > 0:
+            self.value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((path, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while len(self.waiters):
+            future = self.waiters.popleft()[1]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.value += 1
+
+    def slot(self, path):
+        return _Slot(self, path)
+
+
+class _Slot(object):
+    def __init__(self, semaphore, path):
+        self.semaphore = semaphore
+        self.path = path
+
+    async def __aenter__(self):
+        await self.semaphore.acquire(self.path)
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
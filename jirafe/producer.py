@@ -0,0 +1,187 @@
+import logging
+import queue
+import threading
+import time
+
+from .priority import LaneQueue
+
+logger = logging.getLogger(__name__)
+
+class BufferFull(Exception):
+    pass
+
+
+class JirafeProducer(object):
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    RAISE = 'raise'
+    def __init__(self, client,
+                 max_buffer=10000, batch_size=100, linger=0.5, workers=1,
+                 backpressure='block', callback=None, priorities=None):
+        if backpressure not in (self.BLOCK, self.DROP_OLDEST, self.RAISE):
+            raise ValueError('%s is not a supported backpressure mode' % backpressure)
+        self.client = client
+        self.batch_size = batch_size
+        self.linger = linger
+        self.backpressure = backpressure
+        self.callback = callback
+        self.dropped = 0
+        self.priorities = priorities
+        if priorities is None:
+            self.queue = queue.Queue(max_buffer)
+        else:
+            self.queue = LaneQueue(max_buffer, priorities)
+        self.closed = False
+        self._flushing = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._run, name='jirafe-producer-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def category_change(self, session, data, callback=None):
+        self.send(session, 'category', data, callback)
+
+    def cart_change(self, session, data, callback=None):
+        self.send(session, 'cart', data, callback)
+
+    def order_change(self, session, data, callback=None):
+        self.send(session, 'order', data, callback)
+
+    def product_change(self, session, data, callback=None):
+        self.send(session, 'product', data, callback)
+
+    def customer_change(self, session, data, callback=None):
+        self.send(session, 'customer', data, callback)
+
+    def employee_change(self, session, data, callback=None):
+        self.send(session, 'employee', data, callback)
+
+    def send(self, session, path, data, callback=None):
+        if self.closed:
+            raise RuntimeError('producer is closed')
+        item = (session, path, data, callback)
+
+        if self.backpressure == self.BLOCK:
+            self.queue.put(item)
+        elif self.backpressure == self.RAISE:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                raise BufferFull('%d changes are already buffered' % self.queue.maxsize)
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    self._drop_oldest()
+
+    def flush(self, timeout=None):
+        with self._lock:
+            self._flushing += 1
+        try:
+            return self._wait_empty(timeout)
+        finally:
+            with self._lock:
+                self._flushing -= 1
+
+    def close(self, timeout=None):
+        self.closed = True
+        drained = self.flush(timeout)
+        self._stopped.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        return drained
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _wait_empty(self, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _drop_oldest(self):
+        try:
+            if self.priorities is None:
+                item = self.queue.get_nowait()
+            else:
+                item = self.queue.drop_nowait()
+        except queue.Empty:
+            return
+        with self._lock:
+            self.dropped += 1
+        self._deliver(item, {
+            'success': False,
+            'error_type': 'dropped'
+        })
+        self.queue.task_done()
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.05)
+            except queue.Empty:
+                if self._stopped.is_set():
+                    return
+                continue
+            batch = self._collect(item)
+            try:
+                self._send(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _collect(self, item):
+        batch = [item]
+        deadline = time.time() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining <= 0 or self._flushing or self._stopped.is_set():
+                    batch.append(self.queue.get_nowait())
+                else:
+                    batch.append(self.queue.get(timeout=min(remaining, 0.05)))
+            except queue.Empty:
+                if remaining <= 0 or self._flushing or self._stopped.is_set():
+                    break
+        return batch
+
+    def _send(self, batch):
+        groups = {}
+        for item in batch:
+            groups.setdefault((item[0], item[1]), []).append(item)
+
+        for (session, path), items in groups.items():
+            try:
+                results = self.client._put_batch(session, path, [item[2] for item in items])
+            except Exception as e:
+                logger.exception('Failed to send %d %s changes', len(items), path)
+                results = [{
+                    'success': False,
+                    'error_type': 'exception',
+                    'message': str(e)
+                } for _ in items]
+            for item, result in zip(items, results):
+                self._deliver(item, result)
+
+    def _deliver(self, item, result):
+        callback = item[3] or self.callback
+        if callback is None:
+            return
+        try:
+            callback(item[2], result)
+        except Exception:
+            logger.exception('Delivery callback failed')
@@ -0,0 +1,128 @@
+import email.utils
+import random
+import threading
+import time
+
+class RetryBudget(object):
+    def __init__(self, ratio=0.1, min_per_second=1.0, max_tokens=100):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = float(max_tokens)
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.max_tokens, self.tokens + (now - self.updated) * self.min_per_second)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class RetryPolicy(object):
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30, jitter=True,
+                 retry_statuses=(429, 500, 502, 503, 504), budget=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.budget = budget
+
+    def record_request(self):
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def should_retry(self, attempt, status=None):
+        if attempt >= self.max_retries:
+            return False
+        if status is not None and status not in self.retry_statuses:
+            return False
+        return self.budget is None or self.budget.withdraw()
+
+    def get_delay(self, attempt, retry_after=None):
+        delay = parse_retry_after(retry_after)
+        if delay is not None:
+            return min(delay, self.max_backoff)
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+def parse_retry_after(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class CircuitBreaker(object):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.sites = {}
+        self._lock = threading.Lock()
+
+    def get_state(self, site_id):
+        return self._site(site_id)['state']
+
+    def allow(self, site_id):
+        with self._lock:
+            site = self._site(site_id)
+            if site['state'] == self.CLOSED:
+                return True
+            if site['state'] == self.OPEN and time.time() - site['opened_at'] >= self.reset_timeout:
+                site['state'] = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self, site_id):
+        with self._lock:
+            site = self._site(site_id)
+            site['state'] = self.CLOSED
+            site['failures'] = 0
+
+    def record_abort(self, site_id):
+        # The call ended without an outcome from the API; a half-open probe
+        # goes back to open so the next call can probe again.
+        with self._lock:
+            site = self._site(site_id)
+            if site['state'] == self.HALF_OPEN:
+                site['state'] = self.OPEN
+
+    def record_failure(self, site_id):
+        with self._lock:
+            site = self._site(site_id)
+            site['failures'] += 1
+            if site['state'] == self.HALF_OPEN or site['failures'] >= self.failure_threshold:
+                site['state'] = self.OPEN
+                site['opened_at'] = time.time()
+
+    def _site(self, site_id):
+        site = self.sites.get(site_id)
+        if site is None:
+            site = self.sites[site_id] = {
+                'state': self.CLOSED,
+                'failures': 0,
+                'opened_at': None,
+            }
+        return site
@@ -1,4 +1,10 @@
 import requests
+import threading
+import time
+
+from .cache import ProfileCache
+from .timeouts import DEFAULT_TIMEOUT, DeadlineExceeded, remaining_timeout
+from .transport import RequestsTransport
 
 class JirafeSession(object):
     def __init__(self,
@@ -6,31 +12,146 @@ class JirafeSession(object):
                  auth_url='https://accounts.jirafe.com/oauth2/authorize',
                  token_url='https://accounts.jirafe.com/oauth2/access_token',
                  profile_url='https://accounts.jirafe.com/accounts/profile',
-                 requests=requests):
+                 requests=requests,
+                 refresh_margin=60,
+                 token_store=None,
+                 profile_cache=None,
+                 metrics=None,
+                 timeout=DEFAULT_TIMEOUT,
+                 transport=None,
+                 tracer=None):
         self.access_token = None
+        self.metrics = metrics
+        self.tracer = tracer
+        self.profile_cache = profile_cache if profile_cache is not None else ProfileCache()
+        self.token_store = token_store
+        self.expires_at = None
+        self.refresh_margin = refresh_margin
         self.site_id = site_id
         self.profile_url = profile_url
         self.token_url = token_url
         self.auth_url = auth_url
         self.requests = requests
+        self.transport = transport if transport is not None else RequestsTransport(requests)
+        self.timeout = timeout
+        self._init_locks()
+
+    def _init_locks(self):
+        self._token_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._token_generation = 0
+        self._local = threading.local()
 
     def get_header(self):
-        self.update_token()
-        auth_header = 'Bearer %s' % (self.access_token)
-        return {'Authorization': auth_header}
+        return self.format_header(self.get_token())
 
-    def invalidate(self):
-        self.access_token = None
+    def format_header(self, token):
+        return {'Authorization': 'Bearer %s' % token}
 
-    def update_token(self):
+    def get_token(self):
+        token = self.update_token()
+        self._local.token = token
+        return token
+
+    def get_issued_token(self):
+        return getattr(self._local, 'token', None)
+
+    def set_deadline(self, deadline):
+        self._local.deadline = deadline
+
+    def get_timeout(self):
+        return remaining_timeout(self.timeout, getattr(self._local, 'deadline', None))
+
+    def invalidate(self, token=None):
+        if token is None:
+            token = self.get_issued_token()
+        with self._token_lock:
+            if token is None or token == self.access_token:
+                self.access_token = None
+            if token is not None and self.token_store is not None:
+                self.token_store.delete(self.get_store_key(), token)
+
+    def get_store_key(self):
+        return '%s:%s' % (self.site_id, getattr(self, 'client_id', None))
+
+    def has_valid_token(self):
         if self.access_token is None:
-            self.access_token = self._get_token()
-        return self.access_token
+            return False
+        return self.expires_at is None or time.time() < self.expires_at
+
+    def maybe_refresh_ahead(self):
+        # Starts a background refresh once a valid token is inside the refresh
+        # margin, as update_token does; never blocks.
+        expires_at = self.expires_at
+        if self.access_token is not None and expires_at is not None:
+            if time.time() >= expires_at - self.refresh_margin:
+                self._refresh_ahead()
+
+    def update_token(self):
+        # Read the generation first: a fetch finishing after the token is
+        # read bumps it, so this caller does not fetch a second time.
+        generation = self._token_generation
+        token = self.access_token
+        if token is not None:
+            expires_at = self.expires_at
+            if expires_at is None:
+                return token
+            now = time.time()
+            if now < expires_at - self.refresh_margin:
+                return token
+            if now < expires_at:
+                self._refresh_ahead()
+                return token
+            self.invalidate(token)
+
+        deadline = getattr(self._local, 'deadline', None)
+        wait = -1 if deadline is None else max(0, deadline - time.time())
+        if not self._token_lock.acquire(timeout=wait):
+            raise DeadlineExceeded('deadline exceeded waiting for token')
+        try:
+            if self._token_generation == generation:
+                self.access_token = self._fetch_token(self._get_token)
+                self._token_generation += 1
+            return self.access_token
+        finally:
+            self._token_lock.release()
 
     def get_profile(self, retry=0):
-        if hasattr(self, 'cached_profile'):
-            return self.cached_profile
+        key = self.get_profile_key()
+        profile = self.profile_cache.get(key)
+        if profile is not None:
+            return profile
+
+        # The key starts with the URL to fetch, so a cached profile always
+        # came from the URL its key names.
+        r = self._fetch_profile(key[0], retry)
+
+        if r.status_code == 403:
+            if retry < 1:
+                self.invalidate()
+                return self.get_profile(1)
+        elif r.status_code == 200:
+            profile = r.json()
+            self.profile_cache.set(key, profile)
+            return profile
+
+    def _fetch_profile(self, url, retry=0):
+        if self.tracer is None:
+            return self.transport.get(url, headers=self.get_header(), timeout=self.get_timeout())
+
+        with self.tracer.start_span('jirafe.profile.fetch', site_id=self.site_id, retries=retry) as span:
+            with span.timing('token'):
+                headers = self.get_header()
+            with span.timing('network'):
+                r = self.transport.get(url, headers=self.tracer.inject(headers, span),
+                                       timeout=self.get_timeout())
+            span.set_attribute('status', r.status_code)
+            return r
 
+    def invalidate_profile(self):
+        self.profile_cache.invalidate(self.get_profile_key())
+
+    def get_profile_url(self):
         url = self.profile_url
         if self.site_id is not None:
             url = "{url}{slash}site/{site_id}/".format(
@@ -38,35 +159,112 @@ class JirafeSession(object):
                 slash='' if url.endswith('/') else '/',
                 site_id=self.site_id
             )
-        r = self.requests.get(url, headers=self.get_header())
+        return url
 
-        if r.status_code == 403:
-            if retry < 1:
-                self.invalidate()
-                return self.get_profile(1)
-        elif r.status_code == 200:
-            self.cached_profile = r.json()
-            return self.cached_profile
+    def get_profile_key(self):
+        # Without a username the account is unknown (many merchants authorize
+        # the same OAuth2 client), so the profile is only shared per site.
+        return (self.get_profile_url(), getattr(self, 'client_id', None), None)
 
     def get_site(self):
         profile = self.get_profile()
 
         if profile and 'sites' in profile:
-            try:
-                return next(s for s in profile['sites'] if str(s['id']) == str(self.site_id))
-            except StopIteration:
-                pass
+            sites = self.profile_cache.get_site_index(self.get_profile_key(), profile)
+            return sites.get(str(self.site_id))
+
+    def _refresh_ahead(self):
+        if not self._refresh_lock.acquire(False):
+            return
+        thread = threading.Thread(target=self._refresh)
+        thread.daemon = True
+        thread.start()
+
+    def _refresh(self):
+        try:
+            with self._token_lock:
+                token = self._fetch_token(self._request_token)
+                if token is not None:
+                    self.access_token = token
+                    self._token_generation += 1
+        finally:
+            self._refresh_lock.release()
+
+    def _fetch_token(self, fetch):
+        if self.token_store is None:
+            return self._timed_fetch(fetch)
+
+        key = self.get_store_key()
+        with self.token_store.lock(key):
+            record = self.token_store.get(key)
+            if record is not None:
+                if record.get('refresh_token') and hasattr(self, 'refresh_token'):
+                    self.refresh_token = record['refresh_token']
+                expires_at = record.get('expires_at')
+                if expires_at is None or time.time() < expires_at - self.refresh_margin:
+                    self.expires_at = expires_at
+                    return record['access_token']
+
+            token = self._timed_fetch(fetch)
+            if token is not None:
+                self.token_store.set(key, {
+                    'access_token': token,
+                    'refresh_token': getattr(self, 'refresh_token', None),
+                    'expires_at': self.expires_at,
+                })
+            return token
+
+    def _timed_fetch(self, fetch):
+        if self.tracer is None:
+            return self._measured_fetch(fetch)
+
+        with self.tracer.start_span('jirafe.token.fetch', site_id=self.site_id) as span:
+            token = self._measured_fetch(fetch)
+            span.set_attribute('success', token is not None)
+            return token
+
+    def _measured_fetch(self, fetch):
+        if self.metrics is None:
+            return fetch()
+
+        started = time.time()
+        token = None
+        try:
+            token = fetch()
+        finally:
+            self.metrics.increment('jirafe.token.fetches', success=token is not None)
+            self.metrics.observe('jirafe.token.fetch.latency', time.time() - started)
+        return token
+
+    def _set_expiry(self, data):
+        expires_in = data.get('expires_in')
+        self.expires_at = time.time() + int(expires_in) if expires_in else None
 
     def _get_token(self):
         raise NotImplementedError
 
+    def _request_token(self):
+        return self._get_token()
+
+    def _post_token(self, data):
+        if self.tracer is None:
+            return self.transport.post(self.token_url, data=data, timeout=self.get_timeout())
+        return self.transport.post(self.token_url, data=data, headers=self.tracer.inject({}),
+                                   timeout=self.get_timeout())
+
     def __getstate__(self):
-        self.requests = None
-        return self.__dict__
+        state = self.__dict__.copy()
+        state['requests'] = None
+        state['transport'] = None
+        for key in ('_token_lock', '_refresh_lock', '_token_generation', '_local'):
+            state.pop(key, None)
+        return state
 
     def __setstate__(self, d):
         self.__dict__.update(d)
         self.requests = requests
+        self.transport = RequestsTransport(requests)
+        self._init_locks()
 
 
 class UsernameSession(JirafeSession):
@@ -77,6 +275,12 @@ class UsernameSession(JirafeSession):
         self.client_secret = client_secret
         super(UsernameSession, self).__init__(site_id, **kwargs)
 
+    def get_profile_key(self):
+        # Fetched from the account-wide profile URL, which lists every site of
+        # the account, so sessions for any of its sites share one cached copy
+        # and site index.
+        return (self.profile_url, self.client_id, self.username)
+
     def _get_token(self):
         data = {
             'username': self.username,
@@ -86,10 +290,12 @@ class UsernameSession(JirafeSession):
             'client_secret': self.client_secret,
         }
 
-        r = self.requests.post(self.token_url, data=data)
+        r = self._post_token(data)
 
-        if r.status_code is 200:
-            return r.json()['access_token']
+        if r.status_code == 200:
+            data = r.json()
+            self._set_expiry(data)
+            return data['access_token']
 
 class Oauth2Session(JirafeSession):
     def __init__(self, site_id, client_id, client_secret, code=None, refresh_token=None, access_token=None, **kwargs):
@@ -111,7 +317,9 @@ class Oauth2Session(JirafeSession):
     def _get_token(self):
         if self.access_token is not None:
             return self.access_token
+        return self._request_token()
 
+    def _request_token(self):
         if self.refresh_token is not None:
             data = {
                 'grant_type': 'refresh_token',
@@ -131,9 +339,11 @@ class Oauth2Session(JirafeSession):
             return self._do_post(data)
 
     def _do_post(self, data):
-        r = self.requests.post(self.token_url, data=data)
+        r = self._post_token(data)
 
-        if r.status_code is 200:
+        if r.status_code == 200:
+            data = r.json()
             self.code = None
-            self.refresh_token = r.json()['refresh_token']
-            return r.json()['access_token']
+            self.refresh_token = data['refresh_token']
+            self._set_expiry(data)
+            return data['access_token']
@@ -0,0 +1,225 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class SessionPool(object):
+    def __init__(self, factory, max_sessions=None, idle_timeout=None):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, site_id):
+        site_id = str(site_id)
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self.sessions.pop(site_id, None)
+            if entry is None:
+                entry = [self.factory(site_id), now]
+            else:
+                entry[1] = now
+            self.sessions[site_id] = entry
+            while self.max_sessions is not None and len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            return entry[0]
+
+    def evict(self, site_id=None):
+        with self._lock:
+            if site_id is None:
+                self.sessions.clear()
+            else:
+                self.sessions.pop(str(site_id), None)
+
+    def __contains__(self, site_id):
+        return str(site_id) in self.sessions
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def _evict_idle(self, now):
+        if self.idle_timeout is None:
+            return
+        while self.sessions:
+            site_id, entry = next(iter(self.sessions.items()))
+            if now - entry[1] < self.idle_timeout:
+                return
+            del self.sessions[site_id]
+
+
+class FairDispatcher(object):
+    def __init__(self, client, sessions,
+                 workers=4, max_per_site=2, batch_size=1, weights=None, default_weight=1,
+                 callback=None, priorities=None):
+        self.client = client
+        self.sessions = sessions
+        self.max_per_site = max_per_site
+        self.batch_size = batch_size
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self.callback = callback
+        self.priorities = priorities
+        self.closed = False
+        self._queues = {}
+        self._ring = collections.deque()
+        self._credits = {}
+        self._in_flight = {}
+        self._pending = 0
+        self._stopped = False
+        self._cond = threading.Condition(threading.Lock())
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._run, name='jirafe-dispatcher-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, site_id, path, data, callback=None):
+        if self.closed:
+            raise RuntimeError('dispatcher is closed')
+        site_id = str(site_id)
+        with self._cond:
+            queue = self._queues.get(site_id)
+            if queue is None:
+                if self.priorities is None:
+                    queue = self._queues[site_id] = collections.deque()
+                else:
+                    queue = self._queues[site_id] = self.priorities.lanes(lambda item: item[0])
+                self._ring.append(site_id)
+            queue.append((path, data, callback))
+            self._pending += 1
+            self._cond.notify()
+
+    def pending(self, site_id=None):
+        with self._cond:
+            if site_id is None:
+                return self._pending
+            site_id = str(site_id)
+            return len(self._queues.get(site_id, ())) + self._in_flight.get(site_id, 0)
+
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        self.closed = True
+        drained = self.flush(timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        return drained
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _next(self):
+        # Weighted round robin over sites with queued changes: a site keeps the
+        # head of the ring for `weight` turns, and sites already at their
+        # concurrency cap are passed over until a send completes. With
+        # priorities, only sites holding the most urgent queued change are
+        # eligible, so catalog backlogs never delay another site's orders.
+        best = self._best_priority()
+        for _ in range(len(self._ring)):
+            site_id = self._ring[0]
+            queue = self._queues[site_id]
+            if not queue:
+                self._ring.popleft()
+                del self._queues[site_id]
+                self._credits.pop(site_id, None)
+                continue
+            in_flight = self._in_flight.get(site_id, 0)
+            if in_flight >= self.max_per_site or (best is not None and queue.peek() > best):
+                self._credits.pop(site_id, None)
+                self._ring.rotate(-1)
+                continue
+
+            credits = self._credits.get(site_id) or self.weights.get(site_id, self.default_weight)
+            credits -= 1
+            if credits > 0:
+                self._credits[site_id] = credits
+            else:
+                self._credits.pop(site_id, None)
+                self._ring.rotate(-1)
+
+            items = [queue.popleft() for _ in range(min(self.batch_size, len(queue)))]
+            self._in_flight[site_id] = in_flight + 1
+            return site_id, items
+        return None
+
+    def _best_priority(self):
+        if self.priorities is None:
+            return None
+        best = None
+        for site_id, queue in self._queues.items():
+            if not queue or self._in_flight.get(site_id, 0) >= self.max_per_site:
+                continue
+            priority = queue.peek()
+            if best is None or priority < best:
+                best = priority
+        return best
+
+    def _run(self):
+        while True:
+            with self._cond:
+                work = self._next()
+                while work is None:
+                    if self._stopped:
+                        return
+                    self._cond.wait()
+                    work = self._next()
+            site_id, items = work
+            try:
+                self._send(site_id, items)
+            finally:
+                with self._cond:
+                    self._in_flight[site_id] -= 1
+                    if not self._in_flight[site_id]:
+                        del self._in_flight[site_id]
+                    self._pending -= len(items)
+                    self._cond.notify_all()
+
+    def _send(self, site_id, items):
+        groups = {}
+        for item in items:
+            groups.setdefault(item[0], []).append(item)
+
+        for path, group in groups.items():
+            try:
+                session = self.sessions.get(site_id)
+                if len(group) == 1:
+                    results = [self.client._put(session, path, group[0][1])]
+                else:
+                    results = self.client._put_batch(session, path, [item[1] for item in group])
+            except Exception as e:
+                logger.exception('Failed to send %d %s changes for site %s', len(group), path, site_id)
+                results = [{
+                    'success': False,
+                    'error_type': 'exception',
+                    'message': str(e)
+                } for _ in group]
+            for item, result in zip(group, results):
+                self._deliver(site_id, item, result)
+
+    def _deliver(self, site_id, item, result):
+        callback = item[2] or self.callback
+        if callback is None:
+            return
+        try:
+            callback(site_id, item[0], item[1], result)
+        except Exception:
+            logger.exception('Delivery callback failed')
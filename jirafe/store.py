@@ -0,0 +1,153 @@
+import contextlib
+import sqlite3
+import threading
+import time
+import uuid
+
+from .timeouts import LockTimeout
+
+class TokenStore(object):
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, record):
+        raise NotImplementedError
+
+    def delete(self, key, access_token):
+        raise NotImplementedError
+
+    def lock(self, key):
+        raise NotImplementedError
+
+
+class MemoryTokenStore(TokenStore):
+    def __init__(self):
+        self.records = {}
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def get(self, key):
+        record = self.records.get(key)
+        return dict(record) if record is not None else None
+
+    def set(self, key, record):
+        self.records[key] = dict(record)
+
+    def delete(self, key, access_token):
+        record = self.records.get(key)
+        if record is not None and record['access_token'] == access_token:
+            del self.records[key]
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.RLock()
+        with lock:
+            yield
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        del state['_locks']
+        return state
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._lock = threading.Lock()
+        self._locks = {}
+
+
+class SQLiteTokenStore(TokenStore):
+    # `lock` takes a lease row per key instead of holding a write transaction,
+    # so a refresh for one key never blocks another and no transaction stays
+    # open across the token request. A lease left by a crashed process
+    # expires after `lease` seconds; waiting longer than `timeout` for a lock
+    # raises LockTimeout.
+    def __init__(self, path, timeout=30, lease=60, poll_interval=0.05):
+        self.path = path
+        self.timeout = timeout
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS tokens ('
+            'key TEXT PRIMARY KEY, access_token TEXT, refresh_token TEXT, expires_at REAL)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, owner TEXT, expires_at REAL)')
+        conn.close()
+
+    def get(self, key):
+        row = self._execute(
+            'SELECT access_token, refresh_token, expires_at FROM tokens WHERE key = ?',
+            (key,)
+        ).fetchone()
+        if row is not None:
+            return {
+                'access_token': row[0],
+                'refresh_token': row[1],
+                'expires_at': row[2],
+            }
+
+    def set(self, key, record):
+        self._execute(
+            'INSERT OR REPLACE INTO tokens (key, access_token, refresh_token, expires_at) '
+            'VALUES (?, ?, ?, ?)',
+            (key, record['access_token'], record.get('refresh_token'), record.get('expires_at'))
+        )
+
+    def delete(self, key, access_token):
+        self._execute(
+            'DELETE FROM tokens WHERE key = ? AND access_token = ?',
+            (key, access_token)
+        )
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        owner = uuid.uuid4().hex
+        give_up = time.time() + self.timeout
+        delay = min(0.01, self.poll_interval)
+        while not self._try_lock(key, owner):
+            if time.time() + delay > give_up:
+                raise LockTimeout('timed out waiting for token store lock on %s' % key)
+            time.sleep(delay)
+            delay = min(delay * 2, self.poll_interval)
+        try:
+            yield
+        finally:
+            self._execute('DELETE FROM locks WHERE key = ? AND owner = ?', (key, owner))
+
+    def _try_lock(self, key, owner):
+        now = time.time()
+        self._execute('DELETE FROM locks WHERE key = ? AND expires_at <= ?', (key, now))
+        return self._execute(
+            'INSERT OR IGNORE INTO locks (key, owner, expires_at) VALUES (?, ?, ?)',
+            (key, owner, now + self.lease)
+        ).rowcount == 1
+
+    def _execute(self, sql, params):
+        try:
+            return self._connection().execute(sql, params)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e):
+                raise LockTimeout('token store busy: %s' % e)
+            raise
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def __getstate__(self):
+        return {'path': self.path, 'timeout': self.timeout, 'lease': self.lease,
+                'poll_interval': self.poll_interval}
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._local = threading.local()
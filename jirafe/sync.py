@@ -0,0 +1,231 @@
+import argparse
+import collections
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import JirafeClient
+from .pool import ConnectionPool
+from .session import Oauth2Session, UsernameSession
+
+ENTITY_TYPES = ('category', 'cart', 'order', 'product', 'customer', 'employee')
+
+def read_ndjson(f, offset=0):
+    f.seek(offset)
+    while True:
+        line = f.readline()
+        if not line:
+            return
+        offset += len(line)
+        if line.strip():
+            yield json.loads(line.decode('utf-8')), offset
+
+
+def read_csv(f, offset=0):
+    f.seek(0)
+    header = _read_csv_row(f)
+    if header is None:
+        return
+    if offset:
+        f.seek(offset)
+    else:
+        offset = f.tell()
+    while True:
+        row = _read_csv_row(f)
+        if row is None:
+            return
+        offset = f.tell()
+        if any(row):
+            yield _nest(dict(zip(header, row))), offset
+
+
+def _read_csv_row(f):
+    text = b''
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        text += line
+        if text.count(b'"') % 2 == 0:
+            break
+    if not text:
+        return None
+    return next(csv.reader(io.StringIO(text.decode('utf-8'))), [])
+
+
+def _nest(row):
+    record = {}
+    for key, value in row.items():
+        if value == '':
+            continue
+        target = record
+        parts = key.split('.')
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return record
+
+
+class Checkpoint(object):
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            return json.load(f)['offset']
+
+    def save(self, offset):
+        if self.path is None:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'offset': offset}, f)
+        os.replace(tmp, self.path)
+
+
+class BulkSync(object):
+    def __init__(self, client, session, entity_type, concurrency=8,
+                 checkpoint=None, checkpoint_every=1000, progress=None, progress_interval=5, errors=None):
+        self.send = getattr(client, '%s_change' % entity_type)
+        self.session = session
+        self.concurrency = concurrency
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.checkpoint_every = checkpoint_every
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.errors = errors
+        self.sent = 0
+        self.failed = 0
+        self.offset = 0
+        self._lock = threading.Lock()
+
+    def run(self, records):
+        window = collections.deque()
+        started = time.time()
+        last_report = started
+        since_checkpoint = 0
+
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            for record, offset in records:
+                window.append((executor.submit(self._send, record, offset), offset))
+                if len(window) >= self.concurrency * 2:
+                    window[0][0].result()
+                while window and window[0][0].done():
+                    self.offset = window.popleft()[1]
+                    since_checkpoint += 1
+                if since_checkpoint >= self.checkpoint_every:
+                    self.checkpoint.save(self.offset)
+                    since_checkpoint = 0
+                if self.progress is not None and time.time() - last_report >= self.progress_interval:
+                    self._report(started)
+                    last_report = time.time()
+
+            while window:
+                window[0][0].result()
+                self.offset = window.popleft()[1]
+
+        self.checkpoint.save(self.offset)
+        if self.progress is not None:
+            self._report(started)
+        return self.failed == 0
+
+    def _send(self, record, offset):
+        try:
+            result = self.send(self.session, record)
+        except Exception as e:
+            result = {
+                'success': False,
+                'error_type': 'exception',
+                'message': str(e)
+            }
+        with self._lock:
+            if result.get('success'):
+                self.sent += 1
+                return
+            self.failed += 1
+            if self.errors is not None:
+                self.errors.write(json.dumps({'offset': offset, 'record': record, 'result': result}) + '\n')
+
+    def _report(self, started):
+        elapsed = time.time() - started
+        rate = (self.sent + self.failed) / elapsed if elapsed else 0
+        self.progress.write('sent=%d failed=%d offset=%d elapsed=%.1fs rate=%.1f/s\n' % (
+            self.sent, self.failed, self.offset, elapsed, rate))
+        self.progress.flush()
+
+
+def make_session(args, requests):
+    kwargs = {'requests': requests}
+    if args.token_url:
+        kwargs['token_url'] = args.token_url
+    if args.username:
+        return UsernameSession(args.site_id, args.username, args.password,
+                               args.client_id, args.client_secret, **kwargs)
+    return Oauth2Session(args.site_id, args.client_id, args.client_secret,
+                         refresh_token=args.refresh_token, access_token=args.access_token, **kwargs)
+
+
+def parse_args(argv):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(prog='jirafe-sync',
+                                     description='Stream an NDJSON or CSV export to the Jirafe API')
+    parser.add_argument('entity_type', choices=ENTITY_TYPES)
+    parser.add_argument('path', help='NDJSON or CSV file; CSV columns may use dotted names like catalog.id')
+    parser.add_argument('--format', choices=('ndjson', 'csv'),
+                        help='defaults to csv for .csv files and ndjson otherwise')
+    parser.add_argument('--site-id', default=env('JIRAFE_SITE_ID'))
+    parser.add_argument('--client-id', default=env('JIRAFE_CLIENT_ID'))
+    parser.add_argument('--client-secret', default=env('JIRAFE_CLIENT_SECRET'))
+    parser.add_argument('--username', default=env('JIRAFE_USERNAME'))
+    parser.add_argument('--password', default=env('JIRAFE_PASSWORD'))
+    parser.add_argument('--refresh-token', default=env('JIRAFE_REFRESH_TOKEN'))
+    parser.add_argument('--access-token', default=env('JIRAFE_ACCESS_TOKEN'))
+    parser.add_argument('--api-url', default=env('JIRAFE_API_URL', 'https://api.jirafe.com/'))
+    parser.add_argument('--token-url', default=env('JIRAFE_TOKEN_URL'))
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight')
+    parser.add_argument('--checkpoint', help='file recording the byte offset to resume from')
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help='records between checkpoint writes')
+    parser.add_argument('--errors', help='append rejected records to this NDJSON file')
+    parser.add_argument('--progress-interval', type=float, default=5, help='seconds between progress lines')
+    args = parser.parse_args(argv)
+    if not args.site_id or not args.client_id or not args.client_secret:
+        parser.error('--site-id, --client-id and --client-secret are required')
+    if args.format is None:
+        args.format = 'csv' if args.path.lower().endswith('.csv') else 'ndjson'
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    checkpoint = Checkpoint(args.checkpoint)
+    reader = read_csv if args.format == 'csv' else read_ndjson
+
+    pool = ConnectionPool(pool_maxsize=args.concurrency)
+    client = JirafeClient(args.api_url, requests=pool)
+    errors = open(args.errors, 'a') if args.errors else None
+    try:
+        with open(args.path, 'rb') as f:
+            sync = BulkSync(client, make_session(args, pool), args.entity_type,
+                            concurrency=args.concurrency,
+                            checkpoint=checkpoint,
+                            checkpoint_every=args.checkpoint_every,
+                            progress=sys.stderr,
+                            progress_interval=args.progress_interval,
+                            errors=errors)
+            ok = sync.run(reader(f, checkpoint.load()))
+    finally:
+        client.close()
+        if errors is not None:
+            errors.close()
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import contextlib
+import contextvars
+import time
+
+import requests
+
+DEFAULT_TIMEOUT = (5, 30)
+
+# Absolute deadline of the client call in progress, when it was started
+# before the request itself (e.g. ahead of a coalescing window).
+call_deadline = contextvars.ContextVar('jirafe_call_deadline', default=None)
+
+class LocalTimeout(requests.exceptions.Timeout):
+    # Gave up waiting on something local, before anything reached the API.
+    pass
+
+
+class DeadlineExceeded(LocalTimeout):
+    pass
+
+
+class LockTimeout(LocalTimeout):
+    pass
+
+
+def remaining_timeout(timeout, deadline):
+    # Clamp a requests (connect, read) timeout to what is left before the
+    # deadline; raises DeadlineExceeded once it has passed.
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise DeadlineExceeded('deadline exceeded')
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return min(timeout, remaining)
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds):
+    if seconds is None:
+        yield
+        return
+    deadline = time.time() + seconds
+    outer = call_deadline.get()
+    reset = call_deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        call_deadline.reset(reset)
@@ -0,0 +1,145 @@
+import contextlib
+import contextvars
+import random
+import re
+import time
+
+TRACEPARENT = 'traceparent'
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current = contextvars.ContextVar('jirafe_span', default=None)
+
+def _new_id(bits):
+    return '%0*x' % (bits // 4, random.getrandbits(bits) or 1)
+
+
+class SpanContext(object):
+    # The part of a span that crosses process boundaries, carried in a W3C
+    # `traceparent` header.
+    def __init__(self, trace_id, span_id, sampled=True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def to_header(self):
+        return '00-%s-%s-%s' % (self.trace_id, self.span_id, '01' if self.sampled else '00')
+
+    @classmethod
+    def from_header(cls, value):
+        match = _TRACEPARENT_RE.match(value.strip().lower()) if value else None
+        if match is None:
+            return None
+        trace_id, span_id, flags = match.groups()
+        return cls(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+class Span(object):
+    def __init__(self, tracer, name, context, parent_id=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.timings = {}
+        self.start_time = time.time()
+        self.end_time = None
+        self._started = time.perf_counter()
+        self._reset = None
+
+    @property
+    def duration(self):
+        return self.timings.get('total')
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def increment(self, key, value=1):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def add_timing(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0) + seconds
+
+    @contextlib.contextmanager
+    def timing(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.perf_counter() - started)
+
+    def finish(self):
+        if self.end_time is not None:
+            return
+        self.timings['total'] = time.perf_counter() - self._started
+        self.end_time = time.time()
+        self.tracer.export(self)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.context.trace_id,
+            'span_id': self.context.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'attributes': dict(self.attributes),
+            'timings': dict(self.timings),
+        }
+
+    def __enter__(self):
+        self._reset = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._reset)
+        if exc is not None:
+            self.attributes.setdefault('error_type', 'exception')
+            self.attributes['error'] = repr(exc)
+        self.finish()
+
+
+class Tracer(object):
+    # Spans are handed to `exporter` (any callable taking a Span) when they
+    # finish; subclass and override `export` to plug in another backend.
+    # The span entered with `with` is current for its thread or asyncio
+    # task, so spans started inside it become its children.
+    def __init__(self, exporter=None, propagate=True):
+        self.exporter = exporter
+        self.propagate = propagate
+
+    def start_span(self, name, parent=None, **attributes):
+        if parent is None:
+            parent = _current.get()
+        if parent is None:
+            context = SpanContext(_new_id(128), _new_id(64))
+            return Span(self, name, context, None, attributes)
+        parent = getattr(parent, 'context', parent)
+        context = SpanContext(parent.trace_id, _new_id(64), parent.sampled)
+        return Span(self, name, context, parent.span_id, attributes)
+
+    def current(self):
+        return _current.get()
+
+    @contextlib.contextmanager
+    def activate(self, context):
+        # Makes an extracted SpanContext (or a Span) the parent of the spans
+        # started inside the block.
+        reset = _current.set(context)
+        try:
+            yield context
+        finally:
+            _current.reset(reset)
+
+    def inject(self, headers, span=None):
+        if span is None:
+            span = _current.get()
+        if span is None or not self.propagate:
+            return headers
+        return dict(headers or {}, **{TRACEPARENT: getattr(span, 'context', span).to_header()})
+
+    def extract(self, headers):
+        return SpanContext.from_header(headers.get(TRACEPARENT))
+
+    def export(self, span):
+        if self.exporter is not None:
+            self.exporter(span)
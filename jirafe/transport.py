@@ -0,0 +1,90 @@
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+class Transport(object):
+    # Clients and sessions send every HTTP call through a transport. `get`,
+    # `put` and `post` take the same keyword arguments as their `requests`
+    # counterparts and return an object with `status_code`, `headers`,
+    # `text` and `json()`; failures raise `requests.exceptions` errors.
+    def get(self, url, params=None, headers=None, timeout=None):
+        raise NotImplementedError
+
+    def put(self, url, data=None, headers=None, timeout=None):
+        raise NotImplementedError
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RequestsTransport(Transport):
+    def __init__(self, requests=requests):
+        self.requests = requests
+
+    def get(self, url, **kwargs):
+        return self.requests.get(url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.requests.put(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.requests.post(url, **kwargs)
+
+    def close(self):
+        close = getattr(self.requests, 'close', None)
+        if close is not None:
+            close()
+
+
+class HTTP2Transport(Transport):
+    def __init__(self, max_connections=10, keepalive_expiry=30, http1=True, verify=True, client=None):
+        if client is None:
+            if httpx is None:
+                raise ImportError('httpx with the http2 extra is required for HTTP2Transport')
+            client = httpx.Client(
+                http1=http1,
+                http2=True,
+                verify=verify,
+                limits=httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_connections,
+                                    keepalive_expiry=keepalive_expiry),
+            )
+        self.client = client
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        return self._send('GET', url, timeout, params=params, headers=headers)
+
+    def put(self, url, data=None, headers=None, timeout=None):
+        return self._send('PUT', url, timeout, content=data, headers=headers)
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        return self._send('POST', url, timeout, data=data, headers=headers)
+
+    def close(self):
+        self.client.close()
+
+    def _send(self, method, url, timeout, **kwargs):
+        try:
+            return self.client.request(method, url, timeout=self._timeout(timeout), **kwargs)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e))
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+
+    def _timeout(self, timeout):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return httpx.Timeout(connect=connect, read=read, write=read, pool=connect)
+        return httpx.Timeout(timeout)
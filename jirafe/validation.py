@@ -0,0 +1,271 @@
+import numbers
+import re
+
+REQUIRED = 'This field is required.'
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?)?$')
+
+class _Optional(object):
+    def __init__(self, spec):
+        self.spec = spec
+
+
+def optional(spec):
+    return _Optional(spec)
+
+
+def _is_id(value):
+    return isinstance(value, (str, int)) and not isinstance(value, bool) and value != ''
+
+def _is_string(value):
+    return isinstance(value, str)
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+def _is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_boolean(value):
+    return isinstance(value, bool)
+
+def _is_date(value):
+    return isinstance(value, str) and DATE_PATTERN.match(value) is not None
+
+def _is_any(value):
+    return True
+
+# Each type has the exact value types that always pass, checked first as the
+# cheap common case, a full test and the error message.
+TYPES = {
+    'id': ((int,), _is_id, 'A valid id is required.'),
+    'string': ((str,), _is_string, 'Not a valid string.'),
+    'number': ((int, float), _is_number, 'A valid number is required.'),
+    'integer': ((int,), _is_integer, 'A valid integer is required.'),
+    'boolean': ((bool,), _is_boolean, 'Must be a valid boolean.'),
+    'date': ((), _is_date, 'Datetime has wrong format.'),
+    'any': ((), _is_any, None),
+}
+
+# Schemas map field names to a type name from TYPES (a trailing '?' makes the
+# field optional), a tuple of allowed values, a nested schema dict or a one
+# item list describing each element. Fields not in a schema are not checked.
+CATALOG = {
+    'id': 'id',
+    'name': 'string?',
+}
+
+CATEGORY = {
+    'id': 'id',
+    'name': 'string',
+    'create_date': 'date',
+    'change_date': 'date',
+}
+
+PRODUCT = {
+    'id': 'id',
+    'name': 'string',
+    'create_date': 'date',
+    'change_date': 'date',
+    'code': 'string?',
+    'is_product': 'boolean?',
+    'is_sku': 'boolean?',
+    'is_order_item': 'boolean?',
+    'catalog': optional(CATALOG),
+    'categories': optional([{'id': 'id', 'name': 'string?'}]),
+    'images': optional([{'url': 'string'}]),
+    'attributes': optional([{'name': 'string', 'value': 'any'}]),
+}
+
+CUSTOMER = {
+    'id': 'id',
+    'create_date': 'date',
+    'change_date': 'date',
+    'email': 'string',
+    'first_name': 'string?',
+    'last_name': 'string?',
+}
+
+EMPLOYEE = {
+    'id': 'id',
+    'create_date': 'date',
+    'change_date': 'date',
+    'email': 'string?',
+    'first_name': 'string?',
+    'last_name': 'string?',
+}
+
+TOTALS = {
+    'subtotal': 'number',
+    'total': 'number',
+    'total_tax': 'number?',
+    'total_shipping': 'number?',
+    'total_payment_cost': 'number?',
+    'total_discounts': 'number?',
+    'currency': 'string?',
+}
+
+CART_ITEM = {
+    'id': 'id',
+    'create_date': 'date',
+    'change_date': 'date',
+    'cart_item_number': 'id?',
+    'quantity': 'number',
+    'price': 'number',
+    'discount_price': 'number?',
+    'product': {'id': 'id'},
+}
+
+CART = dict(TOTALS, **{
+    'id': 'id',
+    'create_date': 'date',
+    'change_date': 'date',
+    'items': [CART_ITEM],
+    'customer': optional({'id': 'id'}),
+})
+
+ORDER_ITEM = dict(CART_ITEM, **{
+    'cart_item_number': None,
+    'order_item_number': 'id?',
+})
+
+ORDER = dict(TOTALS, **{
+    'id': 'id',
+    'order_number': 'id?',
+    'status': ('placed', 'accepted', 'cancelled'),
+    'order_date': 'date',
+    'create_date': 'date',
+    'change_date': 'date',
+    'items': [ORDER_ITEM],
+    'customer': optional({'id': 'id'}),
+})
+
+
+class Validator(object):
+    def __init__(self, schema):
+        self.schema = schema
+        self._check = _compile_object(schema)
+
+    def validate(self, data):
+        if isinstance(data, (str, bytes)):
+            return {}
+        errors = {}
+        self._check(data, None, errors)
+        return errors
+
+
+class Validators(object):
+    DEFAULTS = {
+        'category': CATEGORY,
+        'cart': CART,
+        'order': ORDER,
+        'product': PRODUCT,
+        'customer': CUSTOMER,
+        'employee': EMPLOYEE,
+    }
+
+    def __init__(self, schemas=None):
+        self.validators = dict(DEFAULT_VALIDATORS)
+        for path, schema in (schemas or {}).items():
+            if schema is None or isinstance(schema, Validator):
+                self.validators[path] = schema
+            else:
+                self.validators[path] = Validator(schema)
+
+    def get(self, path):
+        return self.validators.get(path)
+
+    def validate(self, path, data):
+        validator = self.validators.get(path)
+        if validator is None:
+            return {}
+        return validator.validate(data)
+
+
+def _compile(spec):
+    if isinstance(spec, dict):
+        return _compile_object(spec)
+    if isinstance(spec, list):
+        return _compile_list(spec[0])
+    if isinstance(spec, tuple):
+        return _compile_choice(spec)
+    return _compile_type(spec)
+
+
+def _compile_object(schema):
+    fields = []
+    for name, spec in sorted(schema.items()):
+        if spec is None:
+            continue
+        required = True
+        if isinstance(spec, _Optional):
+            spec = spec.spec
+            required = False
+        elif isinstance(spec, str) and spec.endswith('?'):
+            spec = spec[:-1]
+            required = False
+        fields.append((name, required, None if spec == 'any' else _compile(spec)))
+
+    def check(value, key, errors):
+        if not isinstance(value, dict):
+            errors[_format_key(key)] = 'Expected an object.'
+            return
+        for name, required, check_field in fields:
+            field = value.get(name)
+            if field is None:
+                if required:
+                    errors[_format_key((key, name))] = REQUIRED
+            elif check_field is not None:
+                check_field(field, (key, name), errors)
+    return check
+
+
+def _compile_list(spec):
+    check_item = _compile(spec)
+
+    def check(value, key, errors):
+        if not isinstance(value, list):
+            errors[_format_key(key)] = 'Expected a list of items.'
+            return
+        for i, item in enumerate(value):
+            check_item(item, (key, i), errors)
+    return check
+
+
+def _compile_choice(choices):
+    choices = frozenset(choices)
+
+    def check(value, key, errors):
+        try:
+            valid = value in choices
+        except TypeError:
+            valid = False
+        if not valid:
+            errors[_format_key(key)] = '"%s" is not a valid choice.' % (value,)
+    return check
+
+
+def _compile_type(name):
+    if name not in TYPES:
+        raise ValueError('%s is not a supported field type' % name)
+    exact, test, message = TYPES[name]
+    exact = frozenset(exact)
+
+    def check(value, key, errors):
+        if type(value) not in exact and not test(value):
+            errors[_format_key(key)] = message
+    return check
+
+
+# Keys are built as (parent, name) pairs while checking, so that nothing is
+# formatted unless a field is actually invalid.
+def _format_key(key):
+    if key is None:
+        return 'non_field_errors'
+    parts = []
+    while key is not None:
+        key, name = key
+        parts.append(str(name))
+    return '.'.join(reversed(parts))
+
+
+DEFAULT_VALIDATORS = dict((path, Validator(schema)) for path, schema in Validators.DEFAULTS.items())
@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 
 setup(
     name="jirafe-python-client",
@@ -9,4 +9,13 @@ setup(
     description="Client library for the Jirafe api",
     long_description=open("README.md").read(),
     install_requires=['requests'],
+    extras_require={
+        'async': ['aiohttp'],
+        'http2': ['httpx[http2]'],
+    },
+    entry_points={
+        'console_scripts': [
+            'jirafe-sync = jirafe.sync:main',
+        ],
+    },
 )
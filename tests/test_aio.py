@@ -0,0 +1,229 @@
+from mock import AsyncMock, MagicMock, Mock, call
+import asyncio
+import threading
+import time
+import unittest
+from mock import patch
+from jirafe import AdaptiveConcurrency, AsyncJirafeClient, CircuitBreaker, Priorities, RetryPolicy, UsernameSession
+
+def mock_response(status, text=''):
+    response = MagicMock()
+    response.status = status
+    response.text = AsyncMock(return_value=text)
+    context = MagicMock()
+    context.__aenter__.return_value = response
+    return context
+
+class TestAsyncJirafeClient(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.http = MagicMock()
+        self.client = AsyncJirafeClient(http_session=self.http)
+        self.session = Mock()
+        self.session.site_id = 'id'
+        self.session.access_token = 'token'
+        self.session.format_header = Mock(return_value='some header')
+
+    def test_constructor_defaults(self):
+        client = AsyncJirafeClient()
+        self.assertEqual('https://api.jirafe.com/', client.api_url)
+        self.assertIsNone(client.http_session)
+        self.assertEqual(10, client.limit_per_site)
+
+    def test_concurrency_not_supported(self):
+        self.assertRaises(TypeError, AsyncJirafeClient, concurrency=AdaptiveConcurrency())
+
+    async def test_happy_put(self):
+        self.http.put = MagicMock(return_value=mock_response(200))
+
+        result = await self.client.product_change(self.session, {'bar': 'baz'})
+
+        self.assertEqual({'success': True}, result)
+        self.http.put.assert_called_once_with('https://api.jirafe.com/v1/id/product',
+                                              data='{"bar":"baz"}', headers='some header')
+
+    async def test_put_validation_error(self):
+        self.http.put = MagicMock(return_value=mock_response(400, '{"errors":{"id":"required"}}'))
+
+        result = await self.client.order_change(self.session, {})
+
+        self.assertEqual({'success': False, 'error_type': 'validation', 'errors': {'id': 'required'}}, result)
+
+    async def test_put_authorization_error(self):
+        self.http.put = MagicMock(return_value=mock_response(403))
+
+        result = await self.client.order_change(self.session, '{}')
+
+        self.assertEqual({'success': False, 'error_type': 'authorization'}, result)
+        self.assertEqual(2, self.http.put.call_count)
+        self.session.invalidate.assert_called_once()
+
+    async def test_put_unknown(self):
+        self.http.put = MagicMock(return_value=mock_response(503, 'down'))
+
+        result = await self.client.order_change(self.session, '{}')
+
+        self.assertEqual({'success': False, 'error_type': 'unknown', 'raw': 'down'}, result)
+
+    async def test_site_check(self):
+        self.http.get = MagicMock(return_value=mock_response(200))
+
+        self.assertEqual({'success': True}, await self.client.site_check(self.session))
+        self.http.get.assert_called_once_with('https://api.jirafe.com/v1/id/site_check',
+                                              params='{}', headers='some header')
+
+    async def test_token_fetched_in_executor(self):
+        self.session.has_valid_token = Mock(return_value=False)
+        self.http.put = MagicMock(return_value=mock_response(200))
+
+        await self.client.order_change(self.session, '{}')
+
+        self.session.update_token.assert_called_once_with()
+
+    async def test_failed_token_fetch_stays_off_loop(self):
+        threads = []
+        transport = Mock()
+        transport.post = Mock(side_effect=lambda *a, **kw: threads.append(threading.current_thread()) or Mock(status_code=500))
+        session = UsernameSession('id', 'u', 'p', 'c', 's', transport=transport)
+        self.http.put = MagicMock(return_value=mock_response(200))
+
+        await self.client.order_change(session, '{}')
+
+        self.assertEqual(1, len(threads))
+        self.assertIsNot(threading.main_thread(), threads[0])
+        self.assertEqual({'Authorization': 'Bearer None'}, self.http.put.call_args[1]['headers'])
+
+    async def test_token_refreshed_ahead(self):
+        transport = Mock()
+        transport.post.return_value = Mock(status_code=200, json=Mock(return_value={'access_token': 'new', 'expires_in': 3600}))
+        session = UsernameSession('id', 'u', 'p', 'c', 's', transport=transport, refresh_margin=60)
+        session.access_token = 'old'
+        session.expires_at = time.time() + 30
+        self.http.put = MagicMock(return_value=mock_response(200))
+
+        await self.client.order_change(session, '{}')
+        for _ in range(100):
+            if session.access_token == 'new':
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertEqual({'Authorization': 'Bearer old'}, self.http.put.call_args[1]['headers'])
+        self.assertEqual('new', session.access_token)
+        transport.post.assert_called_once()
+
+    async def test_put_batch(self):
+        self.client.batch_size = 1
+        self.http.put = MagicMock(side_effect=[
+            mock_response(200, '{"product":[{"success":true}]}'),
+            mock_response(200, '{"product":[{"success":false,"errors":{"id":"required"}}]}'),
+        ])
+
+        results = await self.client.product_changes(self.session, [{'id': 1}, {}])
+
+        self.assertEqual([
+            {'success': True},
+            {'success': False, 'error_type': 'validation', 'errors': {'id': 'required'}},
+        ], results)
+
+    async def test_limit_per_site(self):
+        self.client.limit_per_site = 2
+        active = []
+        peak = []
+
+        async def text():
+            active.append(1)
+            peak.append(len(active))
+            await asyncio.sleep(0.01)
+            active.pop()
+            return ''
+
+        def put(url, **options):
+            context = mock_response(200)
+            context.__aenter__.return_value.text = text
+            return context
+        self.http.put = put
+
+        await asyncio.gather(*[self.client.cart_change(self.session, '{}') for _ in range(6)])
+
+        self.assertEqual(2, max(peak))
+
+    async def test_priorities(self):
+        self.client.limit_per_site = 1
+        self.client.priorities = Priorities()
+        sent = []
+
+        async def text():
+            await asyncio.sleep(0.01)
+            return ''
+
+        def put(url, **options):
+            sent.append(url.rsplit('/', 1)[1])
+            context = mock_response(200)
+            context.__aenter__.return_value.text = text
+            return context
+        self.http.put = put
+
+        await asyncio.gather(*[
+            self.client.product_change(self.session, '{}'),
+            self.client.category_change(self.session, '{}'),
+            self.client.cart_change(self.session, '{}'),
+            self.client.order_change(self.session, '{}'),
+        ])
+
+        self.assertEqual(['product', 'order', 'cart', 'category'], sent)
+
+    async def test_deadline(self):
+        self.client.deadline = 0.05
+
+        async def text():
+            await asyncio.sleep(1)
+            return ''
+
+        def put(url, **options):
+            context = mock_response(200)
+            context.__aenter__.return_value.text = text
+            return context
+        self.http.put = put
+
+        result = await self.client.order_change(self.session, '{}')
+
+        self.assertEqual({'success': False, 'error_type': 'timeout', 'message': 'deadline exceeded'}, result)
+
+    async def test_timeout_error(self):
+        self.http.put = MagicMock(side_effect=asyncio.TimeoutError())
+
+        result = await self.client.order_change(self.session, '{}')
+
+        self.assertEqual('timeout', result['error_type'])
+
+    async def test_close(self):
+        self.http.close = AsyncMock()
+        async with self.client:
+            pass
+        self.http.close.assert_awaited_once()
+        self.assertIsNone(self.client.http_session)
+
+    async def test_retry_policy(self):
+        self.client.retry_policy = RetryPolicy(jitter=False)
+        self.http.put = MagicMock(side_effect=[mock_response(503), mock_response(200)])
+
+        with patch('jirafe.aio.asyncio.sleep', AsyncMock()) as sleep:
+            result = await self.client.order_change(self.session, '{}')
+
+        self.assertEqual({'success': True}, result)
+        sleep.assert_awaited_once_with(0.5)
+
+    async def test_circuit_breaker(self):
+        self.client.circuit_breaker = CircuitBreaker(failure_threshold=1)
+        self.client.circuit_breaker.record_failure('id')
+
+        result = await self.client.order_change(self.session, '{}')
+
+        self.assertEqual('circuit_open', result['error_type'])
+
+    async def test_circuit_half_open_authorization_retry(self):
+        self.client.circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        self.client.circuit_breaker.record_failure('id')
+        self.http.put = MagicMock(side_effect=[mock_response(403), mock_response(200)])
+
+        self.assertEqual({'success': True}, await self.client.order_change(self.session, '{}'))
+        self.assertEqual('closed', self.client.circuit_breaker.get_state('id'))
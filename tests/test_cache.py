@@ -0,0 +1,55 @@
+from mock import patch
+import pickle
+import unittest
+from jirafe import ProfileCache
+
+class TestProfileCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ProfileCache(ttl=60)
+        self.profile = {'sites': [{'id': 1, 'name': 'one'}, {'id': '2', 'name': 'two'}]}
+
+    def test_get_missing(self):
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_set_get(self):
+        self.cache.set('key', self.profile)
+        self.assertIs(self.profile, self.cache.get('key'))
+
+    def test_ttl(self):
+        with patch('jirafe.cache.time.time', return_value=1000):
+            self.cache.set('key', self.profile)
+        with patch('jirafe.cache.time.time', return_value=1059):
+            self.assertIs(self.profile, self.cache.get('key'))
+        with patch('jirafe.cache.time.time', return_value=1060):
+            self.assertIsNone(self.cache.get('key'))
+        self.assertNotIn('key', self.cache.entries)
+
+    def test_no_ttl(self):
+        cache = ProfileCache()
+        with patch('jirafe.cache.time.time', return_value=0):
+            cache.set('key', self.profile)
+        self.assertIs(self.profile, cache.get('key'))
+
+    def test_invalidate(self):
+        self.cache.set('a', self.profile)
+        self.cache.set('b', self.profile)
+        self.cache.invalidate('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIs(self.profile, self.cache.get('b'))
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get('b'))
+
+    def test_get_site_index_cached(self):
+        self.cache.set('key', self.profile)
+        index = self.cache.get_site_index('key', self.profile)
+        self.assertEqual({'1': self.profile['sites'][0], '2': self.profile['sites'][1]}, index)
+        self.assertIs(index, self.cache.get_site_index('key', self.profile))
+
+    def test_get_site_index_uncached_profile(self):
+        self.assertEqual({}, self.cache.get_site_index('key', {'sites': []}))
+
+    def test_pickle(self):
+        self.cache.set('key', self.profile)
+        copy = pickle.loads(pickle.dumps(self.cache))
+        self.assertEqual(self.profile, copy.get('key'))
+        copy.invalidate()
@@ -1,7 +1,11 @@
 from mock import Mock, call
+import gzip
+import json
 import requests
+import threading
 import unittest
-from jirafe import JirafeClient
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from jirafe import JirafeClient, Validators
 
 class TestJirafeSession(unittest.TestCase):
     def setUp(self):
@@ -48,7 +52,8 @@ class TestJirafeSession(unittest.TestCase):
         session.get_header = Mock(return_value=auth_header)
         options = {
             "data": data_string,
-            "headers": auth_header
+            "headers": auth_header,
+            "timeout": (5, 30)
         }
         json_response = {'success': True}
         mock_response = Mock()
@@ -70,7 +75,8 @@ class TestJirafeSession(unittest.TestCase):
         session.get_header = Mock(return_value=auth_header)
         options = {
             "data": data_string,
-            "headers": auth_header
+            "headers": auth_header,
+            "timeout": (5, 30)
         }
 
         self.client._put(session, '', data)
@@ -87,7 +93,8 @@ class TestJirafeSession(unittest.TestCase):
         session.get_header = Mock(return_value=auth_header)
         options = {
             "data": data_string,
-            "headers": auth_header
+            "headers": auth_header,
+            "timeout": (5, 30)
         }
         errors = {
             'foo': 'foo error',
@@ -115,7 +122,8 @@ class TestJirafeSession(unittest.TestCase):
         session.get_header = Mock(return_value=auth_header)
         options = {
             "data": data_string,
-            "headers": auth_header
+            "headers": auth_header,
+            "timeout": (5, 30)
         }
         json_response = {'success': False, 'error_type': 'authorization'}
         mock_response = Mock()
@@ -138,7 +146,8 @@ class TestJirafeSession(unittest.TestCase):
         session.get_header = Mock(return_value=auth_header)
         options = {
             "data": data_string,
-            "headers": auth_header
+            "headers": auth_header,
+            "timeout": (5, 30)
         }
         json_response = {'success': False, 'error_type': 'unknown', 'raw': 'response text'}
         mock_response = Mock()
@@ -151,3 +160,250 @@ class TestJirafeSession(unittest.TestCase):
         self.requests.put.assert_called_once_with(url, **options)
         self.assertEqual(json_response, actual_response)
         session.invalidate.assert_called_once()
+
+class TestJirafeClientBatch(unittest.TestCase):
+    def setUp(self):
+        self.requests = Mock()
+        self.client = JirafeClient(requests=self.requests, batch_size=2)
+        self.session = Mock()
+        self.session.site_id = 'id'
+        self.session.get_header = Mock(return_value='some header')
+
+    def test_product_changes(self):
+        self.client._put_batch = Mock(return_value=[])
+        items = [{}]
+        self.assertEqual([], self.client.product_changes(self.session, items))
+        self.client._put_batch.assert_called_once_with(self.session, 'product', items)
+
+    def test_chunk_by_count(self):
+        chunks = list(self.client._chunk('order', [{'a': 1}, {'a': 2}, '{"a":3}']))
+        self.assertEqual([['{"a":1}', '{"a":2}'], ['{"a":3}']], chunks)
+
+    def test_chunk_by_bytes(self):
+        self.client.batch_size = 100
+        self.client.batch_max_bytes = 27
+        chunks = list(self.client._chunk('order', ['{"a":1}', '{"a":2}', '{"a":3}']))
+        self.assertEqual([['{"a":1}', '{"a":2}'], ['{"a":3}']], chunks)
+        self.assertEqual(27, len(self.client._batch_data('order', chunks[0])))
+
+    def test_chunk_by_utf8_bytes(self):
+        self.client.batch_size = 100
+        self.client.batch_max_bytes = 30
+        items = [u'{"n":"\u00e9\u00e9\u00e9"}', u'{"n":"\u00e9\u00e9\u00e9"}']
+        chunks = list(self.client._chunk('product', items))
+        self.assertEqual([[items[0]], [items[1]]], chunks)
+        for chunk in chunks:
+            self.assertTrue(len(self.client._batch_data('product', chunk).encode('utf-8')) <= 30)
+
+    def test_put_batch(self):
+        first = Mock()
+        first.status_code = 200
+        first.json = Mock(return_value={'order': [{'success': True}, {'success': False, 'errors': {'id': 'required'}}]})
+        second = Mock()
+        second.status_code = 200
+        second.json = Mock(return_value={'order': [{'success': True}]})
+        self.requests.put = Mock(side_effect=[first, second])
+
+        results = self.client.order_changes(self.session, iter([{'id': 1}, {}, {'id': 3}]))
+
+        self.assertEqual([
+            {'success': True},
+            {'success': False, 'error_type': 'validation', 'errors': {'id': 'required'}},
+            {'success': True},
+        ], results)
+        self.requests.put.assert_has_calls([
+            call('https://api.jirafe.com/v1/id/batch', data='{"order":[{"id":1},{}]}', headers='some header', timeout=(5, 30)),
+            call('https://api.jirafe.com/v1/id/batch', data='{"order":[{"id":3}]}', headers='some header', timeout=(5, 30)),
+        ])
+
+    def test_put_batch_failure_applies_to_chunk(self):
+        response = Mock()
+        response.status_code = 503
+        response.text = 'down'
+        self.requests.put = Mock(return_value=response)
+
+        results = self.client.order_changes(self.session, [{}, {}])
+
+        expected = {'success': False, 'error_type': 'unknown', 'raw': 'down'}
+        self.assertEqual([expected, expected], results)
+
+    def test_validators_reject_before_sending(self):
+        self.client.validators = Validators({'order': {'id': 'id'}})
+        self.requests.put = Mock()
+
+        result = self.client.order_change(self.session, {'name': 'no id'})
+
+        self.assertEqual({'success': False, 'error_type': 'validation', 'errors': {'id': 'This field is required.'}}, result)
+        self.assertFalse(self.requests.put.called)
+
+    def test_validators_skip_strings(self):
+        self.client.validators = Validators({'order': {'id': 'id'}})
+        response = Mock()
+        response.status_code = 200
+        self.requests.put = Mock(return_value=response)
+
+        self.assertEqual({'success': True}, self.client.order_change(self.session, '{}'))
+
+    def test_put_batch_validators(self):
+        self.client.validators = Validators({'order': {'id': 'id'}})
+        response = Mock()
+        response.status_code = 200
+        response.json = Mock(return_value={'order': [{'success': True}, {'success': True}]})
+        self.requests.put = Mock(return_value=response)
+
+        results = self.client.order_changes(self.session, [{'id': 1}, {}, {'id': 3}])
+
+        self.assertEqual([
+            {'success': True},
+            {'success': False, 'error_type': 'validation', 'errors': {'id': 'This field is required.'}},
+            {'success': True},
+        ], results)
+        self.requests.put.assert_called_once_with('https://api.jirafe.com/v1/id/batch',
+                                                  data='{"order":[{"id":1},{"id":3}]}', headers='some header', timeout=(5, 30))
+
+    def test_put_batch_authorization_retry(self):
+        denied = Mock()
+        denied.status_code = 403
+        ok = Mock()
+        ok.status_code = 200
+        ok.json = Mock(return_value={'cart': [{'success': True}]})
+        self.requests.put = Mock(side_effect=[denied, ok])
+
+        self.assertEqual([{'success': True}], self.client.cart_changes(self.session, [{}]))
+        self.session.invalidate.assert_called_once()
+
+class TestJirafeClientEncoding(unittest.TestCase):
+    def setUp(self):
+        self.requests = Mock()
+        self.session = Mock()
+        self.session.site_id = 'id'
+        self.session.get_header = Mock(return_value='some header')
+
+    def test_custom_dumps(self):
+        dumps = Mock(return_value=b'{"bar":"baz"}')
+        client = JirafeClient(requests=self.requests, dumps=dumps)
+
+        client.product_change(self.session, {'bar': 'baz'})
+
+        dumps.assert_called_once_with({'bar': 'baz'})
+        self.requests.put.assert_called_once_with('https://api.jirafe.com/v1/id/product',
+                                                  data=b'{"bar":"baz"}', headers='some header', timeout=(5, 30))
+
+    def test_bytes_sent_as_is(self):
+        dumps = Mock()
+        client = JirafeClient(requests=self.requests, dumps=dumps)
+
+        client.order_change(self.session, b'{"id":1}')
+
+        self.assertFalse(dumps.called)
+        self.requests.put.assert_called_once_with('https://api.jirafe.com/v1/id/order',
+                                                  data=b'{"id":1}', headers='some header', timeout=(5, 30))
+
+    def test_retry_reuses_encoded_body(self):
+        dumps = Mock(return_value='{"id":1}')
+        client = JirafeClient(requests=self.requests, dumps=dumps)
+        denied = Mock()
+        denied.status_code = 403
+        ok = Mock()
+        ok.status_code = 200
+        self.requests.put = Mock(side_effect=[denied, ok])
+
+        self.assertEqual({'success': True}, client.order_change(self.session, {'id': 1}))
+        dumps.assert_called_once_with({'id': 1})
+        self.requests.put.assert_called_with('https://api.jirafe.com/v1/id/order',
+                                             data='{"id":1}', headers='some header', timeout=(5, 30))
+
+    def test_batch_mixes_bytes_and_str(self):
+        client = JirafeClient(requests=self.requests)
+        self.assertEqual(b'{"order":[{"id":1},{"id":2}]}', client._batch_data('order', [b'{"id":1}', '{"id":2}']))
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        self.server.received.append((self.path, self.headers.get('Content-Encoding'), json.loads(body)))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestJirafeClientCompression(unittest.TestCase):
+    def setUp(self):
+        self.session = Mock()
+        self.session.site_id = 'id'
+        self.session.get_header = Mock(return_value={'Authorization': 'Bearer token'})
+
+    def test_below_threshold(self):
+        r = Mock()
+        client = JirafeClient(requests=r, compress_threshold=100)
+
+        client.product_change(self.session, {'id': 1})
+
+        r.put.assert_called_once_with('https://api.jirafe.com/v1/id/product', data='{"id":1}',
+                                      headers={'Authorization': 'Bearer token'}, timeout=(5, 30))
+        self.assertEqual(1, client.compression_stats['uncompressed'])
+        self.assertEqual(0, client.compression_stats['compressed'])
+
+    def test_above_threshold(self):
+        r = Mock()
+        client = JirafeClient(requests=r, compress_threshold=10)
+        data = {'items': ['sku'] * 100}
+
+        client.product_change(self.session, data)
+
+        options = r.put.call_args[1]
+        self.assertEqual({'Authorization': 'Bearer token', 'Content-Encoding': 'gzip'}, options['headers'])
+        self.assertEqual(data, json.loads(gzip.decompress(options['data'])))
+        stats = client.compression_stats
+        self.assertEqual(1, stats['compressed'])
+        self.assertEqual(len(json.dumps(data, separators=(',',':'))), stats['raw_bytes'])
+        self.assertEqual(len(options['data']), stats['compressed_bytes'])
+
+    def test_retry_reuses_compressed_body(self):
+        r = Mock()
+        denied = Mock()
+        denied.status_code = 403
+        ok = Mock()
+        ok.status_code = 200
+        r.put = Mock(side_effect=[denied, ok])
+        client = JirafeClient(requests=r, compress_threshold=0)
+
+        self.assertEqual({'success': True}, client.order_change(self.session, {'id': 1}))
+
+        self.assertEqual(r.put.call_args_list[0], r.put.call_args_list[1])
+        self.assertEqual(1, client.compression_stats['compressed'])
+
+    def test_get_not_compressed(self):
+        r = Mock()
+        client = JirafeClient(requests=r, compress_threshold=0)
+
+        client.site_check(self.session)
+
+        r.get.assert_called_once_with('https://api.jirafe.com/v1/id/site_check', params='{}',
+                                      headers={'Authorization': 'Bearer token'}, timeout=(5, 30))
+
+    def test_local_server_decodes_body(self):
+        server = HTTPServer(('127.0.0.1', 0), RecordingHandler)
+        server.received = []
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            client = JirafeClient('http://127.0.0.1:%d/' % server.server_port, compress_threshold=50)
+            order = {'id': 1, 'items': [{'sku': 'sku-%d' % i, 'quantity': 1} for i in range(50)]}
+
+            self.assertEqual({'success': True}, client.order_change(self.session, order))
+            self.assertEqual({'success': True}, client.cart_change(self.session, {'id': 2}))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        self.assertEqual([
+            ('/v1/id/order', 'gzip', order),
+            ('/v1/id/cart', None, {'id': 2}),
+        ], server.received)
@@ -0,0 +1,102 @@
+from mock import Mock
+import asyncio
+import threading
+import time
+import unittest
+from jirafe import AsyncJirafeClient, Coalescer, JirafeClient
+
+class TestCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.coalescer = Coalescer(window=0.1)
+        self.send = Mock(return_value={'success': True})
+
+    def test_get_key(self):
+        self.assertEqual('id:cart:1', self.coalescer.get_key('id', 'cart', {'id': 1}))
+
+    def test_single_submit(self):
+        self.assertEqual({'success': True}, self.coalescer.submit('k', {'v': 1}, self.send))
+        self.send.assert_called_once_with({'v': 1})
+        self.assertEqual({}, self.coalescer.pending)
+
+    def test_last_write_wins(self):
+        results = {}
+
+        def submit(v):
+            results[v] = self.coalescer.submit('k', {'v': v}, self.send)
+
+        threads = [threading.Thread(target=submit, args=(v,)) for v in range(3)]
+        for t in threads:
+            t.start()
+            time.sleep(0.01)
+        for t in threads:
+            t.join(5)
+
+        self.send.assert_called_once_with({'v': 2})
+        self.assertEqual({'success': True}, results[2])
+        self.assertEqual({'success': True, 'coalesced': True}, results[0])
+        self.assertEqual({'success': True, 'coalesced': True}, results[1])
+        self.assertEqual(2, self.coalescer.coalesced)
+
+    def test_error_propagates(self):
+        self.send.side_effect = ValueError('boom')
+        self.assertRaises(ValueError, self.coalescer.submit, 'k', {}, self.send)
+        self.assertEqual({}, self.coalescer.pending)
+
+    def test_submit_async(self):
+        async def send(data):
+            return self.send(data)
+
+        async def run():
+            return await asyncio.gather(*[self.coalescer.submit_async('k', {'v': v}, send) for v in range(3)])
+
+        results = asyncio.run(run())
+
+        self.send.assert_called_once_with({'v': 2})
+        self.assertEqual([{'success': True, 'coalesced': True}, {'success': True, 'coalesced': True}, {'success': True}], results)
+
+
+class TestJirafeClientCoalescing(unittest.TestCase):
+    def setUp(self):
+        self.requests = Mock()
+        ok = Mock()
+        ok.status_code = 200
+        self.requests.put = Mock(return_value=ok)
+        self.client = JirafeClient(requests=self.requests, coalescer=Coalescer(window=0.1))
+        self.session = Mock()
+        self.session.site_id = 'id'
+        self.session.get_header = Mock(return_value='some header')
+
+    def test_coalesces_same_entity(self):
+        threads = [threading.Thread(target=self.client.cart_change, args=(self.session, {'id': 1, 'qty': q}))
+                   for q in range(3)]
+        threads.append(threading.Thread(target=self.client.cart_change, args=(self.session, {'id': 2})))
+        for t in threads:
+            t.start()
+            time.sleep(0.01)
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(2, self.requests.put.call_count)
+        self.requests.put.assert_any_call('https://api.jirafe.com/v1/id/cart', data='{"id":1,"qty":2}', headers='some header', timeout=(5, 30))
+        self.requests.put.assert_any_call('https://api.jirafe.com/v1/id/cart', data='{"id":2}', headers='some header', timeout=(5, 30))
+
+    def test_without_id_not_coalesced(self):
+        self.assertEqual({'success': True}, self.client.cart_change(self.session, '{"id":1}'))
+        self.requests.put.assert_called_once()
+
+    def test_async_client(self):
+        client = AsyncJirafeClient(http_session=Mock(), coalescer=Coalescer(window=0.05))
+        sent = []
+
+        async def put_change(session, path, data, retry=0):
+            sent.append(data)
+            return {'success': True}
+        client._put_change = put_change
+
+        async def run():
+            return await asyncio.gather(*[client.cart_change(self.session, {'id': 1, 'qty': q}) for q in range(3)])
+
+        results = asyncio.run(run())
+
+        self.assertEqual([{'id': 1, 'qty': 2}], sent)
+        self.assertEqual({'success': True}, results[2])
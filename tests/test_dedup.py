@@ -0,0 +1,122 @@
+from mock import Mock
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from jirafe import JirafeClient, MemoryChangeIndex, SQLiteChangeIndex
+
+class TestChangeIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = MemoryChangeIndex(max_entries=2, id_fields={'order': 'order_number'})
+
+    def test_get_key(self):
+        self.assertEqual('site:product:1', self.index.get_key('site', 'product', {'id': 1}))
+        self.assertEqual('site:order:A1', self.index.get_key('site', 'order', {'order_number': 'A1'}))
+        self.assertIsNone(self.index.get_key('site', 'product', {'name': 'no id'}))
+        self.assertIsNone(self.index.get_key('site', 'product', '{"id":1}'))
+
+    def test_get_digest_normalized(self):
+        a = self.index.get_digest({'id': 1, 'name': 'a', 'change_date': '2013-01-01'})
+        b = self.index.get_digest({'name': 'a', 'id': 1, 'change_date': '2013-02-01'})
+        c = self.index.get_digest({'id': 1, 'name': 'b'})
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_check(self):
+        key, digest = self.index.check('site', 'product', {'id': 1})
+        self.assertEqual('site:product:1', key)
+        self.index.set(key, digest)
+
+        self.assertEqual((key, None), self.index.check('site', 'product', {'id': 1}))
+        self.assertEqual(1, self.index.skipped)
+        self.assertIsNotNone(self.index.check('site', 'product', {'id': 1, 'name': 'new'})[1])
+
+    def test_lru_eviction(self):
+        self.index.set('a', '1')
+        self.index.set('b', '2')
+        self.index.get('a')
+        self.index.set('c', '3')
+        self.assertEqual(['a', 'c'], list(self.index.entries))
+
+
+class TestSQLiteChangeIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'changes.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_persistent(self):
+        SQLiteChangeIndex(self.path).set('key', 'digest')
+        self.assertEqual('digest', SQLiteChangeIndex(self.path).get('key'))
+        self.assertIsNone(SQLiteChangeIndex(self.path).get('missing'))
+
+    def test_eviction(self):
+        index = SQLiteChangeIndex(self.path, max_entries=2, evict_every=1)
+        for key in ('a', 'b', 'c'):
+            index.set(key, key)
+        self.assertEqual(2, len(index))
+        self.assertIsNone(index.get('a'))
+        self.assertEqual('c', index.get('c'))
+
+    def test_eviction_by_last_use(self):
+        index = SQLiteChangeIndex(self.path, max_entries=2, evict_every=100)
+        index.set('a', 'a')
+        index.set('b', 'b')
+        time.sleep(0.01)
+        self.assertEqual('a', index.get('a'))
+        index.set('c', 'c')
+        index.evict()
+        self.assertEqual('a', index.get('a'))
+        self.assertIsNone(index.get('b'))
+
+
+class TestJirafeClientDedup(unittest.TestCase):
+    def setUp(self):
+        self.requests = Mock()
+        ok = Mock()
+        ok.status_code = 200
+        ok.json = Mock(return_value={'product': [{'success': True}]})
+        self.requests.put = Mock(return_value=ok)
+        self.index = MemoryChangeIndex()
+        self.client = JirafeClient(requests=self.requests, change_index=self.index)
+        self.session = Mock()
+        self.session.site_id = 'id'
+
+    def test_skips_unchanged(self):
+        self.assertEqual({'success': True}, self.client.product_change(self.session, {'id': 1}))
+        self.assertEqual({'success': True, 'skipped': True}, self.client.product_change(self.session, {'id': 1}))
+        self.assertEqual({'success': True}, self.client.product_change(self.session, {'id': 1, 'name': 'n'}))
+        self.assertEqual(2, self.requests.put.call_count)
+        self.assertEqual(1, self.index.skipped)
+
+    def test_failed_send_not_recorded(self):
+        failed = Mock()
+        failed.status_code = 503
+        self.requests.put = Mock(return_value=failed)
+
+        self.client.customer_change(self.session, {'id': 1})
+        self.client.customer_change(self.session, {'id': 1})
+
+        self.assertEqual(2, self.requests.put.call_count)
+
+    def test_without_id_always_sent(self):
+        self.client.product_change(self.session, {'name': 'n'})
+        self.client.product_change(self.session, {'name': 'n'})
+        self.assertEqual(2, self.requests.put.call_count)
+
+    def test_batch_skips_unchanged(self):
+        self.client.product_changes(self.session, [{'id': 1}])
+
+        results = self.client.product_changes(self.session, [{'id': 1}, {'id': 2}])
+
+        self.assertEqual([{'success': True, 'skipped': True}, {'success': True}], results)
+        self.requests.put.assert_called_with('https://api.jirafe.com/v1/id/batch',
+                                             data='{"product":[{"id":2}]}', headers=self.session.get_header(), timeout=(5, 30))
+
+    def test_batch_all_unchanged(self):
+        self.client.product_changes(self.session, [{'id': 1}])
+        self.assertEqual([{'success': True, 'skipped': True}], self.client.product_changes(self.session, [{'id': 1}]))
+        self.requests.put.assert_called_once()
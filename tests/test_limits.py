@@ -0,0 +1,139 @@
+from mock import Mock, patch
+import threading
+import time
+import unittest
+import requests
+from jirafe import AdaptiveConcurrency, JirafeClient, RateLimiter, RetryPolicy, TokenBucket
+
+class TestTokenBucket(unittest.TestCase):
+    @patch('jirafe.limits.time.time', return_value=100.0)
+    def test_reserve(self, now):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual(0, bucket.reserve())
+        self.assertEqual(0, bucket.reserve())
+        self.assertAlmostEqual(0.1, bucket.reserve())
+        self.assertAlmostEqual(0.2, bucket.reserve())
+        now.return_value = 100.5
+        self.assertEqual(0, bucket.reserve())
+
+    @patch('jirafe.limits.time.sleep')
+    def test_acquire_sleeps(self, sleep):
+        bucket = TokenBucket(rate=1, burst=1)
+        bucket.acquire()
+        self.assertFalse(sleep.called)
+        bucket.acquire()
+        self.assertAlmostEqual(1, sleep.call_args[0][0], places=2)
+
+
+class TestRateLimiter(unittest.TestCase):
+    @patch('jirafe.limits.time.time', return_value=100.0)
+    def test_per_site_and_path(self, now):
+        limiter = RateLimiter(rate=1, site_rates={'big': (2, 2)}, path_rates={'order': (1, 1)})
+
+        self.assertEqual(0, limiter.reserve('small', 'product'))
+        self.assertAlmostEqual(1, limiter.reserve('small', 'product'))
+        self.assertEqual(0, limiter.reserve('other', 'product'))
+        self.assertEqual(0, limiter.reserve('big', 'order'))
+        self.assertAlmostEqual(1, limiter.reserve('big', 'order'))
+        self.assertAlmostEqual(0.5, limiter.reserve('big', 'product'))
+
+    def test_acquire_past_deadline_refunds(self):
+        limiter = RateLimiter(rate=1, path_rates={'order': (1, 1)})
+        self.assertTrue(limiter.acquire('a', 'order', time.time() + 0.1))
+        self.assertFalse(limiter.acquire('a', 'order', time.time() + 0.1))
+        self.assertAlmostEqual(0, limiter.buckets[('a', None)].tokens, delta=0.2)
+        self.assertAlmostEqual(0, limiter.buckets[('a', 'order')].tokens, delta=0.2)
+
+    def test_unlimited(self):
+        limiter = RateLimiter()
+        for _ in range(100):
+            self.assertEqual(0, limiter.reserve('site', 'order'))
+        self.assertEqual({}, limiter.buckets)
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.concurrency = AdaptiveConcurrency(initial=2, min_limit=1, max_limit=4, backoff_ratio=0.5)
+
+    def test_blocks_at_limit(self):
+        self.concurrency.acquire('a')
+        self.concurrency.acquire('a')
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (self.concurrency.acquire('a'), acquired.set()))
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        self.concurrency.acquire('b')
+        self.concurrency.release('a', 0.1)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+
+    def test_acquire_deadline(self):
+        self.assertTrue(self.concurrency.acquire('a', time.time() + 1))
+        self.assertTrue(self.concurrency.acquire('a', time.time() + 1))
+        self.assertFalse(self.concurrency.acquire('a', time.time() + 0.05))
+        self.concurrency.cancel('a')
+        self.assertTrue(self.concurrency.acquire('a', time.time() + 0.05))
+        self.assertEqual(2, self.concurrency.get_limit('a'))
+
+    def test_backs_off_on_error(self):
+        self.concurrency.acquire('a')
+        self.concurrency.release('a', 0.1, False)
+        self.assertEqual(1, self.concurrency.get_limit('a'))
+
+    def test_backs_off_on_latency(self):
+        self.concurrency.acquire('a')
+        self.concurrency.release('a', 0.1)
+        self.concurrency.acquire('a')
+        self.concurrency.release('a', 0.5)
+        self.assertEqual(1, self.concurrency.get_limit('a'))
+
+    def test_ramps_up_when_saturated(self):
+        for _ in range(20):
+            limit = int(self.concurrency.get_limit('a'))
+            for _ in range(limit):
+                self.concurrency.acquire('a')
+            for _ in range(limit):
+                self.concurrency.release('a', 0.1)
+        self.assertEqual(4, self.concurrency.get_limit('a'))
+
+
+class TestJirafeClientLimits(unittest.TestCase):
+    def setUp(self):
+        self.requests = Mock()
+        self.session = Mock()
+        self.session.site_id = 'id'
+
+    def test_rate_limiter(self):
+        limiter = Mock()
+        client = JirafeClient(requests=self.requests, rate_limiter=limiter)
+        self.requests.put.return_value.status_code = 200
+
+        client.order_change(self.session, {})
+
+        limiter.acquire.assert_called_once_with('id', 'order', None)
+
+    def test_concurrency(self):
+        concurrency = Mock()
+        client = JirafeClient(requests=self.requests, concurrency=concurrency)
+        self.requests.put.return_value.status_code = 503
+
+        client.order_change(self.session, {})
+
+        concurrency.acquire.assert_called_once_with('id', None)
+        self.assertEqual(('id',), concurrency.release.call_args[0][:1])
+        self.assertFalse(concurrency.release.call_args[0][2])
+
+    @patch('jirafe.client.time.sleep')
+    def test_concurrency_released_before_backoff(self, sleep):
+        events = []
+        concurrency = Mock()
+        concurrency.release.side_effect = lambda *args: events.append('release')
+        sleep.side_effect = lambda delay: events.append('sleep')
+        client = JirafeClient(requests=self.requests, concurrency=concurrency,
+                              retry_policy=RetryPolicy(max_retries=1, backoff=5))
+        self.requests.put.side_effect = [requests.exceptions.ConnectionError(), Mock(status_code=200)]
+
+        self.assertEqual({'success': True}, client.order_change(self.session, {}))
+
+        self.assertEqual(['release', 'sleep', 'release'], events)
+        self.assertTrue(concurrency.release.call_args_list[0][0][1] < 5)
@@ -0,0 +1,108 @@
+from mock import Mock
+import pickle
+import unittest
+from jirafe import JirafeClient, JirafeSession, MetricsRegistry, RetryPolicy
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry(buckets={'size': (10, 100)})
+
+    def test_counter(self):
+        self.metrics.increment('c', endpoint='order')
+        self.metrics.increment('c', 2, endpoint='order')
+        self.metrics.increment('c', endpoint='cart')
+        self.assertEqual(3, self.metrics.get_counter('c', endpoint='order'))
+        self.assertEqual(1, self.metrics.get_counter('c', endpoint='cart'))
+        self.assertEqual(0, self.metrics.get_counter('c'))
+
+    def test_histogram(self):
+        for value in (5, 50, 500):
+            self.metrics.observe('size', value, endpoint='order')
+        histogram = self.metrics.get_histogram('size', endpoint='order')
+        self.assertEqual({10: 1, 100: 1, float('inf'): 1}, histogram['buckets'])
+        self.assertEqual(3, histogram['count'])
+        self.assertEqual(555, histogram['sum'])
+        self.assertIsNone(self.metrics.get_histogram('size'))
+
+    def test_hooks(self):
+        hook = Mock()
+        self.metrics.add_hook(hook)
+        self.metrics.increment('c', a=1)
+        self.metrics.observe('h', 0.5, b=2)
+        self.metrics.remove_hook(hook)
+        self.metrics.increment('c')
+        self.assertEqual([
+            (('counter', 'c', 1, {'a': 1}),),
+            (('histogram', 'h', 0.5, {'b': 2}),),
+        ], hook.call_args_list)
+
+    def test_snapshot(self):
+        self.metrics.increment('c', a=1)
+        self.metrics.observe('h', 0.5)
+        snapshot = self.metrics.snapshot()
+        self.assertEqual([{'name': 'c', 'tags': {'a': 1}, 'value': 1}], snapshot['counters'])
+        self.assertEqual('h', snapshot['histograms'][0]['name'])
+        self.assertEqual(1, snapshot['histograms'][0]['count'])
+
+    def test_pickle(self):
+        self.metrics.increment('c')
+        session = JirafeSession('id', metrics=self.metrics)
+        copy = pickle.loads(pickle.dumps(session)).metrics
+        copy.increment('c')
+        self.assertEqual(2, copy.get_counter('c'))
+        self.assertEqual(1, self.metrics.get_counter('c'))
+
+
+class TestJirafeClientMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        self.requests = Mock()
+        self.client = JirafeClient(requests=self.requests, metrics=self.metrics)
+        self.session = Mock()
+        self.session.site_id = 'id'
+
+    def test_records_request(self):
+        self.requests.put.return_value.status_code = 200
+
+        self.client.order_change(self.session, {'id': 1})
+
+        self.assertEqual(1, self.metrics.get_counter('jirafe.requests', endpoint='order', status=200, error_type=None))
+        self.assertEqual(1, self.metrics.get_histogram('jirafe.request.latency', endpoint='order', status=200)['count'])
+        self.assertEqual(8, self.metrics.get_histogram('jirafe.request.size', endpoint='order')['sum'])
+
+    def test_records_authorization_retry(self):
+        self.requests.put.return_value.status_code = 403
+
+        self.client.cart_change(self.session, {})
+
+        self.assertEqual(1, self.metrics.get_counter('jirafe.request.retries', endpoint='cart', reason='authorization'))
+        self.assertEqual(1, self.metrics.get_counter('jirafe.requests', endpoint='cart', status=403, error_type='authorization'))
+
+    def test_records_policy_retry(self):
+        self.client.retry_policy = RetryPolicy(max_retries=1, backoff=0)
+        self.requests.put.return_value.status_code = 503
+        self.requests.put.return_value.headers = {}
+
+        self.client.cart_change(self.session, {})
+
+        self.assertEqual(1, self.metrics.get_counter('jirafe.request.retries', endpoint='cart', reason=503))
+        self.assertEqual(1, self.metrics.get_counter('jirafe.requests', endpoint='cart', status=503, error_type='unknown'))
+
+    def test_records_exception(self):
+        self.requests.put.side_effect = ValueError()
+
+        self.assertRaises(ValueError, self.client.cart_change, self.session, {})
+
+        self.assertEqual(1, self.metrics.get_counter('jirafe.requests', endpoint='cart', status=None, error_type='exception'))
+
+
+class TestJirafeSessionMetrics(unittest.TestCase):
+    def test_records_token_fetch(self):
+        metrics = MetricsRegistry()
+        session = JirafeSession('id', metrics=metrics)
+        session._get_token = Mock(return_value='token')
+
+        session.update_token()
+
+        self.assertEqual(1, metrics.get_counter('jirafe.token.fetches', success=True))
+        self.assertEqual(1, metrics.get_histogram('jirafe.token.fetch.latency')['count'])
@@ -0,0 +1,190 @@
+from mock import Mock, patch
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from jirafe import Outbox, OutboxError, OutboxSender, Priorities
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'outbox.db')
+        self.outbox = Outbox(self.path)
+
+    def tearDown(self):
+        self.outbox.close()
+        shutil.rmtree(self.dir)
+
+    def test_append_flush_fetch(self):
+        self.outbox.append('site', 'order', {'id': 1})
+        self.outbox.append(2, 'cart', '{"id":2}')
+        self.outbox.append('site', 'order', b'{"id":3}')
+        self.outbox.flush()
+
+        rows = self.outbox.fetch()
+        self.assertEqual([
+            ('site', 'order', '{"id":1}', 0),
+            ('2', 'cart', '{"id":2}', 0),
+            ('site', 'order', '{"id":3}', 0),
+        ], [row[1:] for row in rows])
+        self.assertEqual(3, self.outbox.count())
+
+    def test_flush_without_pending(self):
+        self.outbox.flush()
+        self.outbox.flush()
+
+    def test_append_wait(self):
+        self.outbox.append('site', 'order', {'id': 1}, wait=True)
+        self.assertEqual(1, self.outbox.count())
+
+    def test_append_without_wait(self):
+        self.outbox.append('site', 'order', {'id': 1}, wait=False)
+        self.outbox.flush()
+        self.assertEqual(1, self.outbox.count())
+
+    def test_max_pending(self):
+        self.outbox.close()
+        self.outbox = Outbox(self.path, wait=False, commit_interval=0.5, max_pending=2)
+        self.outbox.append('site', 'order', {'id': 1})
+        self.outbox.append('site', 'order', {'id': 2})
+        with self.assertRaises(OutboxError):
+            self.outbox.append('site', 'order', {'id': 3})
+        self.outbox.flush()
+        self.assertEqual(2, self.outbox.count())
+
+    def test_write_errors_are_raised(self):
+        with patch.object(self.outbox, '_execute_many', side_effect=sqlite3.OperationalError('disk I/O error')):
+            with self.assertRaises(OutboxError):
+                self.outbox.append('site', 'order', {'id': 1})
+            with self.assertRaises(OutboxError):
+                self.outbox.append('site', 'order', {'id': 2}, wait=False)
+            with self.assertRaises(OutboxError):
+                self.outbox.flush()
+
+        # The writer keeps retrying the failed entry and clears the error once it is written.
+        deadline = time.time() + 5
+        while self.outbox.count() == 0 and time.time() < deadline:
+            time.sleep(0.05)
+        self.outbox.flush()
+        self.assertEqual(1, self.outbox.count())
+        self.outbox.append('site', 'order', {'id': 2})
+        self.assertEqual(2, self.outbox.count())
+
+    def test_survives_reopen(self):
+        self.outbox.append('site', 'order', {'id': 1})
+        self.outbox.close()
+        self.outbox = Outbox(self.path)
+        self.assertEqual(1, self.outbox.count())
+
+    def test_ack_and_compact(self):
+        for i in range(3):
+            self.outbox.append('site', 'order', {'id': i})
+        self.outbox.flush()
+        ids = [row[0] for row in self.outbox.fetch()]
+
+        self.outbox.ack(ids[:2])
+
+        self.assertEqual([ids[2]], [row[0] for row in self.outbox.fetch()])
+        self.assertEqual(2, self.outbox.compact())
+        self.assertEqual(1, self.outbox.count())
+
+    def test_nack_delays(self):
+        self.outbox.append('site', 'order', {'id': 1})
+        self.outbox.flush()
+        ids = [row[0] for row in self.outbox.fetch()]
+
+        self.outbox.nack(ids, 60)
+
+        self.assertEqual([], self.outbox.fetch())
+        self.outbox.nack(ids, -1)
+        self.assertEqual(2, self.outbox.fetch()[0][4])
+
+    @patch('jirafe.outbox.time')
+    def test_fetch_by_priority(self, time):
+        time.sleep.return_value = None
+        self.outbox.close()
+        self.outbox = Outbox(self.path, priorities=Priorities(max_wait=60))
+        time.time.return_value = 1000
+        self.outbox.append('site', 'product', {'id': 1})
+        time.time.return_value = 1050
+        self.outbox.append('site', 'product', {'id': 2})
+        self.outbox.append('site', 'cart', {'id': 3})
+        self.outbox.append('site', 'order', {'id': 4})
+        self.outbox.flush()
+
+        self.assertEqual(['4', '3', '1', '2'], [row[3][6] for row in self.outbox.fetch()])
+        time.time.return_value = 1070
+        self.assertEqual(['1', '4', '3', '2'], [row[3][6] for row in self.outbox.fetch()])
+
+    def test_closed(self):
+        self.outbox.close()
+        self.assertRaises(RuntimeError, self.outbox.append, 'site', 'order', {})
+
+
+class TestOutboxSender(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.outbox = Outbox(os.path.join(self.dir, 'outbox.db'))
+        self.client = Mock()
+        self.sessions = {'a': Mock(), 'b': Mock()}
+        self.callback = Mock()
+        self.sender = OutboxSender(self.outbox, self.client, self.sessions.get, callback=self.callback)
+
+    def tearDown(self):
+        self.sender.stop()
+        self.outbox.close()
+        shutil.rmtree(self.dir)
+
+    def test_send_once_groups_and_acks(self):
+        self.client._put_batch = Mock(side_effect=lambda session, path, items: [{'success': True} for _ in items])
+        self.outbox.append('a', 'order', {'id': 1})
+        self.outbox.append('b', 'order', {'id': 2})
+        self.outbox.append('a', 'order', {'id': 3})
+        self.outbox.flush()
+
+        self.assertEqual(3, self.sender.send_once())
+
+        self.client._put_batch.assert_any_call(self.sessions['a'], 'order', ['{"id":1}', '{"id":3}'])
+        self.client._put_batch.assert_any_call(self.sessions['b'], 'order', ['{"id":2}'])
+        self.assertEqual(0, self.outbox.count())
+        self.callback.assert_any_call('a', 'order', '{"id":1}', {'success': True})
+
+    def test_validation_errors_are_acked(self):
+        result = {'success': False, 'error_type': 'validation', 'errors': {}}
+        self.client._put_batch = Mock(return_value=[result])
+        self.outbox.append('a', 'order', {'id': 1})
+        self.outbox.flush()
+
+        self.sender.send_once()
+
+        self.assertEqual(0, self.outbox.count())
+        self.callback.assert_called_once_with('a', 'order', '{"id":1}', result)
+
+    def test_failures_are_retried_later(self):
+        self.client._put_batch = Mock(side_effect=ValueError('down'))
+        self.outbox.append('a', 'order', {'id': 1})
+        self.outbox.flush()
+
+        self.sender.send_once()
+
+        self.assertEqual(1, self.outbox.count())
+        self.assertEqual([], self.outbox.fetch())
+        self.assertFalse(self.callback.called)
+
+    def test_background_drain(self):
+        self.client._put_batch = Mock(side_effect=lambda session, path, items: [{'success': True} for _ in items])
+        self.sender.poll_interval = 0.01
+        self.sender.start()
+        for i in range(10):
+            self.outbox.append('a', 'cart', {'id': i})
+
+        self.assertTrue(self.sender.drain(5))
+        self.assertEqual(10, self.callback.call_count)
+
+    def test_drain_timeout(self):
+        self.client._put_batch = Mock(return_value=[{'success': False, 'error_type': 'unknown'}])
+        self.outbox.append('a', 'cart', {'id': 1})
+
+        self.assertFalse(self.sender.drain(0.1))
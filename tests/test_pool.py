@@ -0,0 +1,44 @@
+from mock import Mock
+import unittest
+from jirafe import ConnectionPool, JirafeClient, UsernameSession
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool(pool_connections=2, pool_maxsize=5, pool_block=True)
+        self.pool.session = Mock()
+
+    def test_constructor_mounts_adapter(self):
+        pool = ConnectionPool(pool_connections=2, pool_maxsize=5, pool_block=True)
+        adapter = pool.session.get_adapter('https://api.jirafe.com/')
+        self.assertIs(adapter, pool.session.get_adapter('http://api.jirafe.com/'))
+        self.assertEqual(5, adapter._pool_maxsize)
+        self.assertEqual(2, adapter._pool_connections)
+        self.assertTrue(adapter._pool_block)
+        pool.close()
+
+    def test_no_keep_alive(self):
+        pool = ConnectionPool(keep_alive=False)
+        self.assertEqual('close', pool.session.headers['Connection'])
+        pool.close()
+
+    def test_delegates_to_session(self):
+        self.pool.put('url', data='d', headers={})
+        self.pool.session.put.assert_called_once_with('url', data='d', headers={})
+        self.pool.get('url', params='p')
+        self.pool.session.get.assert_called_once_with('url', params='p')
+        self.pool.post('url', data='d')
+        self.pool.session.post.assert_called_once_with('url', data='d')
+
+    def test_shared_by_client_and_session(self):
+        client = JirafeClient(requests=self.pool)
+        session = UsernameSession('id', 'u', 'p', 'c', 's', requests=self.pool)
+        self.assertIs(self.pool, client.requests)
+        self.assertIs(self.pool, session.requests)
+
+    def test_client_close(self):
+        with JirafeClient(requests=self.pool):
+            pass
+        self.pool.session.close.assert_called_once()
+
+    def test_client_close_module(self):
+        JirafeClient().close()
@@ -0,0 +1,77 @@
+from mock import MagicMock, Mock
+import unittest
+from jirafe import AsyncJirafeClient, JirafeClient, PreparedEndpoint, UsernameSession, Validators
+
+class TestPreparedEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.transport = Mock()
+        self.transport.put.return_value = Mock(status_code=200)
+        self.client = JirafeClient(transport=self.transport)
+        self.session = UsernameSession('id', 'u', 'p', 'c', 's', transport=self.transport)
+        self.session.access_token = 'token'
+        self.endpoint = self.client.prepare(self.session, 'order')
+
+    def test_prepare(self):
+        self.assertIsInstance(self.endpoint, PreparedEndpoint)
+        self.assertEqual('https://api.jirafe.com/v1/id/order', self.endpoint.get_url('order'))
+        self.assertEqual('https://api.jirafe.com/v1/id/batch', self.endpoint.get_url('batch'))
+        self.assertEqual('id', self.endpoint.site_id)
+
+    def test_send(self):
+        self.assertEqual({'success': True}, self.endpoint.send({'id': 1}))
+        self.transport.put.assert_called_once_with('https://api.jirafe.com/v1/id/order', data='{"id":1}',
+                                                   headers={'Authorization': 'Bearer token'}, timeout=(5, 30))
+
+    def test_header_reused_until_token_changes(self):
+        first = self.endpoint.get_header()
+        self.assertIs(first, self.endpoint.get_header())
+        self.assertEqual('token', self.session.get_issued_token())
+
+        self.session.access_token = 'new'
+
+        self.assertEqual({'Authorization': 'Bearer new'}, self.endpoint.get_header())
+
+    def test_authorization_retry_refreshes_header(self):
+        self.transport.put.side_effect = [Mock(status_code=403), Mock(status_code=200)]
+        self.transport.post.return_value = Mock(status_code=200, json=Mock(return_value={'access_token': 'fresh'}))
+
+        self.assertEqual({'success': True}, self.endpoint.send('{}'))
+
+        self.assertEqual({'Authorization': 'Bearer fresh'}, self.transport.put.call_args[1]['headers'])
+
+    def test_send_batch(self):
+        self.transport.put.return_value = Mock(status_code=200, json=Mock(return_value={'order': [{'success': True}]}))
+
+        self.assertEqual([{'success': True}], self.endpoint.send_batch([{'id': 1}]))
+        self.assertEqual('https://api.jirafe.com/v1/id/batch', self.transport.put.call_args[0][0])
+
+    def test_client_features_apply(self):
+        self.client.validators = Validators({'order': {'id': 'id'}})
+
+        result = self.endpoint.send({})
+
+        self.assertEqual('validation', result['error_type'])
+        self.assertFalse(self.transport.put.called)
+
+
+class TestAsyncPreparedEndpoint(unittest.IsolatedAsyncioTestCase):
+    async def test_send(self):
+        response = MagicMock()
+        response.status = 200
+        response.text = MagicMock(return_value=self._text())
+        context = MagicMock()
+        context.__aenter__.return_value = response
+        http = MagicMock()
+        http.put = MagicMock(return_value=context)
+        client = AsyncJirafeClient(http_session=http)
+        session = UsernameSession('id', 'u', 'p', 'c', 's', transport=Mock())
+        session.access_token = 'token'
+
+        result = await client.prepare(session, 'cart').send('{}')
+
+        self.assertEqual({'success': True}, result)
+        http.put.assert_called_once_with('https://api.jirafe.com/v1/id/cart', data='{}',
+                                         headers={'Authorization': 'Bearer token'})
+
+    async def _text(self):
+        return ''
@@ -0,0 +1,103 @@
+from mock import patch
+import asyncio
+import queue
+import unittest
+from jirafe import Priorities, LaneQueue, AsyncPrioritySemaphore
+
+class TestPriorities(unittest.TestCase):
+    def test_defaults(self):
+        priorities = Priorities()
+        self.assertTrue(priorities.get('order') < priorities.get('cart') < priorities.get('customer')
+                        < priorities.get('product'))
+        self.assertEqual(priorities.get('product'), priorities.get('category'))
+        self.assertEqual(priorities.get('product'), priorities.get('unknown'))
+
+    def test_overrides(self):
+        priorities = Priorities({'product': 0, 'refund': 9}, default=5)
+        self.assertEqual(0, priorities.get('product'))
+        self.assertEqual(9, priorities.get('refund'))
+        self.assertEqual(5, priorities.get('unknown'))
+
+
+@patch('jirafe.priority.time')
+class TestLanes(unittest.TestCase):
+    def setUp(self):
+        self.lanes = Priorities(max_wait=10).lanes(lambda item: item[0])
+
+    def test_strict_priority(self, time):
+        time.time.return_value = 100
+        for item in [('product', 1), ('cart', 2), ('order', 3), ('product', 4), ('order', 5)]:
+            self.lanes.append(item)
+
+        self.assertEqual(5, len(self.lanes))
+        self.assertEqual(0, self.lanes.peek())
+        self.assertEqual([3, 5, 2, 1, 4], [self.lanes.popleft()[1] for _ in range(5)])
+        self.assertIsNone(self.lanes.peek())
+        self.assertRaises(IndexError, self.lanes.popleft)
+
+    def test_aged_items_go_first(self, time):
+        time.time.return_value = 100
+        self.lanes.append(('product', 1))
+        time.time.return_value = 105
+        self.lanes.append(('cart', 2))
+        time.time.return_value = 109
+        self.lanes.append(('order', 3))
+
+        self.assertEqual(3, self.lanes.popleft()[1])
+        time.time.return_value = 115
+        self.assertEqual(float('-inf'), self.lanes.peek())
+        self.assertEqual([1, 2], [self.lanes.popleft()[1] for _ in range(2)])
+
+    def test_pop_lowest(self, time):
+        time.time.return_value = 100
+        for item in [('order', 1), ('product', 2), ('product', 3)]:
+            self.lanes.append(item)
+
+        self.assertEqual(2, self.lanes.pop_lowest()[1])
+        self.assertEqual(2, len(self.lanes))
+
+
+class TestLaneQueue(unittest.TestCase):
+    def test_get_and_drop(self):
+        lanes = LaneQueue(3)
+        lanes.put((None, 'product', 1))
+        lanes.put((None, 'order', 2))
+        lanes.put((None, 'customer', 3))
+        self.assertRaises(queue.Full, lanes.put_nowait, (None, 'order', 4))
+
+        self.assertEqual(1, lanes.drop_nowait()[2])
+        self.assertEqual(2, lanes.get_nowait()[2])
+        self.assertEqual(3, lanes.get_nowait()[2])
+        self.assertRaises(queue.Empty, lanes.drop_nowait)
+
+
+class TestAsyncPrioritySemaphore(unittest.IsolatedAsyncioTestCase):
+    async def test_wakes_by_priority(self):
+        semaphore = AsyncPrioritySemaphore(1, Priorities())
+        order = []
+
+        async def send(path):
+            async with semaphore.slot(path):
+                order.append(path)
+                await asyncio.sleep(0)
+
+        await semaphore.acquire('order')
+        tasks = [asyncio.ensure_future(send(path)) for path in ['product', 'category', 'cart', 'order']]
+        await asyncio.sleep(0)
+        semaphore.release()
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(['order', 'cart', 'product', 'category'], order)
+        self.assertEqual(1, semaphore.value)
+
+    async def test_cancelled_waiter(self):
+        semaphore = AsyncPrioritySemaphore(1, Priorities())
+        await semaphore.acquire('order')
+        waiter = asyncio.ensure_future(semaphore.acquire('order'))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+
+        semaphore.release()
+
+        self.assertEqual(1, semaphore.value)
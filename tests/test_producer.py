@@ -0,0 +1,152 @@
+from mock import Mock
+import threading
+import unittest
+from jirafe import JirafeProducer, BufferFull, Priorities
+
+class TestJirafeProducer(unittest.TestCase):
+    def setUp(self):
+        self.client = Mock()
+        self.client._put_batch = Mock(side_effect=lambda session, path, items: [{'success': True} for _ in items])
+        self.session = Mock()
+        self.delivered = []
+        self.callback = lambda data, result: self.delivered.append((data, result))
+
+    def test_invalid_backpressure(self):
+        self.assertRaises(ValueError, JirafeProducer, self.client, backpressure='nope')
+
+    def test_flush_sends_batch(self):
+        producer = JirafeProducer(self.client, linger=60, callback=self.callback)
+
+        producer.order_change(self.session, {'id': 1})
+        producer.order_change(self.session, {'id': 2})
+        self.assertTrue(producer.flush(5))
+
+        self.client._put_batch.assert_called_once_with(self.session, 'order', [{'id': 1}, {'id': 2}])
+        self.assertEqual([({'id': 1}, {'success': True}), ({'id': 2}, {'success': True})], self.delivered)
+        producer.close()
+
+    def test_flush_on_batch_size(self):
+        producer = JirafeProducer(self.client, batch_size=2, linger=60)
+
+        producer.product_change(self.session, {'id': 1})
+        producer.product_change(self.session, {'id': 2})
+        producer.product_change(self.session, {'id': 3})
+        self.assertTrue(producer.flush(5))
+
+        self.assertEqual(2, self.client._put_batch.call_count)
+        self.client._put_batch.assert_any_call(self.session, 'product', [{'id': 1}, {'id': 2}])
+        producer.close()
+
+    def test_flush_on_linger(self):
+        done = threading.Event()
+        producer = JirafeProducer(self.client, linger=0.01, callback=lambda data, result: done.set())
+
+        producer.cart_change(self.session, {'id': 1})
+
+        self.assertTrue(done.wait(5))
+        producer.close()
+
+    def test_groups_by_session_and_path(self):
+        other = Mock()
+        producer = JirafeProducer(self.client, linger=60)
+
+        producer.order_change(self.session, {'id': 1})
+        producer.cart_change(self.session, {'id': 2})
+        producer.order_change(other, {'id': 3})
+        producer.close(5)
+
+        self.client._put_batch.assert_any_call(self.session, 'order', [{'id': 1}])
+        self.client._put_batch.assert_any_call(self.session, 'cart', [{'id': 2}])
+        self.client._put_batch.assert_any_call(other, 'order', [{'id': 3}])
+
+    def test_per_call_callback(self):
+        results = []
+        producer = JirafeProducer(self.client, linger=60, callback=self.callback)
+
+        producer.customer_change(self.session, {'id': 1}, lambda data, result: results.append(result))
+        producer.close(5)
+
+        self.assertEqual([{'success': True}], results)
+        self.assertEqual([], self.delivered)
+
+    def test_send_exception(self):
+        self.client._put_batch = Mock(side_effect=ValueError('boom'))
+        producer = JirafeProducer(self.client, linger=60, callback=self.callback)
+
+        producer.order_change(self.session, {'id': 1})
+        producer.close(5)
+
+        self.assertEqual([({'id': 1}, {'success': False, 'error_type': 'exception', 'message': 'boom'})], self.delivered)
+
+    def _blocked_producer(self, **kwargs):
+        release = threading.Event()
+        started = threading.Event()
+
+        def put_batch(session, path, items):
+            started.set()
+            release.wait(5)
+            return [{'success': True} for _ in items]
+        self.client._put_batch = Mock(side_effect=put_batch)
+        producer = JirafeProducer(self.client, max_buffer=1, batch_size=1, linger=0, callback=self.callback, **kwargs)
+        producer.order_change(self.session, {'id': 0})
+        started.wait(5)
+        return producer, release
+
+    def test_backpressure_raise(self):
+        producer, release = self._blocked_producer(backpressure='raise')
+
+        producer.order_change(self.session, {'id': 1})
+        self.assertRaises(BufferFull, producer.order_change, self.session, {'id': 2})
+
+        release.set()
+        producer.close(5)
+
+    def test_backpressure_drop_oldest(self):
+        producer, release = self._blocked_producer(backpressure='drop_oldest')
+
+        producer.order_change(self.session, {'id': 1})
+        producer.order_change(self.session, {'id': 2})
+
+        self.assertEqual(1, producer.dropped)
+        self.assertIn(({'id': 1}, {'success': False, 'error_type': 'dropped'}), self.delivered)
+        release.set()
+        producer.close(5)
+        self.assertIn(({'id': 2}, {'success': True}), self.delivered)
+
+    def test_priorities(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def put_batch(session, path, items):
+            started.set()
+            release.wait(5)
+            return [{'success': True} for _ in items]
+        self.client._put_batch = Mock(side_effect=put_batch)
+        producer = JirafeProducer(self.client, batch_size=1, linger=0, callback=self.callback,
+                                  priorities=Priorities())
+        producer.product_change(self.session, {'id': 0})
+        started.wait(5)
+
+        producer.product_change(self.session, {'id': 1})
+        producer.cart_change(self.session, {'id': 2})
+        producer.order_change(self.session, {'id': 3})
+        release.set()
+        producer.close(5)
+
+        self.assertEqual([0, 3, 2, 1], [data['id'] for data, _ in self.delivered])
+
+    def test_drop_lowest_priority(self):
+        producer, release = self._blocked_producer(backpressure='drop_oldest', priorities=Priorities())
+
+        producer.product_change(self.session, {'id': 1})
+        producer.order_change(self.session, {'id': 2})
+
+        self.assertIn(({'id': 1}, {'success': False, 'error_type': 'dropped'}), self.delivered)
+        release.set()
+        producer.close(5)
+        self.assertIn(({'id': 2}, {'success': True}), self.delivered)
+
+    def test_closed(self):
+        producer = JirafeProducer(self.client)
+        producer.close()
+        self.assertRaises(RuntimeError, producer.order_change, self.session, {})
@@ -0,0 +1,171 @@
+from mock import Mock, patch
+import email.utils
+import requests
+import time
+import unittest
+from jirafe import CircuitBreaker, JirafeClient, RetryBudget, RetryPolicy
+from jirafe.retry import parse_retry_after
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_should_retry(self):
+        policy = RetryPolicy(max_retries=2)
+        self.assertTrue(policy.should_retry(0))
+        self.assertTrue(policy.should_retry(1, 503))
+        self.assertFalse(policy.should_retry(2, 503))
+        self.assertFalse(policy.should_retry(0, 400))
+        self.assertFalse(policy.should_retry(0, 200))
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+        self.assertEqual([1, 2, 4, 5], [policy.get_delay(a) for a in range(4)])
+
+    def test_jitter(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        for attempt in range(4):
+            self.assertTrue(0 <= policy.get_delay(attempt) <= min(5, 2 ** attempt))
+
+    def test_retry_after(self):
+        policy = RetryPolicy(max_backoff=60)
+        self.assertEqual(7, policy.get_delay(0, '7'))
+        self.assertEqual(60, policy.get_delay(0, '120'))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(3, parse_retry_after('3'))
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+        date = email.utils.formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(30, parse_retry_after(date), delta=2)
+
+    def test_budget_limits_retries(self):
+        policy = RetryPolicy(budget=RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1))
+        self.assertTrue(policy.should_retry(0))
+        self.assertFalse(policy.should_retry(0))
+        policy.record_request()
+        policy.record_request()
+        self.assertTrue(policy.should_retry(0))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure('a')
+        self.assertTrue(self.breaker.allow('a'))
+        self.breaker.record_failure('a')
+        self.assertFalse(self.breaker.allow('a'))
+        self.assertTrue(self.breaker.allow('b'))
+
+    def test_success_resets(self):
+        self.breaker.record_failure('a')
+        self.breaker.record_success('a')
+        self.breaker.record_failure('a')
+        self.assertEqual('closed', self.breaker.get_state('a'))
+
+    def test_half_open(self):
+        self.breaker.record_failure('a')
+        self.breaker.record_failure('a')
+        with patch('jirafe.retry.time.time', return_value=time.time() + 11):
+            self.assertTrue(self.breaker.allow('a'))
+            self.assertFalse(self.breaker.allow('a'))
+            self.breaker.record_failure('a')
+            self.assertEqual('open', self.breaker.get_state('a'))
+        with patch('jirafe.retry.time.time', return_value=time.time() + 22):
+            self.assertTrue(self.breaker.allow('a'))
+            self.breaker.record_success('a')
+        self.assertTrue(self.breaker.allow('a'))
+
+
+def mock_response(status, headers=None):
+    response = Mock()
+    response.status_code = status
+    response.text = 'text'
+    response.headers = headers or {}
+    return response
+
+@patch('jirafe.client.time.sleep')
+class TestJirafeClientRetry(unittest.TestCase):
+    def setUp(self):
+        self.requests = Mock()
+        self.session = Mock()
+        self.session.site_id = 'id'
+        self.client = JirafeClient(requests=self.requests, retry_policy=RetryPolicy(max_retries=2, jitter=False))
+
+    def test_retries_server_errors(self, sleep):
+        self.requests.put = Mock(side_effect=[mock_response(503), mock_response(429, {'Retry-After': '4'}), mock_response(200)])
+
+        self.assertEqual({'success': True}, self.client.order_change(self.session, {}))
+        self.assertEqual(3, self.requests.put.call_count)
+        self.assertEqual([((0.5,),), ((4.0,),)], sleep.call_args_list)
+
+    def test_gives_up(self, sleep):
+        self.requests.put = Mock(return_value=mock_response(503))
+
+        self.assertEqual({'success': False, 'error_type': 'unknown', 'raw': 'text'}, self.client.order_change(self.session, {}))
+        self.assertEqual(3, self.requests.put.call_count)
+
+    def test_does_not_retry_validation(self, sleep):
+        response = mock_response(400)
+        response.json = Mock(return_value={})
+        self.requests.put = Mock(return_value=response)
+
+        self.client.order_change(self.session, {})
+
+        self.requests.put.assert_called_once()
+
+    def test_retries_connection_errors(self, sleep):
+        self.requests.put = Mock(side_effect=requests.exceptions.ConnectionError('refused'))
+
+        result = self.client.order_change(self.session, {})
+
+        self.assertEqual({'success': False, 'error_type': 'connection', 'message': 'refused'}, result)
+        self.assertEqual(3, self.requests.put.call_count)
+
+    def test_connection_error_without_policy_raises(self, sleep):
+        client = JirafeClient(requests=self.requests)
+        self.requests.put = Mock(side_effect=requests.exceptions.ConnectionError('refused'))
+
+        self.assertRaises(requests.exceptions.ConnectionError, client.order_change, self.session, {})
+
+    def test_circuit_breaker(self, sleep):
+        breaker = CircuitBreaker(failure_threshold=2)
+        client = JirafeClient(requests=self.requests, circuit_breaker=breaker)
+        self.requests.put = Mock(return_value=mock_response(500))
+
+        client.order_change(self.session, {})
+        client.order_change(self.session, {})
+        result = client.order_change(self.session, {})
+
+        self.assertEqual({'success': False, 'error_type': 'circuit_open', 'message': 'circuit open for site id'}, result)
+        self.assertEqual(2, self.requests.put.call_count)
+
+    def test_circuit_half_open_authorization_retry(self, sleep):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure('id')
+        client = JirafeClient(requests=self.requests, circuit_breaker=breaker)
+        self.requests.put = Mock(side_effect=[mock_response(403), mock_response(200)])
+
+        self.assertEqual({'success': True}, client.order_change(self.session, {}))
+        self.assertEqual('closed', breaker.get_state('id'))
+        self.session.invalidate.assert_called_once_with()
+
+    def test_circuit_half_open_probe_raises(self, sleep):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure('id')
+        client = JirafeClient(requests=self.requests, circuit_breaker=breaker)
+        self.requests.put = Mock(side_effect=[ValueError(), mock_response(200)])
+
+        self.assertRaises(ValueError, client.order_change, self.session, {})
+        self.assertEqual('open', breaker.get_state('id'))
+        self.assertEqual({'success': True}, client.order_change(self.session, {}))
+        self.assertEqual('closed', breaker.get_state('id'))
+
+    def test_circuit_open_batch(self, sleep):
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record_failure('id')
+        client = JirafeClient(requests=self.requests, circuit_breaker=breaker)
+
+        results = client.product_changes(self.session, [{}, {}])
+
+        self.assertEqual(['circuit_open', 'circuit_open'], [r['error_type'] for r in results])
+        self.assertFalse(self.requests.put.called)
@@ -1,7 +1,10 @@
 from mock import Mock
 import requests
+import pickle
+import threading
+import time
 import unittest
-from jirafe import JirafeSession, UsernameSession, Oauth2Session
+from jirafe import JirafeSession, UsernameSession, Oauth2Session, MemoryTokenStore, ProfileCache
 
 class TestJirafeSession(unittest.TestCase):
     def setUp(self):
@@ -62,7 +65,7 @@ class TestJirafeSession(unittest.TestCase):
 
         self.assertEqual(json_response, profile)
         mock_response.json.assert_called_once()
-        self.mock_requests.get.assert_called_once_with('https://accounts.jirafe.com/accounts/profile', headers={'mock': 'header'})
+        self.mock_requests.get.assert_called_once_with('https://accounts.jirafe.com/accounts/profile', headers={'mock': 'header'}, timeout=(5, 30))
 
     def test_get_profile_fail(self):
         mock_response = Mock()
@@ -142,7 +145,7 @@ class TestUsernameSession(unittest.TestCase):
         self.mock_requests.post = Mock(return_value=mock_response)
 
         self.assertEqual('teh_token', self.session._get_token())
-        self.mock_requests.post.assert_called_once_with(self.session.token_url, data=data)
+        self.mock_requests.post.assert_called_once_with(self.session.token_url, data=data, timeout=(5, 30))
 
     def test__get_token_sad(self):
         data = {
@@ -158,7 +161,7 @@ class TestUsernameSession(unittest.TestCase):
         self.mock_requests.post = Mock(return_value=mock_response)
 
         self.assertIsNone(self.session._get_token())
-        self.mock_requests.post.assert_called_once_with(self.session.token_url, data=data)
+        self.mock_requests.post.assert_called_once_with(self.session.token_url, data=data, timeout=(5, 30))
 
 class TestOauth2Session(unittest.TestCase):
     def setUp(self):
@@ -222,7 +225,7 @@ class TestOauth2Session(unittest.TestCase):
         self.assertEqual('teh_token', session._do_post(data))
         self.assertEqual('ref_token', session.refresh_token)
         self.assertIsNone(session.code)
-        self.mock_requests.post.assert_called_once_with(session.token_url, data=data)
+        self.mock_requests.post.assert_called_once_with(session.token_url, data=data, timeout=(5, 30))
 
     def test__get_token_with_access_token(self):
         session = Oauth2Session(self.site_id,
@@ -268,3 +271,321 @@ class TestOauth2Session(unittest.TestCase):
 
         self.assertEqual('access_token', session._get_token())
         session._do_post.assert_called_once_with(expected_data)
+
+class TestJirafeSessionTokenRefresh(unittest.TestCase):
+    def setUp(self):
+        self.session = JirafeSession('id', requests=Mock())
+
+    def test_update_token_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+        tokens = []
+
+        def get_token():
+            started.set()
+            release.wait(5)
+            return 'token-%d' % len(tokens)
+        self.session._get_token = Mock(side_effect=get_token)
+
+        threads = [threading.Thread(target=lambda: tokens.append(self.session.update_token())) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for t in threads[1:]:
+            t.start()
+        release.set()
+        for t in threads:
+            t.join(5)
+
+        self.session._get_token.assert_called_once()
+        self.assertEqual(['token-0'] * 5, tokens)
+
+    def test_update_token_fetch_finishing_after_token_read(self):
+        session = self.session
+        session._get_token = Mock(return_value='A')
+
+        class Racing(JirafeSession):
+            # Another thread's fetch completes right after this one reads the token.
+            @property
+            def access_token(self):
+                token = self.__dict__.get('access_token')
+                if token is None:
+                    self.__dict__['access_token'] = 'B'
+                    self._token_generation += 1
+                return token
+
+            @access_token.setter
+            def access_token(self, value):
+                self.__dict__['access_token'] = value
+
+        session.__class__ = Racing
+
+        self.assertEqual('B', session.update_token())
+        self.assertFalse(session._get_token.called)
+
+    def test_update_token_shares_failed_fetch(self):
+        started = threading.Event()
+        release = threading.Event()
+        tokens = []
+
+        def get_token():
+            started.set()
+            release.wait(5)
+        self.session._get_token = Mock(side_effect=get_token)
+
+        first = threading.Thread(target=lambda: tokens.append(self.session.update_token()))
+        second = threading.Thread(target=lambda: tokens.append(self.session.update_token()))
+        first.start()
+        started.wait(5)
+        second.start()
+        time.sleep(0.05)
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        self.session._get_token.assert_called_once()
+        self.assertEqual([None, None], tokens)
+
+    def test_invalidate_issued_token(self):
+        self.session.access_token = 'old'
+        self.session.get_header()
+        self.session.access_token = 'new'
+
+        self.session.invalidate()
+
+        self.assertEqual('new', self.session.access_token)
+
+    def test_invalidate_explicit_token(self):
+        self.session.access_token = 'new'
+        self.session.invalidate('old')
+        self.assertEqual('new', self.session.access_token)
+        self.session.invalidate('new')
+        self.assertIsNone(self.session.access_token)
+
+    def test_get_issued_token_per_thread(self):
+        self.session.access_token = 'token'
+        self.session.get_header()
+        issued = []
+        t = threading.Thread(target=lambda: issued.append(self.session.get_issued_token()))
+        t.start()
+        t.join()
+        self.assertEqual('token', self.session.get_issued_token())
+        self.assertEqual([None], issued)
+
+    def test_pickle(self):
+        session = UsernameSession('id', 'u', 'p', 'c', 's')
+        session.access_token = 'token'
+        copy = pickle.loads(pickle.dumps(session))
+        self.assertEqual('token', copy.access_token)
+        self.assertEqual(requests, copy.requests)
+        self.assertEqual(requests, session.requests)
+        self.assertEqual('token', copy.update_token())
+
+    def test_pickle_with_token_store(self):
+        session = UsernameSession('id', 'u', 'p', 'c', 's', token_store=MemoryTokenStore())
+        copy = pickle.loads(pickle.dumps(session))
+        self.assertIsInstance(copy.token_store, MemoryTokenStore)
+
+class TestJirafeSessionExpiry(unittest.TestCase):
+    def setUp(self):
+        self.session = JirafeSession('id', requests=Mock(), refresh_margin=30)
+
+    def test_set_expiry(self):
+        self.session._set_expiry({'expires_in': 3600})
+        self.assertAlmostEqual(time.time() + 3600, self.session.expires_at, delta=5)
+        self.session._set_expiry({})
+        self.assertIsNone(self.session.expires_at)
+
+    def test_has_valid_token(self):
+        self.assertFalse(self.session.has_valid_token())
+        self.session.access_token = 'token'
+        self.assertTrue(self.session.has_valid_token())
+        self.session.expires_at = time.time() - 1
+        self.assertFalse(self.session.has_valid_token())
+
+    def test_update_token_fresh(self):
+        self.session.access_token = 'token'
+        self.session.expires_at = time.time() + 3600
+        self.session._get_token = Mock()
+
+        self.assertEqual('token', self.session.update_token())
+        self.assertFalse(self.session._get_token.called)
+
+    def test_update_token_refresh_ahead(self):
+        refreshed = threading.Event()
+
+        def get_token():
+            refreshed.set()
+            return 'new'
+        self.session.access_token = 'old'
+        self.session.expires_at = time.time() + 10
+        self.session._get_token = Mock(side_effect=get_token)
+
+        self.assertEqual('old', self.session.update_token())
+        self.assertTrue(refreshed.wait(5))
+        self.session._refresh_lock.acquire()
+        self.session._refresh_lock.release()
+        self.assertEqual('new', self.session.access_token)
+        self.session._get_token.assert_called_once()
+
+    def test_update_token_refresh_ahead_failure_keeps_token(self):
+        self.session.access_token = 'old'
+        self.session.expires_at = time.time() + 10
+        self.session._get_token = Mock(return_value=None)
+
+        self.session.update_token()
+        self.session._refresh_lock.acquire()
+        self.session._refresh_lock.release()
+
+        self.assertEqual('old', self.session.access_token)
+
+    def test_update_token_expired(self):
+        self.session.access_token = 'old'
+        self.session.expires_at = time.time() - 1
+        self.session._get_token = Mock(return_value='new')
+
+        self.assertEqual('new', self.session.update_token())
+
+    def test_username_records_expiry(self):
+        session = UsernameSession('id', 'u', 'p', 'c', 's', requests=Mock())
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json = Mock(return_value={'access_token': 'token', 'expires_in': 3600})
+        session.requests.post = Mock(return_value=mock_response)
+
+        self.assertEqual('token', session._get_token())
+        self.assertAlmostEqual(time.time() + 3600, session.expires_at, delta=5)
+
+    def test_oauth2_refresh_ahead_uses_refresh_token(self):
+        session = Oauth2Session('id', 'c', 's', refresh_token='ref', access_token='old', requests=Mock())
+        session._do_post = Mock(return_value='new')
+
+        self.assertEqual('new', session._request_token())
+        self.assertEqual('refresh_token', session._do_post.call_args[0][0]['grant_type'])
+
+class TestJirafeSessionTimeouts(unittest.TestCase):
+    def setUp(self):
+        self.mock_requests = Mock()
+        self.session = UsernameSession('id', 'user', 'pass', 'client', 'secret',
+                                       requests=self.mock_requests, timeout=(2, 10))
+
+    def test_get_timeout(self):
+        self.assertEqual((2, 10), self.session.get_timeout())
+        self.session.set_deadline(time.time() + 1)
+        connect, read = self.session.get_timeout()
+        self.assertTrue(connect <= 1 and read <= 1)
+        self.session.set_deadline(time.time() - 1)
+        self.assertRaises(requests.exceptions.Timeout, self.session.get_timeout)
+
+    def test_token_fetch_timeout(self):
+        self.mock_requests.post = Mock(side_effect=requests.exceptions.ConnectTimeout('slow'))
+        self.assertRaises(requests.exceptions.Timeout, self.session.update_token)
+        self.assertEqual((2, 10), self.mock_requests.post.call_args[1]['timeout'])
+
+    def test_deadline_per_thread(self):
+        self.session.set_deadline(time.time() - 1)
+        timeouts = []
+        thread = threading.Thread(target=lambda: timeouts.append(self.session.get_timeout()))
+        thread.start()
+        thread.join()
+        self.assertEqual([(2, 10)], timeouts)
+
+
+class TestJirafeSessionTokenStore(unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryTokenStore()
+
+    def make_session(self, token='fetched', **kwargs):
+        session = Oauth2Session('id', 'client', 'secret', token_store=self.store, requests=Mock(), **kwargs)
+        session._do_post = Mock(return_value=token)
+        return session
+
+    def test_get_store_key(self):
+        self.assertEqual('id:client', self.make_session().get_store_key())
+        self.assertEqual('id:None', JirafeSession('id').get_store_key())
+
+    def test_fetches_and_stores(self):
+        session = self.make_session(refresh_token='ref')
+
+        self.assertEqual('fetched', session.update_token())
+        self.assertEqual('fetched', self.store.get('id:client')['access_token'])
+        self.assertEqual('ref', self.store.get('id:client')['refresh_token'])
+
+    def test_shares_stored_token(self):
+        self.store.set('id:client', {'access_token': 'shared', 'refresh_token': 'rotated', 'expires_at': time.time() + 3600})
+        session = self.make_session(refresh_token='ref')
+
+        self.assertEqual('shared', session.update_token())
+        self.assertEqual('rotated', session.refresh_token)
+        self.assertFalse(session._do_post.called)
+
+    def test_ignores_expiring_stored_token(self):
+        self.store.set('id:client', {'access_token': 'old', 'refresh_token': 'rotated', 'expires_at': time.time() + 10})
+        session = self.make_session(refresh_token='ref')
+
+        self.assertEqual('fetched', session.update_token())
+        self.assertEqual('rotated', session._do_post.call_args[0][0]['refresh_token'])
+
+    def test_invalidate_removes_stored_token(self):
+        self.store.set('id:client', {'access_token': 'shared', 'refresh_token': None, 'expires_at': None})
+        session = self.make_session(refresh_token='ref')
+        session.update_token()
+
+        session.invalidate('shared')
+
+        self.assertIsNone(self.store.get('id:client'))
+        self.assertEqual('fetched', session.update_token())
+
+class TestJirafeSessionProfileCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ProfileCache(ttl=60)
+        self.profile = {'sites': [{'id': 1}, {'id': 'id'}]}
+        self.mock_requests = Mock()
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json = Mock(return_value=self.profile)
+        self.mock_requests.get = Mock(return_value=mock_response)
+        self.session = self.make_session()
+
+    def make_session(self, site_id='id'):
+        session = UsernameSession(site_id, 'u', 'p', 'c', 's', requests=self.mock_requests, profile_cache=self.cache)
+        session.access_token = 'token'
+        return session
+
+    def test_get_profile_url(self):
+        self.assertEqual('https://accounts.jirafe.com/accounts/profile/site/id/', self.session.get_profile_url())
+        self.assertEqual('https://accounts.jirafe.com/accounts/profile', JirafeSession(None).get_profile_url())
+
+    def test_get_profile_cached(self):
+        self.assertEqual(self.profile, self.session.get_profile())
+        self.assertEqual(self.profile, self.session.get_profile())
+        self.mock_requests.get.assert_called_once()
+
+    def test_cache_shared_between_sessions(self):
+        self.session.get_profile()
+        self.assertEqual(self.profile, self.make_session().get_profile())
+        self.mock_requests.get.assert_called_once()
+
+    def test_cache_shared_between_sites_of_account(self):
+        self.assertEqual({'id': 'id'}, self.session.get_site())
+        self.assertEqual({'id': 1}, self.make_session(1).get_site())
+        self.mock_requests.get.assert_called_once()
+        self.assertEqual('https://accounts.jirafe.com/accounts/profile', self.mock_requests.get.call_args[0][0])
+
+    def test_cache_not_shared_between_accounts(self):
+        self.session.get_profile()
+        UsernameSession('id', 'other', 'p', 'c', 's', requests=self.mock_requests, profile_cache=self.cache).get_profile()
+        Oauth2Session(1, 'c', 's', access_token='t', requests=self.mock_requests, profile_cache=self.cache).get_profile()
+        Oauth2Session(2, 'c', 's', access_token='t', requests=self.mock_requests, profile_cache=self.cache).get_profile()
+        self.assertEqual(4, self.mock_requests.get.call_count)
+        self.assertEqual('https://accounts.jirafe.com/accounts/profile/site/2/', self.mock_requests.get.call_args[0][0])
+
+    def test_invalidate_profile(self):
+        self.session.get_profile()
+        self.session.invalidate_profile()
+        self.session.get_profile()
+        self.assertEqual(2, self.mock_requests.get.call_count)
+
+    def test_get_site_uses_index(self):
+        self.assertEqual({'id': 'id'}, self.session.get_site())
+        index = self.cache.get_site_index(self.session.get_profile_key(), self.profile)
+        self.assertIs(index, self.cache.get_site_index(self.session.get_profile_key(), self.profile))
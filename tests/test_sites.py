@@ -0,0 +1,157 @@
+from mock import Mock, patch
+import threading
+import unittest
+from jirafe import SessionPool, FairDispatcher, Priorities
+
+class TestSessionPool(unittest.TestCase):
+    def setUp(self):
+        self.factory = Mock(side_effect=lambda site_id: Mock(site_id=site_id))
+
+    def test_creates_lazily_and_caches(self):
+        pool = SessionPool(self.factory)
+        self.assertEqual(0, len(pool))
+
+        session = pool.get(1)
+
+        self.assertEqual('1', session.site_id)
+        self.assertIs(session, pool.get('1'))
+        self.factory.assert_called_once_with('1')
+        self.assertTrue(1 in pool)
+
+    def test_evicts_least_recently_used(self):
+        pool = SessionPool(self.factory, max_sessions=2)
+        pool.get('a')
+        pool.get('b')
+        pool.get('a')
+        pool.get('c')
+
+        self.assertTrue('a' in pool)
+        self.assertFalse('b' in pool)
+        self.assertEqual(2, len(pool))
+
+    @patch('jirafe.sites.time')
+    def test_evicts_idle(self, time):
+        pool = SessionPool(self.factory, idle_timeout=60)
+        time.time.return_value = 1000
+        pool.get('a')
+        time.time.return_value = 1030
+        pool.get('b')
+        time.time.return_value = 1070
+
+        pool.get('b')
+
+        self.assertFalse('a' in pool)
+        self.assertTrue('b' in pool)
+
+    def test_evict(self):
+        pool = SessionPool(self.factory)
+        first = pool.get('a')
+        pool.evict('a')
+        self.assertIsNot(first, pool.get('a'))
+        pool.evict()
+        self.assertEqual(0, len(pool))
+
+
+class TestFairDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.sessions = SessionPool(lambda site_id: Mock(site_id=site_id))
+        self.client = Mock()
+        self.release = threading.Event()
+        self.sent = []
+        self.active = {}
+        self.peak = {}
+        self.lock = threading.Lock()
+
+        def put(session, path, data):
+            with self.lock:
+                self.sent.append((session.site_id, data))
+                self.active[session.site_id] = self.active.get(session.site_id, 0) + 1
+                self.peak[session.site_id] = max(self.peak.get(session.site_id, 0), self.active[session.site_id])
+            self.release.wait(5)
+            with self.lock:
+                self.active[session.site_id] -= 1
+            return {'success': True}
+        self.client._put = Mock(side_effect=put)
+
+    def hold(self, dispatcher):
+        dispatcher.submit('gate', 'order', None)
+        while not self.sent:
+            self.release.wait(0.001)
+
+    def test_round_robin_across_sites(self):
+        dispatcher = FairDispatcher(self.client, self.sessions, workers=1)
+        self.hold(dispatcher)
+        for i in range(6):
+            dispatcher.submit('big', 'product', i)
+        dispatcher.submit('small', 'order', 'a')
+        dispatcher.submit('small', 'order', 'b')
+        self.release.set()
+
+        self.assertTrue(dispatcher.close(5))
+        self.assertEqual(['gate', 'big', 'small', 'big', 'small', 'big', 'big', 'big', 'big'],
+                         [site_id for site_id, _ in self.sent])
+        self.assertEqual([0, 1, 2, 3, 4, 5], [data for site_id, data in self.sent if site_id == 'big'])
+
+    def test_weights(self):
+        dispatcher = FairDispatcher(self.client, self.sessions, workers=1, weights={'a': 2})
+        self.hold(dispatcher)
+        for i in range(4):
+            dispatcher.submit('a', 'order', i)
+            dispatcher.submit('b', 'order', i)
+        self.release.set()
+
+        dispatcher.close(5)
+        self.assertEqual(['gate', 'a', 'a', 'b', 'a', 'a', 'b', 'b', 'b'], [site_id for site_id, _ in self.sent])
+
+    def test_priorities_across_sites(self):
+        dispatcher = FairDispatcher(self.client, self.sessions, workers=1, priorities=Priorities())
+        self.hold(dispatcher)
+        dispatcher.submit('big', 'product', 'p1')
+        dispatcher.submit('big', 'product', 'p2')
+        dispatcher.submit('big', 'order', 'o1')
+        dispatcher.submit('small', 'category', 'c1')
+        dispatcher.submit('small', 'order', 'o2')
+        dispatcher.submit('other', 'cart', 'k1')
+        self.release.set()
+
+        dispatcher.close(5)
+        self.assertEqual([None, 'o1', 'o2', 'k1', 'p1', 'c1', 'p2'], [data for _, data in self.sent])
+
+    def test_per_site_cap(self):
+        dispatcher = FairDispatcher(self.client, self.sessions, workers=4, max_per_site=1)
+        for i in range(5):
+            dispatcher.submit('big', 'product', i)
+        dispatcher.submit('small', 'order', 'a')
+
+        self.assertFalse(dispatcher.flush(0.2))
+        self.assertEqual(['big', 'small'], sorted(site_id for site_id, _ in self.sent))
+        self.release.set()
+        self.assertTrue(dispatcher.close(5))
+        self.assertEqual(1, self.peak['big'])
+        self.assertEqual(0, dispatcher.pending())
+
+    def test_batches_and_callbacks(self):
+        self.client._put_batch = Mock(side_effect=lambda session, path, items: [{'success': i != 3} for i in items])
+        callback = Mock()
+        dispatcher = FairDispatcher(self.client, self.sessions, workers=1, batch_size=10, callback=callback)
+        self.client._put.side_effect = lambda session, path, data: self.release.wait(5) and {'success': True}
+        dispatcher.submit('a', 'order', 1)
+        dispatcher.submit('a', 'order', 2)
+        dispatcher.submit('a', 'order', 3)
+        self.release.set()
+
+        dispatcher.close(5)
+        self.assertTrue(self.client._put_batch.called)
+        self.assertEqual([2, 3], self.client._put_batch.call_args[0][2][-2:])
+        callback.assert_any_call('a', 'order', 3, {'success': False})
+        self.assertEqual(3, callback.call_count)
+
+    def test_exception(self):
+        self.client._put.side_effect = ValueError('boom')
+        callback = Mock()
+        dispatcher = FairDispatcher(self.client, self.sessions, workers=1)
+        dispatcher.submit('a', 'order', 1, callback)
+
+        dispatcher.close(5)
+        self.assertEqual('exception', callback.call_args[0][3]['error_type'])
+        self.assertRaises(RuntimeError, dispatcher.submit, 'a', 'order', 1)
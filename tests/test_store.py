@@ -0,0 +1,112 @@
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from jirafe import MemoryTokenStore, SQLiteTokenStore
+from jirafe.timeouts import LockTimeout
+
+class TestSQLiteTokenStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'tokens.db')
+        self.store = SQLiteTokenStore(self.path)
+        self.record = {'access_token': 'a', 'refresh_token': 'r', 'expires_at': 100.0}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.store.get('key'))
+
+    def test_set_get(self):
+        self.store.set('key', self.record)
+        self.assertEqual(self.record, self.store.get('key'))
+        self.assertEqual(self.record, SQLiteTokenStore(self.path).get('key'))
+
+    def test_delete_only_matching_token(self):
+        self.store.set('key', self.record)
+        self.store.delete('key', 'other')
+        self.assertEqual(self.record, self.store.get('key'))
+        self.store.delete('key', 'a')
+        self.assertIsNone(self.store.get('key'))
+
+    def test_lock_is_exclusive(self):
+        other = SQLiteTokenStore(self.path)
+        events = []
+
+        def locked():
+            with other.lock('key'):
+                events.append('other')
+
+        with self.store.lock('key'):
+            thread = threading.Thread(target=locked)
+            thread.start()
+            time.sleep(0.1)
+            self.store.set('key', self.record)
+            events.append('first')
+        thread.join(5)
+
+        self.assertEqual(['first', 'other'], events)
+        self.assertEqual(self.record, other.get('key'))
+
+    def test_lock_released_on_error(self):
+        try:
+            with self.store.lock('key'):
+                raise ValueError()
+        except ValueError:
+            pass
+        with SQLiteTokenStore(self.path, timeout=0.1).lock('key'):
+            pass
+
+    def test_lock_is_per_key(self):
+        other = SQLiteTokenStore(self.path, timeout=0.1)
+        with self.store.lock('a'):
+            with other.lock('b'):
+                other.set('b', self.record)
+        self.assertEqual(self.record, self.store.get('b'))
+
+    def test_lock_timeout(self):
+        other = SQLiteTokenStore(self.path, timeout=0.1)
+        with self.store.lock('key'):
+            self.assertRaises(LockTimeout, other.lock('key').__enter__)
+
+    def test_expired_lease_is_taken_over(self):
+        SQLiteTokenStore(self.path, lease=0).lock('key').__enter__()
+        with SQLiteTokenStore(self.path, timeout=0.1).lock('key'):
+            pass
+
+    def test_pickle(self):
+        copy = pickle.loads(pickle.dumps(self.store))
+        copy.set('key', self.record)
+        self.assertEqual(self.record, self.store.get('key'))
+
+
+class TestMemoryTokenStore(unittest.TestCase):
+    def test_set_get_delete(self):
+        store = MemoryTokenStore()
+        record = {'access_token': 'a', 'refresh_token': None, 'expires_at': None}
+        with store.lock('key'):
+            store.set('key', record)
+        self.assertEqual(record, store.get('key'))
+        store.delete('key', 'b')
+        self.assertEqual(record, store.get('key'))
+        store.delete('key', 'a')
+        self.assertIsNone(store.get('key'))
+
+    def test_pickle(self):
+        store = MemoryTokenStore()
+        store.set('key', {'access_token': 'a'})
+        copy = pickle.loads(pickle.dumps(store))
+        with copy.lock('key'):
+            self.assertEqual({'access_token': 'a'}, copy.get('key'))
+
+    def test_lock_is_per_key(self):
+        store = MemoryTokenStore()
+        with store.lock('a'):
+            thread = threading.Thread(target=lambda: store.lock('b').__enter__())
+            thread.start()
+            thread.join(1)
+            self.assertFalse(thread.is_alive())
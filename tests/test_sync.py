@@ -0,0 +1,94 @@
+from mock import Mock, patch
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from jirafe.sync import BulkSync, Checkpoint, main, read_csv, read_ndjson
+
+class TestReaders(unittest.TestCase):
+    def test_read_ndjson(self):
+        data = b'{"id":1}\n\n{"id":2}\n'
+        records = list(read_ndjson(io.BytesIO(data)))
+        self.assertEqual([({'id': 1}, 9), ({'id': 2}, 19)], records)
+
+    def test_read_ndjson_resume(self):
+        data = b'{"id":1}\n{"id":2}\n'
+        self.assertEqual([({'id': 2}, 18)], list(read_ndjson(io.BytesIO(data), 9)))
+
+    def test_read_csv(self):
+        data = b'id,name,catalog.id\n1,"multi\nline",main\n2,,\n'
+        records = list(read_csv(io.BytesIO(data)))
+        self.assertEqual({'id': '1', 'name': 'multi\nline', 'catalog': {'id': 'main'}}, records[0][0])
+        self.assertEqual({'id': '2'}, records[1][0])
+        self.assertEqual(len(data), records[1][1])
+
+    def test_read_csv_resume(self):
+        data = b'id,name\n1,a\n2,b\n'
+        first = list(read_csv(io.BytesIO(data)))[0]
+        self.assertEqual([({'id': '2', 'name': 'b'}, len(data))], list(read_csv(io.BytesIO(data), first[1])))
+
+    def test_read_csv_empty(self):
+        self.assertEqual([], list(read_csv(io.BytesIO(b''))))
+
+
+class TestBulkSync(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.client = Mock()
+        self.client.product_change = Mock(return_value={'success': True})
+        self.session = Mock()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_checkpoint(self):
+        checkpoint = Checkpoint(os.path.join(self.dir, 'checkpoint'))
+        self.assertEqual(0, checkpoint.load())
+        checkpoint.save(42)
+        self.assertEqual(42, checkpoint.load())
+
+    def test_run(self):
+        checkpoint = Checkpoint(os.path.join(self.dir, 'checkpoint'))
+        progress = io.StringIO()
+        records = [({'id': i}, (i + 1) * 10) for i in range(50)]
+        sync = BulkSync(self.client, self.session, 'product', concurrency=4,
+                        checkpoint=checkpoint, checkpoint_every=10, progress=progress)
+
+        self.assertTrue(sync.run(iter(records)))
+
+        self.assertEqual(50, self.client.product_change.call_count)
+        self.assertEqual(50, sync.sent)
+        self.assertEqual(500, checkpoint.load())
+        self.assertIn('sent=50 failed=0 offset=500', progress.getvalue())
+
+    def test_run_failures(self):
+        self.client.product_change = Mock(side_effect=[{'success': False, 'error_type': 'validation', 'errors': {}},
+                                                       ValueError('boom')])
+        errors = io.StringIO()
+        sync = BulkSync(self.client, self.session, 'product', concurrency=1, errors=errors)
+
+        self.assertFalse(sync.run(iter([({'id': 1}, 10), ({'id': 2}, 20)])))
+
+        self.assertEqual(2, sync.failed)
+        lines = [json.loads(line) for line in errors.getvalue().splitlines()]
+        self.assertEqual([10, 20], [line['offset'] for line in lines])
+        self.assertEqual('exception', lines[1]['result']['error_type'])
+
+    @patch('jirafe.sync.JirafeClient')
+    def test_main_resumes(self, client_class):
+        client_class.return_value.order_change = Mock(return_value={'success': True})
+        path = os.path.join(self.dir, 'orders.ndjson')
+        checkpoint = os.path.join(self.dir, 'checkpoint')
+        with open(path, 'wb') as f:
+            f.write(b'{"id":1}\n{"id":2}\n')
+        Checkpoint(checkpoint).save(9)
+
+        code = main(['order', path, '--site-id', 's', '--client-id', 'c', '--client-secret', 'x',
+                     '--access-token', 't', '--checkpoint', checkpoint])
+
+        self.assertEqual(0, code)
+        sent = client_class.return_value.order_change.call_args_list
+        self.assertEqual([{'id': 2}], [c[0][1] for c in sent])
+        self.assertEqual(18, Checkpoint(checkpoint).load())
@@ -0,0 +1,201 @@
+from mock import Mock, patch
+import os
+import requests
+import shutil
+import tempfile
+import time
+import unittest
+from jirafe import (AdaptiveConcurrency, CircuitBreaker, Coalescer, JirafeClient, RateLimiter, RetryPolicy,
+                    SQLiteTokenStore, UsernameSession)
+from jirafe.timeouts import DeadlineExceeded, remaining_timeout
+
+@patch('jirafe.timeouts.time')
+class TestRemainingTimeout(unittest.TestCase):
+    def test_no_deadline(self, time):
+        self.assertEqual((5, 30), remaining_timeout((5, 30), None))
+        self.assertIsNone(remaining_timeout(None, None))
+
+    def test_clamps_to_deadline(self, time):
+        time.time.return_value = 100
+        self.assertEqual((5, 10), remaining_timeout((5, 30), 110))
+        self.assertEqual((2, 2), remaining_timeout((5, None), 102))
+        self.assertEqual(3, remaining_timeout(30, 103))
+        self.assertEqual(4, remaining_timeout(None, 104))
+
+    def test_deadline_passed(self, time):
+        time.time.return_value = 100
+        self.assertRaises(DeadlineExceeded, remaining_timeout, (5, 30), 100)
+
+
+class TestJirafeClientTimeouts(unittest.TestCase):
+    def setUp(self):
+        self.requests = Mock()
+        self.session = Mock()
+        self.session.site_id = 'id'
+        self.client = JirafeClient(requests=self.requests, timeout=(1, 2))
+
+    def test_passes_timeout(self):
+        self.requests.put.return_value = Mock(status_code=200)
+
+        self.client.order_change(self.session, '{}')
+
+        self.assertEqual((1, 2), self.requests.put.call_args[1]['timeout'])
+
+    def test_timeout_result(self):
+        self.requests.put.side_effect = requests.exceptions.ReadTimeout('read timed out')
+
+        result = self.client.order_change(self.session, '{}')
+
+        self.assertEqual({'success': False, 'error_type': 'timeout', 'message': 'read timed out'}, result)
+
+    @patch('jirafe.client.time.sleep')
+    def test_timeout_retried(self, sleep):
+        self.client.retry_policy = RetryPolicy(max_retries=2, jitter=False)
+        self.requests.put.side_effect = [requests.exceptions.ConnectTimeout('slow'), Mock(status_code=200)]
+
+        self.assertEqual({'success': True}, self.client.order_change(self.session, '{}'))
+
+    def test_deadline_clamps_timeout(self):
+        self.client.deadline = 0.5
+        self.requests.put.return_value = Mock(status_code=200)
+
+        self.client.order_change(self.session, '{}')
+
+        connect, read = self.requests.put.call_args[1]['timeout']
+        self.assertTrue(0 < connect <= 0.5)
+        self.assertTrue(0 < read <= 0.5)
+        self.session.set_deadline.assert_called_with(None)
+
+    def test_deadline_covers_authorization_retry(self):
+        self.client.deadline = 0.05
+
+        def put(url, **options):
+            time.sleep(0.06)
+            return Mock(status_code=403)
+        self.requests.put.side_effect = put
+
+        result = self.client.order_change(self.session, '{}')
+
+        self.assertEqual('timeout', result['error_type'])
+        self.requests.put.assert_called_once()
+        self.session.invalidate.assert_called_once()
+
+    def test_deadline_stops_backoff(self):
+        self.client.deadline = 1
+        self.client.retry_policy = RetryPolicy(max_retries=3, backoff=5, jitter=False)
+        self.requests.put.return_value = Mock(status_code=503, headers={}, text='down')
+
+        started = time.time()
+        result = self.client.order_change(self.session, '{}')
+
+        self.assertEqual('unknown', result['error_type'])
+        self.assertTrue(time.time() - started < 1)
+        self.requests.put.assert_called_once()
+
+    def test_deadline_covers_token_fetch(self):
+        self.client.deadline = 0.5
+        session = UsernameSession('id', 'user', 'pass', 'client', 'secret', requests=self.requests, timeout=(5, 30))
+        self.requests.post.side_effect = requests.exceptions.ReadTimeout('token timed out')
+
+        result = self.client.order_change(session, '{}')
+
+        self.assertEqual({'success': False, 'error_type': 'timeout', 'message': 'token timed out'}, result)
+        self.assertTrue(self.requests.post.call_args[1]['timeout'][1] <= 0.5)
+        self.assertFalse(self.requests.put.called)
+        self.assertIsNone(session._local.deadline)
+
+    def test_deadline_while_waiting_for_token(self):
+        self.client.deadline = 0.05
+        session = UsernameSession('id', 'user', 'pass', 'client', 'secret', requests=self.requests)
+        session._token_lock.acquire()
+        try:
+            result = self.client.order_change(session, '{}')
+        finally:
+            session._token_lock.release()
+
+        self.assertEqual('timeout', result['error_type'])
+        self.assertFalse(self.requests.post.called)
+
+    def test_deadline_while_waiting_for_token_not_a_breaker_failure(self):
+        self.client.deadline = 0.05
+        self.client.circuit_breaker = CircuitBreaker(failure_threshold=1)
+        session = UsernameSession('id', 'user', 'pass', 'client', 'secret', requests=self.requests)
+        session._token_lock.acquire()
+        try:
+            result = self.client.order_change(session, '{}')
+        finally:
+            session._token_lock.release()
+
+        self.assertEqual('timeout', result['error_type'])
+        self.assertEqual('closed', self.client.circuit_breaker.get_state('id'))
+
+    def test_deadline_bounds_rate_limiter(self):
+        self.client.deadline = 0.2
+        self.client.rate_limiter = RateLimiter(rate=1)
+        self.requests.put.return_value = Mock(status_code=200)
+
+        self.client.order_change(self.session, '{}')
+        started = time.time()
+        result = self.client.order_change(self.session, '{}')
+
+        self.assertEqual('timeout', result['error_type'])
+        self.assertTrue(time.time() - started < 0.2)
+        self.requests.put.assert_called_once()
+
+    def test_deadline_bounds_concurrency(self):
+        self.client.deadline = 0.1
+        self.client.concurrency = AdaptiveConcurrency(initial=1)
+        self.client.concurrency.acquire('id')
+
+        result = self.client.order_change(self.session, '{}')
+
+        self.assertEqual('timeout', result['error_type'])
+        self.assertFalse(self.requests.put.called)
+
+    def test_timeout_taken_after_waits(self):
+        self.client.deadline = 0.5
+        self.client.rate_limiter = Mock()
+        self.client.rate_limiter.acquire.side_effect = lambda *args: time.sleep(0.3) or True
+        self.requests.put.return_value = Mock(status_code=200)
+
+        self.client.order_change(self.session, '{}')
+
+        self.assertTrue(self.requests.put.call_args[1]['timeout'][1] <= 0.2)
+
+    def test_deadline_covers_coalescing_window(self):
+        self.client.deadline = 0.5
+        self.client.coalescer = Coalescer(window=0.3)
+        self.requests.put.return_value = Mock(status_code=200)
+
+        self.client.order_change(self.session, {'id': 1})
+
+        self.assertTrue(self.requests.put.call_args[1]['timeout'][1] <= 0.2)
+
+    def test_deadline_covers_all_batch_chunks(self):
+        self.client.deadline = 0.5
+        self.client.batch_size = 1
+        response = Mock(status_code=200)
+        response.json.return_value = {'order': [{'success': True}]}
+        self.requests.put.side_effect = lambda *args, **kwargs: time.sleep(0.3) or response
+
+        results = self.client.order_changes(self.session, [{'id': 1}, {'id': 2}, {'id': 3}])
+
+        self.assertEqual([True, True, False], [result['success'] for result in results])
+        self.assertEqual('timeout', results[2]['error_type'])
+        self.assertEqual(2, self.requests.put.call_count)
+        self.assertTrue(self.requests.put.call_args[1]['timeout'][1] <= 0.2)
+
+    def test_token_store_lock_timeout(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'tokens.db')
+        self.client.circuit_breaker = CircuitBreaker(failure_threshold=1)
+        session = UsernameSession('id', 'user', 'pass', 'client', 'secret', requests=self.requests,
+                                  token_store=SQLiteTokenStore(path, timeout=0.1))
+
+        with SQLiteTokenStore(path).lock('id:client'):
+            result = self.client.order_change(session, '{}')
+
+        self.assertEqual('timeout', result['error_type'])
+        self.assertFalse(self.requests.post.called)
+        self.assertEqual('closed', self.client.circuit_breaker.get_state('id'))
@@ -0,0 +1,140 @@
+from mock import AsyncMock, MagicMock, Mock
+import unittest
+from jirafe import (AsyncJirafeClient, JirafeClient, RetryPolicy, SpanContext, Tracer,
+                    UsernameSession)
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.spans = []
+        self.tracer = Tracer(self.spans.append)
+
+    def test_span(self):
+        with self.tracer.start_span('outer', a=1) as outer:
+            with outer.timing('work'):
+                pass
+            outer.increment('count')
+            outer.increment('count')
+            with self.tracer.start_span('inner') as inner:
+                self.assertIs(inner, self.tracer.current())
+            self.assertIs(outer, self.tracer.current())
+        self.assertIsNone(self.tracer.current())
+
+        self.assertEqual([inner, outer], self.spans)
+        self.assertEqual(outer.context.trace_id, inner.context.trace_id)
+        self.assertEqual(outer.context.span_id, inner.parent_id)
+        self.assertIsNone(outer.parent_id)
+        self.assertEqual({'a': 1, 'count': 2}, outer.attributes)
+        self.assertEqual({'work', 'total'}, set(outer.timings))
+        self.assertTrue(outer.duration >= outer.timings['work'])
+        self.assertEqual('outer', outer.to_dict()['name'])
+
+    def test_exception(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.start_span('s'):
+                raise ValueError('boom')
+        self.assertEqual('exception', self.spans[0].attributes['error_type'])
+        self.assertEqual("ValueError('boom')", self.spans[0].attributes['error'])
+
+    def test_inject_and_extract(self):
+        self.assertEqual({'a': 'b'}, self.tracer.inject({'a': 'b'}))
+        header = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+        parent = self.tracer.extract({'traceparent': header})
+        self.assertEqual(header, parent.to_header())
+
+        with self.tracer.activate(parent):
+            with self.tracer.start_span('s') as span:
+                headers = self.tracer.inject({'a': 'b'})
+
+        self.assertEqual('b7ad6b7169203331', span.parent_id)
+        context = SpanContext.from_header(headers['traceparent'])
+        self.assertEqual('0af7651916cd43dd8448eb211c80319c', context.trace_id)
+        self.assertEqual(span.context.span_id, context.span_id)
+        self.assertIsNone(self.tracer.extract({'traceparent': 'garbage'}))
+        self.assertIsNone(self.tracer.extract({}))
+
+    def test_no_propagation(self):
+        tracer = Tracer(propagate=False)
+        with tracer.start_span('s'):
+            self.assertEqual({}, tracer.inject({}))
+
+
+class TestJirafeClientTracing(unittest.TestCase):
+    def setUp(self):
+        self.spans = []
+        self.transport = Mock()
+        self.transport.put.return_value.status_code = 200
+        self.transport.post.return_value.status_code = 200
+        self.transport.post.return_value.json.return_value = {'access_token': 'token'}
+        tracer = Tracer(self.spans.append)
+        self.client = JirafeClient(transport=self.transport, tracer=tracer)
+        self.session = UsernameSession('id', 'u', 'p', 'c', 's', transport=self.transport, tracer=tracer)
+
+    def test_request_span(self):
+        self.client.order_change(self.session, {'id': 1})
+
+        token, request = self.spans
+        self.assertEqual('jirafe.token.fetch', token.name)
+        self.assertEqual(request.context.span_id, token.parent_id)
+        self.assertEqual({'site_id': 'id', 'success': True}, token.attributes)
+        self.assertEqual('jirafe.request', request.name)
+        self.assertEqual({'site_id': 'id', 'path': 'order', 'method': 'put', 'retries': 0,
+                          'payload_size': 8, 'status': 200, 'error_type': None}, request.attributes)
+        self.assertEqual({'serialization', 'token', 'network', 'total'}, set(request.timings))
+
+        headers = self.transport.put.call_args[1]['headers']
+        self.assertEqual('Bearer token', headers['Authorization'])
+        self.assertEqual(request.context.to_header(), headers['traceparent'])
+        self.assertEqual(token.context.to_header(), self.transport.post.call_args[1]['headers']['traceparent'])
+
+    def test_retries(self):
+        self.session.access_token = 'token'
+        self.client.retry_policy = RetryPolicy(max_retries=2, backoff=0)
+        self.transport.put.return_value.status_code = 503
+        self.transport.put.return_value.headers = {}
+
+        self.client.cart_change(self.session, {})
+
+        self.assertEqual(1, len(self.spans))
+        self.assertEqual(2, self.spans[0].attributes['retries'])
+        self.assertEqual(503, self.spans[0].attributes['status'])
+        self.assertEqual('unknown', self.spans[0].attributes['error_type'])
+
+    def test_profile_span(self):
+        self.session.access_token = 'token'
+        self.transport.get.return_value.status_code = 200
+        self.transport.get.return_value.json.return_value = {'sites': []}
+
+        self.session.get_profile()
+
+        self.assertEqual('jirafe.profile.fetch', self.spans[0].name)
+        self.assertEqual(200, self.spans[0].attributes['status'])
+        self.assertIn('traceparent', self.transport.get.call_args[1]['headers'])
+
+    def test_disabled(self):
+        self.client.tracer = self.session.tracer = None
+        self.session.access_token = 'token'
+
+        self.client.order_change(self.session, '{}')
+
+        self.transport.put.assert_called_once_with('https://api.jirafe.com/v1/id/order', data='{}',
+                                                   headers={'Authorization': 'Bearer token'}, timeout=(5, 30))
+
+
+class TestAsyncJirafeClientTracing(unittest.IsolatedAsyncioTestCase):
+    async def test_request_span(self):
+        spans = []
+        response = MagicMock()
+        response.status = 200
+        response.text = AsyncMock(return_value='')
+        http = MagicMock()
+        http.put.return_value.__aenter__.return_value = response
+        client = AsyncJirafeClient(http_session=http, tracer=Tracer(spans.append))
+        session = Mock(site_id='id')
+        session.format_header.return_value = {'Authorization': 'Bearer token'}
+
+        await client.order_change(session, {'id': 1})
+
+        self.assertEqual(1, len(spans))
+        self.assertEqual(200, spans[0].attributes['status'])
+        self.assertEqual({'serialization', 'token', 'network', 'total'}, set(spans[0].timings))
+        self.assertEqual(spans[0].context.to_header(), http.put.call_args[1]['headers']['traceparent'])
@@ -0,0 +1,183 @@
+from mock import Mock
+import json
+import requests
+import socket
+import threading
+import time
+import unittest
+from jirafe import JirafeClient, RequestsTransport, HTTP2Transport, UsernameSession
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import httpx
+except ImportError:
+    h2 = None
+
+class TestRequestsTransport(unittest.TestCase):
+    def test_delegates(self):
+        r = Mock()
+        transport = RequestsTransport(r)
+
+        transport.put('url', data='{}', headers={}, timeout=(1, 2))
+        transport.get('url', params='{}')
+        transport.post('url', data={'a': 1})
+        transport.close()
+
+        r.put.assert_called_once_with('url', data='{}', headers={}, timeout=(1, 2))
+        r.get.assert_called_once_with('url', params='{}')
+        r.post.assert_called_once_with('url', data={'a': 1})
+        r.close.assert_called_once_with()
+
+    def test_close_without_close(self):
+        RequestsTransport(requests).close()
+
+    def test_client_and_session_use_transport(self):
+        transport = Mock()
+        transport.post.return_value = Mock(status_code=200, json=Mock(return_value={'access_token': 't'}))
+        transport.put.return_value = Mock(status_code=200)
+        client = JirafeClient(transport=transport)
+        session = UsernameSession('id', 'u', 'p', 'c', 's', transport=transport)
+
+        self.assertEqual({'success': True}, client.order_change(session, '{}'))
+        transport.put.assert_called_once_with('https://api.jirafe.com/v1/id/order', data='{}',
+                                              headers={'Authorization': 'Bearer t'}, timeout=(5, 30))
+        client.close()
+        transport.close.assert_called_once_with()
+
+
+# Plain-text HTTP/2 (prior knowledge) server that answers every request with
+# JSON after `delay` seconds, counting connections and concurrent streams.
+class H2StandIn(object):
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.connections = 0
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self._sock = socket.socket()
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(16)
+        self.url = 'http://127.0.0.1:%d/' % self._sock.getsockname()[1]
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self._sock.close()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._sock.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connections += 1
+            thread = threading.Thread(target=self._serve, args=(sock,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, sock):
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        lock = threading.Lock()
+        streams = {}
+        conn.initiate_connection()
+        sock.sendall(conn.data_to_send())
+        while True:
+            try:
+                data = sock.recv(65535)
+            except OSError:
+                return
+            if not data:
+                return
+            with lock:
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        streams[event.stream_id] = [dict(event.headers), b'']
+                        with self._lock:
+                            self.active += 1
+                            self.max_active = max(self.max_active, self.active)
+                    elif isinstance(event, h2.events.DataReceived):
+                        streams[event.stream_id][1] += event.data
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        headers, body = streams.pop(event.stream_id)
+                        self.requests.append((headers[':method'], headers[':path'], body))
+                        thread = threading.Thread(target=self._respond,
+                                                  args=(sock, conn, lock, event.stream_id, headers[':path']))
+                        thread.daemon = True
+                        thread.start()
+                sock.sendall(conn.data_to_send())
+
+    def _respond(self, sock, conn, lock, stream_id, path):
+        time.sleep(self.delay)
+        if path.endswith('access_token'):
+            body = json.dumps({'access_token': 'token', 'expires_in': 3600}).encode('utf-8')
+        else:
+            body = b'{}'
+        with self._lock:
+            self.active -= 1
+        with lock:
+            try:
+                conn.send_headers(stream_id, [(':status', '200'), ('content-type', 'application/json'),
+                                              ('content-length', str(len(body)))])
+                conn.send_data(stream_id, body, end_stream=True)
+                sock.sendall(conn.data_to_send())
+            except Exception:
+                pass
+
+
+@unittest.skipIf(h2 is None, 'h2 and httpx are required')
+class TestHTTP2Transport(unittest.TestCase):
+    def setUp(self):
+        self.server = H2StandIn(delay=0.05)
+        self.transport = HTTP2Transport(http1=False)
+        self.client = JirafeClient(self.server.url, transport=self.transport)
+        self.session = UsernameSession('id', 'u', 'p', 'c', 's', transport=self.transport,
+                                       token_url=self.server.url + 'oauth2/access_token')
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.close()
+
+    def test_multiplexes_over_one_connection(self):
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append(self.client.order_change(self.session, {'id': i})))
+                   for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([{'success': True}] * 20, results)
+        self.assertEqual(1, self.server.connections)
+        self.assertTrue(self.server.max_active > 1)
+        puts = [request for request in self.server.requests if request[0] == 'PUT']
+        self.assertEqual(20, len(puts))
+        self.assertEqual('/v1/id/order', puts[0][1])
+        self.assertEqual(set(range(20)), set(json.loads(body)['id'] for _, _, body in puts))
+
+    def test_response_shape(self):
+        response = self.transport.get(self.server.url + 'v1/id/site_check', params='{}', timeout=(1, 1))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({}, response.json())
+        self.assertEqual('HTTP/2', response.http_version)
+
+    def test_timeout(self):
+        self.server.delay = 1
+        self.client.timeout = (1, 0.1)
+        self.session.access_token = 'token'
+
+        result = self.client.order_change(self.session, '{}')
+
+        self.assertEqual('timeout', result['error_type'])
+
+    def test_connection_error(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:%d/' % sock.getsockname()[1]
+        sock.close()
+        self.assertRaises(requests.exceptions.ConnectionError, self.transport.put, url, data='{}')
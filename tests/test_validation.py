@@ -0,0 +1,95 @@
+import unittest
+from benchmarks.payloads import make_order, make_product
+from jirafe import Validator, Validators
+from jirafe.validation import REQUIRED, optional
+
+DATE = '2013-06-17T22:08:30.000Z'
+
+class TestValidator(unittest.TestCase):
+    def setUp(self):
+        self.validator = Validator({
+            'id': 'id',
+            'name': 'string?',
+            'total': 'number',
+            'count': 'integer?',
+            'active': 'boolean?',
+            'create_date': 'date',
+            'status': ('placed', 'cancelled'),
+            'catalog': optional({'id': 'id'}),
+            'items': [{'quantity': 'number', 'product': {'id': 'id'}}],
+            'extra': 'any?',
+        })
+        self.data = {
+            'id': 1,
+            'total': 10.5,
+            'create_date': DATE,
+            'status': 'placed',
+            'items': [{'quantity': 1, 'product': {'id': 'p1'}}],
+        }
+
+    def test_valid(self):
+        self.assertEqual({}, self.validator.validate(self.data))
+
+    def test_missing_fields(self):
+        self.assertEqual({
+            'id': REQUIRED,
+            'total': REQUIRED,
+            'create_date': REQUIRED,
+            'status': REQUIRED,
+            'items': REQUIRED,
+        }, self.validator.validate({}))
+
+    def test_types(self):
+        self.data.update({
+            'id': '',
+            'name': 5,
+            'total': True,
+            'count': 1.5,
+            'active': 'yes',
+            'create_date': '17/06/2013',
+            'status': {'x': 1},
+            'catalog': 'main',
+        })
+        errors = self.validator.validate(self.data)
+        self.assertEqual(['active', 'catalog', 'count', 'create_date', 'id', 'name', 'status', 'total'],
+                         sorted(errors))
+        self.assertEqual('Expected an object.', errors['catalog'])
+
+    def test_nested_keys(self):
+        self.data['items'] = [{'quantity': 1, 'product': {'id': 'p1'}}, {'quantity': 'two', 'product': {}}]
+        self.assertEqual({
+            'items.1.quantity': 'A valid number is required.',
+            'items.1.product.id': REQUIRED,
+        }, self.validator.validate(self.data))
+        self.data['items'] = {}
+        self.assertEqual({'items': 'Expected a list of items.'}, self.validator.validate(self.data))
+
+    def test_not_an_object(self):
+        self.assertEqual({'non_field_errors': 'Expected an object.'}, self.validator.validate([1]))
+        self.assertEqual({}, self.validator.validate('{"already": "encoded"}'))
+
+    def test_unknown_type(self):
+        self.assertRaises(ValueError, Validator, {'id': 'uuid'})
+
+
+class TestValidators(unittest.TestCase):
+    def test_defaults_accept_sample_payloads(self):
+        validators = Validators()
+        self.assertEqual({}, validators.validate('product', make_product(1)))
+        self.assertEqual({}, validators.validate('order', make_order(1, items=3)))
+        self.assertEqual({}, validators.validate('customer', make_order(1)['customer']))
+
+    def test_defaults_cover_entity_types(self):
+        validators = Validators()
+        for path in ('category', 'cart', 'order', 'product', 'customer', 'employee'):
+            self.assertIn('id', validators.validate(path, {}))
+
+    def test_overrides(self):
+        validators = Validators({'product': None, 'refund': {'id': 'id'}})
+        self.assertIsNone(validators.get('product'))
+        self.assertEqual({}, validators.validate('product', {}))
+        self.assertEqual({'id': REQUIRED}, validators.validate('refund', {}))
+        self.assertEqual({}, validators.validate('unknown', {}))
+
+    def test_default_validators_are_shared(self):
+        self.assertIs(Validators().get('order'), Validators().get('order'))